@@ -0,0 +1,30 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    benchmarks/__init__.py
+
+Headless benchmarks of the workbench.
+
+    Run with FreeCADCmd, no GUI is needed:
+
+        FreeCADCmd -c "from freecad.nurbswb.benchmarks import runner;
+            runner.main(['--output', 'bench.json'])"
+
+    or with a python able to import FreeCAD:
+
+        python -m freecad.nurbswb.benchmarks --output bench.json
+
+    The result is a JSON file with the environment and the timings of
+    every case and size, passing --baseline old.json compares the run
+    with a stored one and reports the regressions.
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+from freecad.nurbswb.benchmarks.runner import (  # noqa
+    compare, environment, main, run_benchmarks)
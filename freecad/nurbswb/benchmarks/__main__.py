@@ -0,0 +1,7 @@
+"""Run the benchmarks, see benchmarks/__init__.py."""
+
+import sys
+
+from freecad.nurbswb.benchmarks.runner import main
+
+sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,262 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    benchmarks/cases.py
+
+Benchmark cases.
+
+    A case is a function taking the grid size n and returning the
+    callable to be timed, everything done before returning is setup and
+    is not timed. Every case runs in a new document.
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import numpy as np
+
+# name: (function, sizes)
+CASES = {}
+
+SIZES = (5, 10, 20, 50, 100, 200, 300)
+
+# per point api, bigger sizes take minutes
+SIZES_POINTWISE = (5, 10, 20, 50)
+
+
+def case(name, sizes=SIZES):
+    """Register a benchmark case."""
+
+    def deco(func):
+        CASES[name] = (func, sizes)
+        return func
+
+    return deco
+
+
+def make_nurbs(n):
+    """Create a flat n x n poles Nurbs with a bump, no aux objects."""
+    from freecad.nurbswb.nurbs import create_nurbs_do
+
+    obj = create_nurbs_do(n, n)
+    obj.solid = False
+    obj.base = False
+    obj.grid = False
+
+    ps = np.array(obj.Proxy.getPoints())
+    ps = ps.reshape(n, n, 3)
+    ps[n // 4:n // 2, n // 4:n // 2, 2] = 50.0
+
+    obj.Proxy.togrid(ps.reshape(-1, 3))
+
+    return obj
+
+
+def built_nurbs(n):
+    """Create a Nurbs with its surface built."""
+    obj = make_nurbs(n)
+    obj.Proxy.updatePoles()
+
+    return obj
+
+
+@case("create_surface")
+def bench_create_surface(n):
+    """create_nurbs_do and first createSurface."""
+
+    def run():
+        built_nurbs(n)
+
+    return run
+
+
+@case("update_poles_single")
+def bench_update_single(n):
+    """updatePoles after a single pole change."""
+    proxy = built_nurbs(n).Proxy
+    state = {"h": 0.0}
+
+    def run():
+        state["h"] += 1.0
+        proxy.g[n // 2, n // 2, 2] = state["h"]
+        proxy.updatePoles()
+
+    return run
+
+
+@case("update_poles_single_default")
+def bench_update_single_default(n):
+    """updatePoles after a single pole change, default object.
+
+    The object keeps the aux parts of create_nurbs_do, the solid is
+    refreshed from the locally updated surface.
+    """
+    from freecad.nurbswb.nurbs import create_nurbs_do
+
+    proxy = create_nurbs_do(n, n).Proxy
+    proxy.updatePoles()
+    state = {"h": 0.0}
+
+    def run():
+        state["h"] += 1.0
+        proxy.g[n // 2, n // 2, 2] = state["h"]
+        proxy.updatePoles()
+
+    return run
+
+
+@case("update_poles_all")
+def bench_update_all(n):
+    """updatePoles after all poles changed."""
+    proxy = built_nurbs(n).Proxy
+
+    def run():
+        proxy.g[:, :, 2] += 1.0
+        proxy.updatePoles()
+
+    return run
+
+
+@case("elevate_uline")
+def bench_elevate_uline(n):
+    """elevateUline on the middle line."""
+    proxy = built_nurbs(n).Proxy
+    state = {"h": 0}
+
+    def run():
+        state["h"] += 1
+        proxy.elevateUline(n // 2, state["h"])
+
+    return run
+
+
+@case("elevate_rectangle")
+def bench_elevate_rectangle(n):
+    """elevateRectangle over a quarter of the grid."""
+    proxy = built_nurbs(n).Proxy
+    state = {"h": 0}
+
+    def run():
+        state["h"] += 1
+        proxy.elevateRectangle(1, 1, n // 4, n // 4, state["h"])
+
+    return run
+
+
+@case("elevate_circle")
+def bench_elevate_circle(n):
+    """elevateCircle around the center pole, the brush path."""
+    proxy = built_nurbs(n).Proxy
+    state = {"h": 0}
+
+    # the radius is a length, n // 8 pole steps as in elevate_circle2
+    g = proxy.g
+    radius = max(1, n // 8) * np.linalg.norm(g[0, 1] - g[0, 0])
+
+    def run():
+        state["h"] += 1
+        proxy.elevateCircle(n // 2, n // 2, radius, state["h"])
+
+    return run
+
+
+@case("elevate_circle2")
+def bench_elevate_circle2(n):
+    """elevateCircle2 around the center pole."""
+    proxy = built_nurbs(n).Proxy
+    state = {"h": 0}
+
+    def run():
+        state["h"] += 1
+        proxy.elevateCircle2(n // 2, n // 2, max(1, n // 8), state["h"])
+
+    return run
+
+
+@case("uv_grid_shape")
+def bench_uv_grid_shape(n):
+    """create_uv_grid_shape of the pole grid."""
+    proxy = built_nurbs(n).Proxy
+
+    def run():
+        proxy.create_uv_grid_shape()
+
+    return run
+
+
+def _test_surface():
+    """Return a 10 x 10 poles surface."""
+    return built_nurbs(10).Proxy.bs
+
+
+@case("surf_curvature", SIZES_POINTWISE)
+def bench_surf_curvature(n):
+    """surf_curvature on n x n points, one call per point."""
+    from freecad.nurbswb.nurbs_tools import surf_curvature
+
+    sf = _test_surface()
+    u0, u1, v0, v1 = sf.bounds()
+    uv = [(u, v) for u in np.linspace(u0, u1, n) for v in np.linspace(v0, v1, n)]
+
+    def run():
+        for u, v in uv:
+            surf_curvature(sf, u, v)
+
+    return run
+
+
+@case("curvature_grid")
+def bench_curvature_grid(n):
+    """curvature_grid on n x n points."""
+    from freecad.nurbswb.nurbs_curvature import curvature_grid
+
+    sf = _test_surface()
+    u0, u1, v0, v1 = sf.bounds()
+    us = np.linspace(u0, u1, n)
+    vs = np.linspace(v0, v1, n)
+
+    def run():
+        curvature_grid(sf, us, vs)
+
+    return run
+
+
+@case("genKgrid")
+def bench_genkgrid(n):
+    """Curvature map mesh with n x n cells, as genKgrid."""
+    from freecad.nurbswb import uvgrid_generator as uvg
+
+    sf = _test_surface()
+    u0, u1, v0, v1 = sf.bounds()
+
+    def run():
+        pts, tris, colors = uvg.curvature_map(sf, u0, u1, v0, v1, "sumabs", n)
+        uvg.show_curvature_map(pts, tris, colors, "sumabs")
+
+    return run
+
+
+@case("bezier_update")
+def bench_bezier_update(n):
+    """PatchSet.update of one span of a n x n poles surface."""
+    from freecad.nurbswb import nurbs_bezier
+    from freecad.nurbswb.nurbs_degree import uniform_knots
+    from freecad.nurbswb.nurbs_eval import SurfaceData
+
+    rng = np.random.default_rng(0)
+    knots = uniform_knots(n, 3)
+    poles = rng.normal(size=(n, n, 3))
+    weights = rng.uniform(0.5, 2.0, (n, n))
+    data = SurfaceData(poles, weights, knots, knots, 3, 3)
+
+    ps = nurbs_bezier.PatchSet.from_surface(data)
+    span = (ps.offset[0] + ps.shape[0] // 2, ps.offset[1] + ps.shape[1] // 2)
+
+    def run():
+        ps.update(data, {span})
+
+    return run
@@ -0,0 +1,201 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    benchmarks/runner.py
+
+Benchmark runner, see benchmarks/__init__.py for the usage.
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+
+import FreeCAD
+
+from freecad.nurbswb.benchmarks.cases import CASES
+from freecad.nurbswb.version import __version__
+
+
+def environment():
+    """Return a dict describing where the benchmarks run."""
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "workbench": __version__,
+        "freecad": ".".join(FreeCAD.Version()[:3]),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "gui": bool(FreeCAD.GuiUp),
+    }
+
+
+def time_case(func, size, repeat=5, budget=10.0):
+    """Time a case on one size.
+
+    Every repetition runs in a new document, the repetitions stop
+    early when the budget in seconds is exceeded.
+
+    Returns:
+        dict: times in seconds, or the error
+    """
+    times = []
+    spent = 0.0
+
+    for _ in range(repeat):
+        doc = FreeCAD.newDocument("NurbsBenchmark")
+        FreeCAD.setActiveDocument(doc.Name)
+
+        try:
+            run = func(size)
+            t0 = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - t0)
+        except Exception as err:
+            return {"error": f"{type(err).__name__}: {err}"}
+        finally:
+            FreeCAD.closeDocument(doc.Name)
+
+        spent += times[-1]
+        if spent > budget:
+            break
+
+    return {
+        "runs": len(times),
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "max": max(times),
+    }
+
+
+def run_benchmarks(cases=None, sizes=None, repeat=5, budget=10.0, verbose=True):
+    """Run the benchmarks.
+
+    Args:
+        cases (list): case names, None for all. Defaults to None
+        sizes (list): grid sizes, None for the case sizes. Defaults to None
+        repeat (int): repetitions for a size. Defaults to 5
+        budget (float): max seconds spent on a size. Defaults to 10.0
+
+    Returns:
+        dict: {"environment": {...}, "results": {case: {size: timing}}}
+    """
+    names = list(CASES) if cases is None else cases
+    results = {}
+
+    for name in names:
+        func, case_sizes = CASES[name]
+        results[name] = {}
+
+        for size in sizes or case_sizes:
+            res = time_case(func, size, repeat, budget)
+            results[name][str(size)] = res
+
+            if verbose:
+                if "error" in res:
+                    print(f"{name:22} {size:4}  {res['error']}")
+                else:
+                    print(f"{name:22} {size:4}  {res['median'] * 1000:10.2f} ms")
+
+    return {"environment": environment(), "results": results}
+
+
+def compare(current, baseline, threshold=0.2):
+    """Compare two benchmark runs.
+
+    Args:
+        current (dict): run_benchmarks result
+        baseline (dict): run_benchmarks result
+        threshold (float): allowed relative slowdown. Defaults to 0.2
+
+    Returns:
+        list: dicts with case, size, baseline, current, ratio and
+            regression for every timing present in both runs
+    """
+    rows = []
+
+    for name, sizes in current["results"].items():
+        base_sizes = baseline["results"].get(name, {})
+
+        for size, res in sizes.items():
+            base = base_sizes.get(size)
+            if base is None or "error" in res or "error" in base:
+                continue
+
+            ratio = res["median"] / base["median"] if base["median"] > 0 else 1.0
+            rows.append({
+                "case": name,
+                "size": int(size),
+                "baseline": base["median"],
+                "current": res["median"],
+                "ratio": ratio,
+                "regression": ratio > 1.0 + threshold,
+            })
+
+    return rows
+
+
+def main(argv=None):
+    """Command line entry point.
+
+    Returns:
+        int: 1 if a regression has been found, 0 otherwise
+    """
+    parser = argparse.ArgumentParser(prog="freecad.nurbswb.benchmarks")
+    parser.add_argument("--cases", nargs="*", choices=sorted(CASES))
+    parser.add_argument("--sizes", nargs="*", type=int)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=10.0)
+    parser.add_argument("--output", help="write the result to this JSON file")
+    parser.add_argument("--baseline", help="compare with this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2)
+
+    args = parser.parse_args(argv)
+
+    if FreeCAD.GuiUp:
+        print("GUI is running, timings include the view updates")
+
+    res = run_benchmarks(args.cases, args.sizes, args.repeat, args.budget)
+    failed = []
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        res["comparison"] = compare(res, baseline, args.threshold)
+        failed = [r for r in res["comparison"] if r["regression"]]
+
+        for r in failed:
+            print(f"REGRESSION {r['case']} {r['size']}: "
+                  f"{r['baseline'] * 1000:.2f} ms -> {r['current'] * 1000:.2f} ms "
+                  f"({r['ratio']:.2f}x)")
+
+        print(f"{len(res['comparison'])} timings compared, "
+              f"{len(failed)} regressions")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(res, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,6 +8,17 @@ Inspired from microelly work on freecad-nurbswb
 
 Portions of code from microelly (c) 2016 - 2019.
 
+Only the command metadata is registered here, the command modules and
+their dependencies (matplotlib, Draft, the dialogs) are imported when a
+command is first run.
+
+The time spent registering the commands and initializing the workbench
+is written to the report view log, set "ReportStartup" in
+"User parameter:Plugins/nurbs" to show it as a message.
+
+Commands call their function directly, see dispatch for the
+"JournalCommands" and "DeveloperReload" parameters.
+
 Versions:
     v 0.1 - 2023 onekk
 
@@ -21,9 +32,11 @@ __title__ = "FreeCAD Nurbs-NG"
 __vers__ = "0.1"
 
 
+import ast
 import os
 import sys
 import re
+import time
 
 import importlib
 
@@ -32,6 +45,9 @@ import FreeCADGui
 
 # import freecad.nurbswb
 
+_t_import = time.perf_counter()
+
+fc_log = FreeCAD.Console.PrintLog
 fc_msg = FreeCAD.Console.PrintMessage
 fc_wrn = FreeCAD.Console.PrintWarning
 fc_err = FreeCAD.Console.PrintError
@@ -132,6 +148,91 @@ def get_SelectedObjects(info=0, printError=True):
 
     return
 
+# command dispatch
+
+def _params():
+    """Return the parameter group of the workbench."""
+    return FreeCAD.ParamGet("User parameter:Plugins/nurbs")
+
+
+def resolve_command(lmod, command):
+    """Return the callable and the arguments of a command string.
+
+    Args:
+        lmod (str): module name, e.g. "freecad.nurbswb.nurbs"
+        command (str): e.g. "freecad.nurbswb.nurbs.runtcn()"
+
+    Returns:
+        tuple: (callable, args tuple), None if the command is not a
+            function call with literal arguments
+    """
+    match = re.match(r"^(\w+)\((.*)\)$", command[len(lmod) + 1:].strip())
+
+    if match is None:
+        return None
+
+    fname, args = match.groups()
+
+    try:
+        args = ast.literal_eval(f"({args},)") if args.strip() else ()
+    except (ValueError, SyntaxError):
+        return None
+
+    func = getattr(importlib.import_module(lmod), fname)
+
+    return func, args
+
+
+def dispatch(cmd):
+    """Run the command of a _Command or _Command2.
+
+    The callable is resolved on the first run and called directly.
+    With "JournalCommands" (default True) the equivalent macro lines are
+    echoed to the python console and the macro recorder without running
+    them. With "DeveloperReload" (default False) the module is reloaded
+    and the command run as a string on every click, as during
+    development.
+    """
+    par = _params()
+
+    if par.GetBool("DeveloperReload", False):
+        cmd.target = None
+        FreeCADGui.doCommand("from importlib import reload")
+        FreeCADGui.doCommand(f"import {cmd.lmod}")
+        FreeCADGui.doCommand(f"reload({cmd.lmod})")
+        FreeCADGui.doCommand(cmd.command)
+        return
+
+    if cmd.target is None:
+        cmd.target = resolve_command(cmd.lmod, cmd.command)
+
+    if cmd.target is None:
+        # not a plain call, let the console run it
+        FreeCADGui.doCommand(f"import {cmd.lmod}")
+        FreeCADGui.doCommand(cmd.command)
+        return
+
+    if par.GetBool("JournalCommands", True):
+        FreeCADGui.doCommandSkip(f"import {cmd.lmod}")
+        FreeCADGui.doCommandSkip(cmd.command)
+
+    func, args = cmd.target
+    func(*args)
+
+
+def recompute_touched():
+    """Recompute the touched objects of the active document."""
+    doc = FreeCAD.ActiveDocument
+
+    if doc is None:
+        return
+
+    touched = [obj for obj in doc.Objects if obj.isTouched()]
+
+    if touched:
+        doc.recompute(touched)
+
+
 # fast command adder template
 
 global _Command2
@@ -171,6 +272,8 @@ class _Command2():
         self.lmod = lmod
         self.command = command
         self.modul = modul
+        # (callable, args) resolved on first run, see dispatch
+        self.target = None
 
         if icon is not None:
             self.icon = f"{ICONPATH}/{icon}"
@@ -218,28 +321,12 @@ class _Command2():
             FreeCAD.ActiveDocument.openTransaction(self.name)
 
         if self.command != '':
-            if self.modul != '':
-                modul = self.modul
-            else:
-                modul = self.name
-
-            # dbg info
-            print(f"modul: {modul}")
-
-            FreeCADGui.doCommand("from importlib import reload")
-            FreeCADGui.doCommand("import re")
-            FreeCADGui.doCommand("import " + modul)
-            FreeCADGui.doCommand("import " + self.lmod)
-            FreeCADGui.doCommand("reload(" + self.lmod + ")")
-            docstring = 'print()\nprint(' + re.sub(r'\(.*\)', '.__doc__)', self.command)
-            FreeCADGui.doCommand(docstring)
-            FreeCADGui.doCommand(self.command)
+            dispatch(self)
 
         if ta:
             FreeCAD.ActiveDocument.commitTransaction()
 
-        if FreeCAD.ActiveDocument is not None:
-            FreeCAD.ActiveDocument.recompute()
+        recompute_touched()
 
 
 global _Command
@@ -278,6 +365,8 @@ class _Command():
         self.lmod = lmod
         self.command = command
         self.modul = modul
+        # (callable, args) resolved on first run, see dispatch
+        self.target = None
 
         self.icon = f"{ICONPATH}/{icon}"
 
@@ -303,25 +392,13 @@ class _Command():
 
     def Activated(self):
         # FreeCAD.ActiveDocument.openTransaction("create " + self.name)
-        # dbg info
-        # print(f"mod: {self.modul}")
 
         if self.command != '':
-            if self.modul != '':
-                modul = self.modul
-            else:
-                modul = self.name
-
-            FreeCADGui.doCommand("from importlib import reload ")
-            FreeCADGui.doCommand(f"import {modul}")
-            FreeCADGui.doCommand(f"import {self.lmod}")
-            FreeCADGui.doCommand(f"reload({self.lmod})")
-            FreeCADGui.doCommand(self.command)
+            dispatch(self)
 
         # FreeCAD.ActiveDocument.commitTransaction()
 
-        if FreeCAD.ActiveDocument is not None:
-            FreeCAD.ActiveDocument.recompute()
+        recompute_touched()
 
 
 class _alwaysActive(_Command):
@@ -530,6 +607,9 @@ if FreeCAD.GuiUp:
     c2a([cg1, "create"], always, "Nurbs Editor", "nurbs", "Test cylinder plain",
         "zebra.svg", "runtcp()")
 
+# seconds spent registering the commands
+register_time = time.perf_counter() - _t_import
+
 # --- Command Definition
 
 
@@ -569,16 +649,11 @@ static char * nurbs_xpm[] = {
     def __init__(self, version):
         """Docstring missing."""
         self.version = version
+        self.init_time = None
 
     def Initialize(self):
-        """Docstring missing."""
-        FreeCADGui.activateWorkbench("DraftWorkbench")
-        FreeCADGui.activateWorkbench("SketcherWorkbench")
-
-        try:
-            pass
-        except:
-            pass
+        """Create the menus from the registered commands."""
+        ts = time.perf_counter()
 
         # for cmd_item in menu_elist:
         #    self.appendToolbar(t[0], t[1])
@@ -599,5 +674,19 @@ static char * nurbs_xpm[] = {
         for menu in menu_lst:
             self.appendMenu(list(menu), menus[menu])
 
+        self.init_time = time.perf_counter() - ts
+        self.report_startup()
+
+    def report_startup(self):
+        """Report the command registration and initialization times."""
+        report = fc_log
+
+        if FreeCAD.ParamGet("User parameter:Plugins/nurbs").GetBool(
+                "ReportStartup", False):
+            report = fc_msg
+
+        report(f"Nurbs WB: commands registered in {register_time * 1000:.1f} ms, "
+               f"workbench initialized in {self.init_time * 1000:.1f} ms\n")
+
 
 FreeCADGui.addWorkbench(NurbsWorkbench(__vers__))
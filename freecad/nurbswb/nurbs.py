@@ -30,23 +30,46 @@ Licence:
 __version__ = "0.1"
 
 
+import contextlib
+import logging
+import re
 import time
 import random
 
 import FreeCAD
 import FreeCADGui
 
-import Draft
 import Part
 
 import numpy as np
 
-import freecad.nurbswb.nurbs_dialog  # noqa
-
 from freecad.nurbswb.nurbs_tools import ensure_document, clear_doc, setview  # noqa
-
-
-import PySide
+from freecad.nurbswb import nurbs_bezier
+from freecad.nurbswb import nurbs_brush
+from freecad.nurbswb import nurbs_cache
+from freecad.nurbswb import nurbs_degree
+from freecad.nurbswb import nurbs_fit
+from freecad.nurbswb import nurbs_interpolate
+from freecad.nurbswb import nurbs_primitives
+from freecad.nurbswb import nurbs_project
+from freecad.nurbswb import nurbs_refine
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_eval import (
+    SurfaceData, sample_grid, full_knots, split_knots)
+from freecad.nurbswb.nurbs_log import get_logger, Lazy
+
+
+log = get_logger(__name__)
+
+# Storage format version of the Nurbs.polesData property.
+#   0: legacy, poles stored as text in the Nurbs.poles string list
+#   1: poles stored as a binary vector list in Nurbs.polesData
+#   2: knot_u and knot_v are the knot vectors of the built surface
+POLES_FORMAT = 2
+
+# match numbers in the legacy poles strings, see _parse_legacy_poles
+_LEGACY_NUM = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_LEGACY_FLOAT = re.compile(r"(?:np\.|numpy\.)?float(?:16|32|64|128)?\(")
 
 
 class NurbsObj:
@@ -79,6 +102,10 @@ class VP_NurbsObj:
 
     def __init__(self, obj):
         """Docstring missing."""
+        obj.addProperty(
+            "App::PropertyBool", "ShowControlNet", "Nurbs",
+            "show the pole grid")
+        obj.ShowControlNet = True
         obj.Proxy = self
         self.Object = obj
 
@@ -86,8 +113,170 @@ class VP_NurbsObj:
         """Assign scene sub-graph of view provider, this method is mandatory."""
         obj.Proxy = self
         self.Object = obj
+        self.create_control_net(obj)
+        self.create_preview(obj)
         return
 
+    def create_control_net(self, vobj):
+        """Add the coin nodes showing the poles and the pole grid.
+
+        The nodes are fed directly from the pole array, see
+        update_control_net, no document object or edge is created.
+        """
+        #
+        from pivy import coin
+
+        self.net_coords = coin.SoCoordinate3()
+
+        style = coin.SoDrawStyle()
+        style.lineWidth = 1
+        style.pointSize = 4
+
+        line_color = coin.SoBaseColor()
+        line_color.rgb = (1.0, 0.0, 1.0)
+        self.net_lines = coin.SoIndexedLineSet()
+
+        line_sep = coin.SoSeparator()
+        line_sep.addChild(line_color)
+        line_sep.addChild(self.net_lines)
+
+        self.net_line_switch = coin.SoSwitch()
+        self.net_line_switch.addChild(line_sep)
+
+        point_color = coin.SoBaseColor()
+        point_color.rgb = (1.0, 0.0, 0.0)
+        self.net_points = coin.SoPointSet()
+
+        point_sep = coin.SoSeparator()
+        point_sep.addChild(point_color)
+        point_sep.addChild(self.net_points)
+
+        self.net_point_switch = coin.SoSwitch()
+        self.net_point_switch.addChild(point_sep)
+
+        net = coin.SoSeparator()
+        net.addChild(self.net_coords)
+        net.addChild(style)
+        net.addChild(self.net_line_switch)
+        net.addChild(self.net_point_switch)
+
+        vobj.RootNode.addChild(net)
+
+        self.net_shape = None
+        self.set_net_visibility(vobj)
+
+    def set_net_visibility(self, vobj):
+        """Show or hide pole grid and poles from the properties."""
+        show_net = getattr(vobj, "ShowControlNet", True)
+        show_pts = getattr(vobj.Object, "polpoints", False)
+
+        self.net_line_switch.whichChild = 0 if show_net else -1
+        self.net_point_switch.whichChild = 0 if show_pts else -1
+
+    def update_control_net(self, poles):
+        """Update the pole grid coordinates in place.
+
+        Args:
+            poles (np_array): (rows, cols, 3) pole grid
+        """
+        #
+        rows, cols = poles.shape[:2]
+        pts = poles.reshape(-1, 3).tolist()
+
+        self.net_coords.point.setNum(len(pts))
+        self.net_coords.point.setValues(0, len(pts), pts)
+
+        if self.net_shape != (rows, cols):
+            # one polyline for every row and column, -1 ends a polyline
+            idx = np.arange(rows * cols).reshape(rows, cols)
+            ends_r = np.full((rows, 1), -1)
+            ends_c = np.full((cols, 1), -1)
+            lines = np.concatenate((
+                np.hstack((idx, ends_r)).ravel(),
+                np.hstack((idx.T, ends_c)).ravel())).tolist()
+
+            self.net_lines.coordIndex.setNum(len(lines))
+            self.net_lines.coordIndex.setValues(0, len(lines), lines)
+            self.net_shape = (rows, cols)
+
+    def create_preview(self, vobj):
+        """Add the coin nodes of the coarse surface shown while editing.
+
+        During an edit the surface is drawn from a few samples per knot
+        span computed from the poles, the Part shape and its fine
+        tessellation are hidden and rebuilt only when the edit settles,
+        see show_preview and end_preview.
+        """
+        #
+        from pivy import coin
+
+        self.preview_material = coin.SoMaterial()
+
+        hints = coin.SoShapeHints()
+        hints.vertexOrdering = coin.SoShapeHints.COUNTERCLOCKWISE
+        hints.creaseAngle = 0.5
+
+        self.preview_coords = coin.SoCoordinate3()
+        self.preview_faces = coin.SoIndexedFaceSet()
+
+        sep = coin.SoSeparator()
+        sep.addChild(self.preview_material)
+        sep.addChild(hints)
+        sep.addChild(self.preview_coords)
+        sep.addChild(self.preview_faces)
+
+        self.preview_switch = coin.SoSwitch()
+        self.preview_switch.addChild(sep)
+        self.preview_switch.whichChild = -1
+
+        vobj.RootNode.addChild(self.preview_switch)
+
+        self.preview_grid = None
+        # display mode hidden during the edit, None if not editing
+        self.preview_mode = None
+
+    def show_preview(self, points):
+        """Show the coarse surface, hide the shape until end_preview.
+
+        Args:
+            points (np_array): (nu, nv, 3) surface samples
+        """
+        #
+        vobj = self.Object
+        nu, nv = points.shape[:2]
+        pts = points.reshape(-1, 3).tolist()
+
+        self.preview_coords.point.setNum(len(pts))
+        self.preview_coords.point.setValues(0, len(pts), pts)
+
+        if self.preview_grid != (nu, nv):
+            # one quad for every cell, -1 ends a face
+            idx = np.arange(nu * nv).reshape(nu, nv)
+            quads = np.stack((
+                idx[:-1, :-1], idx[1:, :-1], idx[1:, 1:], idx[:-1, 1:],
+                np.full((nu - 1, nv - 1), -1)), axis=-1).ravel().tolist()
+
+            self.preview_faces.coordIndex.setNum(len(quads))
+            self.preview_faces.coordIndex.setValues(0, len(quads), quads)
+            self.preview_grid = (nu, nv)
+
+        if self.preview_mode is None:
+            self.preview_material.diffuseColor = vobj.ShapeColor[:3]
+            self.preview_material.transparency = vobj.Transparency / 100.0
+
+            self.preview_mode = vobj.SwitchNode.whichChild.getValue()
+            vobj.SwitchNode.whichChild = -1
+            self.preview_switch.whichChild = 0
+
+    def end_preview(self):
+        """Hide the coarse surface and show the shape again."""
+        if getattr(self, "preview_mode", None) is None:
+            return
+
+        self.preview_switch.whichChild = -1
+        self.Object.SwitchNode.whichChild = self.preview_mode
+        self.preview_mode = None
+
     def claimChildren(self):
         """Docstring missing."""
         pass
@@ -95,6 +284,8 @@ class VP_NurbsObj:
 
     def updateData(self, fp, prop):
         """Handle a property change in the handled feature."""
+        if prop == "polpoints" and hasattr(self, "net_point_switch"):
+            self.set_net_visibility(self.Object)
         return
 
     def getDisplayModes(self, obj):
@@ -118,7 +309,8 @@ class VP_NurbsObj:
 
     def onChanged(self, vp, prop):
         """Docstring missing."""
-        pass
+        if prop == "ShowControlNet" and hasattr(self, "net_line_switch"):
+            self.set_net_visibility(vp)
 
     def showVersion(self):
         """Docstring missing."""
@@ -128,6 +320,9 @@ class VP_NurbsObj:
                     f"Object Name: {self.Object.Object.Name}",
                     f"Object Label: {self.Object.Object.Label}"))
         msg_txt = "\n".join(msg)
+
+        import PySide
+
         PySide.QtGui.QMessageBox.information(
             None, "About ", msg_txt)
 
@@ -204,6 +399,77 @@ class VP_NurbsObj:
         return False
 
 
+class PoleBatch(object):
+    """Pole edits collected by Nurbs.edit_batch.
+
+    Selections index the (rows, cols) pole grid of Nurbs.g: a (row, col)
+    pair, slices, index arrays or a boolean mask of the grid shape.
+    Values are broadcast on the selection, so a single value, a (3,)
+    vector or one value per selected pole may be given.
+    """
+
+    def __init__(self, proxy, weights):
+        """Init the batch.
+
+        Args:
+            proxy (Nurbs): the edited proxy
+            weights (np_array): (rows, cols) weights, edited in place
+        """
+        self.proxy = proxy
+        self.weights = weights
+        self.weights_changed = False
+
+    @property
+    def g(self):
+        """Return the pole grid, it may be edited directly."""
+        return self.proxy.g
+
+    @staticmethod
+    def _key(sel):
+        """Return sel as a tuple index of the grid."""
+        if isinstance(sel, np.ndarray) and sel.dtype == bool:
+            return (sel,)
+
+        return tuple(sel) if isinstance(sel, (tuple, list)) else (sel,)
+
+    def set(self, sel, value, axis=None, relative=False):
+        """Assign or add pole coordinates.
+
+        Args:
+            sel: selection, see the class
+            value (float or array_like): new values or deltas
+            axis (int): 0, 1 or 2 to change one coordinate, None for the
+                whole position. Defaults to None
+            relative (bool): add value instead of assigning it.
+                Defaults to False
+        """
+        key = self._key(sel) + (slice(None) if axis is None else axis,)
+
+        if relative:
+            self.g[key] += value
+        else:
+            self.g[key] = value
+
+    def move(self, sel, delta):
+        """Move the selected poles by delta, see set."""
+        self.set(sel, delta, relative=True)
+
+    def set_weight(self, sel, value, relative=False):
+        """Assign or add pole weights, see set."""
+        key = self._key(sel)
+
+        if relative:
+            self.weights[key] += value
+        else:
+            self.weights[key] = value
+
+        self.weights_changed = True
+
+    def preview(self):
+        """Show the coarse surface of the current poles, see Nurbs.preview."""
+        return self.proxy.preview()
+
+
 class Nurbs(NurbsObj):
     """Docstring missing."""
 
@@ -211,7 +477,7 @@ class Nurbs(NurbsObj):
         """Docstring missing."""
         NurbsObj.__init__(self, obj)
 
-        print(f"Nurbs.obj: {obj.Name}")
+        log.debug("Nurbs.obj: %s", obj.Name)
         self.TypeId = "Nurbs"
 
         self.add_properties(obj)
@@ -223,7 +489,8 @@ class Nurbs(NurbsObj):
 
         # Nurbs
 
-        # obj.poles =  # Unassigned here
+        # obj.polesData =  # Unassigned here
+        obj.polesFormat = POLES_FORMAT
         obj.weights = [1] * (uc * vc)
         obj.degree_u = 3
         obj.degree_v = 3
@@ -248,7 +515,7 @@ class Nurbs(NurbsObj):
         # a sphere has a radius only
         # a torus has two radiuses and a height in Z
         # surfaces has different definition
-        obj.Height = 1.0
+        obj.Height = 1000.0
         obj.Radius = 200
         obj.Radius2 = 150
 
@@ -278,13 +545,13 @@ class Nurbs(NurbsObj):
         """
         # not gui editable for now
         for elem in ["polnumber", "polselection", "gridobj", "polgrid",
-                     "polobj", "Height"]:
+                     "polobj", "Height", "polesFormat"]:
             # 0 to make editable for testing
             obj.setEditorMode(elem, vp3)
 
     def vis_prop1(self, fp, vp1):
         """Set visibility of properties."""
-        for a in ["degree_u", "degree_v", "poles", "knot_u", "knot_v",
+        for a in ["degree_u", "degree_v", "polesData", "knot_u", "knot_v",
                   "nNodes_u", "nNodes_v", "weights",]:
             fp.setEditorMode(a, vp1)
 
@@ -317,8 +584,14 @@ class Nurbs(NurbsObj):
         #   udegree, vdegree,
         #   weights (sequence of sequence of float)
 
+        # poles are stored flat as (x, y, z) vectors, the vector list is
+        # saved as binary data in the FCStd file
+        obj.addProperty(
+            "App::PropertyVectorList", "polesData", "Nurbs", "")
+
         obj.addProperty(
-            "App::PropertyStringList", "poles", "Nurbs", "")
+            "App::PropertyInteger", "polesFormat", "Nurbs",
+            "storage format version of polesData")
 
         obj.addProperty(
             "App::PropertyFloatList", "weights", "Nurbs", "")
@@ -406,7 +679,7 @@ class Nurbs(NurbsObj):
 
     def attach(self, vobj):
         """Docstring missing."""
-        print("attach -------------------------------------")
+        log.debug("attach -------------------------------------")
         self.Object = vobj.Object
         self.obj2 = vobj.Object
 
@@ -414,8 +687,12 @@ class Nurbs(NurbsObj):
         """Docstring missing."""
         # print "changed ",prop
 
+        if getattr(self, "_resizing", False):
+            # pole counts set by refine_knots with the poles
+            return
+
         if prop == "model":
-            print(f"Nurbs model: {fp.model}")
+            log.debug("Nurbs model: %s", fp.model)
             if fp.model in ("NurbsCylinder", "NurbsSphere", "NurbsTorus"):
                 fp.setEditorMode("Radius", 0)
             if fp.model in ("NurbsCylinder", "NurbsTorus"):
@@ -442,7 +719,7 @@ class Nurbs(NurbsObj):
                 self.vis_prop1(fp, vp1)
             except:
                 # debug message to see if something fails
-                print("onChanged except vp1")
+                log.debug("onChanged except vp1")
                 pass
 
         elif prop == "generatePoles":
@@ -455,7 +732,7 @@ class Nurbs(NurbsObj):
                 self.vis_prop2(fp, vp2)
             except:
                 # debug message to see if something fails
-                print("onChanged except vp1")
+                log.debug("onChanged except vp1")
                 pass
 
         elif prop in ("stepU", "stepV", "nNodes_u", "nNodes_v"):
@@ -464,11 +741,11 @@ class Nurbs(NurbsObj):
 
             try:
                 # FIXME: on Update shape is modified.
-                print(f"prop: {prop} try executed")
+                log.debug("prop: %s try executed", prop)
                 ps = a.Proxy.getPoints()
 
                 # dbg info
-                print(f"----- BEFORE -------------- points: {len(ps)}")
+                log.debug("----- BEFORE -------------- points: %s", len(ps))
 
                 a.Proxy.togrid(ps)
                 # a.Proxy.elevateVline(2,100)
@@ -479,27 +756,27 @@ class Nurbs(NurbsObj):
 
                 # dbg info added
                 ps = a.Proxy.getPoints()
-                print(f"----- AFTER -------------- points: {len(ps)}")
+                log.debug("----- AFTER -------------- points: %s", len(ps))
 
                 a.Proxy.update(fp)
 
             except:
-                print(f"prop: {prop} except executed")
+                log.debug("prop: %s except executed", prop)
                 pass
 
         return
 
     def update(self, fp):
         """Docstring missing."""
-        print("--- Nurbs: update")
+        log.debug("--- Nurbs: update")
         if hasattr(fp, "polobj"):
-            print("--- polobj.set")
+            log.debug("--- polobj.set")
             if fp.polobj is not None:
                 FreeCAD.ActiveDocument.removeObject(fp.polobj.Name)
 
-            fp.polobj = self.createSurface(fp, fp.poles)
+            fp.polobj = self.createSurface(fp, nurbs_get_poles(fp))
 
-            if fp.polobj is not None:
+            if fp.polobj is not None and FreeCAD.GuiUp:
                 fp.polobj.ViewObject.PointSize = 4
                 fp.polobj.ViewObject.PointColor = (1.0, 0.0, 0.0)
 
@@ -509,8 +786,11 @@ class Nurbs(NurbsObj):
 
     def onDocumentRestored(self, fp):
         """Docstring missing."""
-        print(f"onDocumentRestored {fp.Label} : {fp.Proxy.__class__.__name__}"),
-        print(f"onDocumentRestored {fp.Name}"),
+        log.debug("onDocumentRestored %s : %s", fp.Label,
+                  fp.Proxy.__class__.__name__)
+        log.debug("onDocumentRestored %s", fp.Name)
+        self.migrate_poles(fp)
+
         a = FreeCAD.ActiveDocument.Nurbs
         a.Proxy.obj2 = a
 
@@ -538,6 +818,41 @@ class Nurbs(NurbsObj):
         # set to 2 to not visualize
         self.set_var_prop(fp, 0)
 
+    def migrate_poles(self, fp):
+        """Convert legacy poles stored as strings to the binary storage.
+
+        Documents saved before POLES_FORMAT 1 hold the poles as text in the
+        "poles" string list, they are parsed once and moved to polesData,
+        the legacy property is emptied to keep the file compact.
+
+        Before POLES_FORMAT 2 knot_u and knot_v were not used by the
+        build, they are cleared to be set again from the built surface.
+        """
+        #
+        if "polesData" not in fp.PropertiesList:
+            fp.addProperty(
+                "App::PropertyVectorList", "polesData", "Nurbs", "")
+            fp.addProperty(
+                "App::PropertyInteger", "polesFormat", "Nurbs",
+                "storage format version of polesData")
+            fp.polesFormat = 0
+
+        if fp.polesFormat >= POLES_FORMAT:
+            return
+
+        if "poles" in fp.PropertiesList:
+            if len(fp.poles) > 0:
+                nurbs_set_poles(fp, _parse_legacy_poles(fp.poles))
+            fp.poles = []
+            fp.setEditorMode("poles", 2)
+
+        fp.knot_u = []
+        fp.knot_v = []
+
+        fp.polesFormat = POLES_FORMAT
+        log.info("Nurbs %s: poles migrated to format %s", fp.Name, POLES_FORMAT)
+
+    @nurbs_trace.traced("Nurbs.create_grid_shape")
     def create_grid_shape(self, ct=20):
         """Create a grid of BSplineSurface bs with ct lines and rows."""
         #
@@ -546,27 +861,21 @@ class Nurbs(NurbsObj):
         sss = []
 
         st = 1.0 / ct
+        # all the grid points in one call, see nurbs_eval
+        ts = st * np.arange(ct + 1)
+        grid = sample_grid(bs, ts, ts)
+
         for iu in range(ct + 1):
-            pps = []
-            for iv in range(ct + 1):
-                p = bs.value(st * iu, st * iv)
-                pps.append(p)
+            pps = [FreeCAD.Vector(*p) for p in grid[iu].tolist()]
             tt = Part.BSplineCurve()
             tt.interpolate(pps)
             ss = tt.toShape()
             sss.append(ss)
 
         for iv in range(1, ct + 1):
-            pps = []
-            for iu in range(0, ct + 1):
-                p = bs.value(st * iu, st * iv)
-                # print(iv,iu,st*iu,st*iv)
-                pps.append(p)
-            tt = Part.BSplineCurve()
-            tt.interpolate(pps)
-            ss = tt.toShape()
+            pps = [FreeCAD.Vector(*p) for p in grid[:, iv].tolist()]
 
-            # Hack
+            # Hack, the polygon is shown, no curve is interpolated
             ss = Part.makePolygon(pps)
             sss.append(ss)
 
@@ -574,10 +883,15 @@ class Nurbs(NurbsObj):
 
     def create_grid(self, bs, ct=20):
         """Docstring missing."""
-        print("--- start create_grid ---")
-        comp = self.create_grid_shape(ct)
+        log.debug("--- start create_grid ---")
+        entry = getattr(self, "_cache_entry", None)
+
+        if entry is not None:
+            comp = entry.derived(("grid", ct), lambda: self.create_grid_shape(ct))
+        else:
+            comp = self.create_grid_shape(ct)
 
-        print(dir(self))
+        log.debug("%s", Lazy(lambda: dir(self)))
         #print(f"****************** {self.obj.Name}")
 
         # .addObject("Part::Compound","Compound")
@@ -586,9 +900,10 @@ class Nurbs(NurbsObj):
         for e_idx, elem in enumerate(comp):
             grid = Part.show(elem, f"grid_elem{e_idx}")
 
-        print("--- end create_grid ---")
+        log.debug("--- end create_grid ---")
         return grid
 
+    @nurbs_trace.traced("Nurbs.create_uv_grid_shape")
     def create_uv_grid_shape(self):
         """Create poles grid."""
         #
@@ -598,9 +913,9 @@ class Nurbs(NurbsObj):
         nNodes_u = self.obj2.nNodes_u
         nNodes_v = self.obj2.nNodes_v
 
-        print("--- CGS: poles and knots ---")
-        print(f"Knots U: {nNodes_u} V: {nNodes_v}")
-        print(f"Poles U: {bs.NbUPoles} V: {bs.NbVPoles}")
+        log.debug("--- CGS: poles and knots ---")
+        log.debug("Knots U: %s V: %s", nNodes_u, nNodes_v)
+        log.debug("Poles U: %s V: %s", bs.NbUPoles, bs.NbVPoles)
 
         # TODO: see why it is repeated the nNodes
         #       closed bspline are not managed, for loop seem to
@@ -651,29 +966,32 @@ class Nurbs(NurbsObj):
                 # if iv != 1:
                 sss.append(ss)
             except:
-                print((f"CGS: No Polygon for: {pps2}"))
+                log.debug("CGS: No Polygon for: %s", pps2)
 
+        nurbs_trace.count("Part.makePolygon", 2 * (nNodes_u + nNodes_v))
+        nurbs_trace.count("bs.getPole", 2 * nNodes_u * nNodes_v)
         comp = Part.Compound(sss)
 
-        print("--- CGS: End ---")
+        log.debug("--- CGS: End ---")
 
         return comp
 
     def create_uv_grid(self):
         """Show UV grid."""
-        print("--- create_uv_grid called ---")
+        log.debug("--- create_uv_grid called ---")
         comp = self.create_uv_grid_shape()
         gdo = Part.show(comp)
 
-        gdo.ViewObject.LineColor = (1.0, 0.0, 1.0)
-        gdo.ViewObject.LineWidth = 1
+        if FreeCAD.GuiUp:
+            gdo.ViewObject.LineColor = (1.0, 0.0, 1.0)
+            gdo.ViewObject.LineWidth = 1
 
         return gdo
 
     def create_solid(self, bs):
         """Create a solid part with the surface as top."""
         # FIXME: from original code, see if is useful in new context
-        print("--- create_solid called ---")
+        log.debug("--- create_solid called ---")
         poles = np.array(bs.getPoles())
         ka, kb, tt = poles.shape
 
@@ -708,6 +1026,8 @@ class Nurbs(NurbsObj):
         # FIXME: see if FreeCAD.ActiveDocument.ActiveObject could be made
         #        a proper object, now it is not clear what is upgraded
 
+        import Draft
+
         # create wire and face
         Draft.upgrade(sdo, delete=True)
         FreeCAD.ActiveDocument.recompute()
@@ -724,150 +1044,15 @@ class Nurbs(NurbsObj):
         sh = Part.makeShell([s1, bs.toShape()])
         return Part.makeSolid(sh)
 
-    def CylinderCoords(self, obj, coor, debug=False):
-        """Calculate coord for cylinder."""
-        coor = np.array(coor)
-
-        if debug is True:
-            print(f"Cylinder coord: {coor}")
-
-        l, d = coor.shape
-
-        xs = coor[:, 0]
-        ys = coor[:, 1]
-        zs = coor[:, 2]
-
-        xs -= xs.min()
-        xs /= xs.max()
-        xs *= 2 * np.pi
-
-        if debug is True:
-            print(f"xs: min: {xs.min()} max: {xs.max()}")
-            print(f"{xs}")
-
-        ys -= ys.min()
-        ys /= ys.max()
-
-        if debug is True:
-            print(f"ys: min: {ys.min()} max: {ys.max()}")
-            print(f"{ys}")
-
-        if debug is True:
-            print(f"zs min: {zs.min()} max: {zs.max()}")
-            print(f"{zs}")
-
-        if zs.max() != 0.:
-            zs -= zs.min()
-            zs /= zs.max()
-
-        coor = []
-        h = 2000
-
-        for i in range(l):
-            r = 400 + 200 * zs[i]
-
-            # coor.append([r * np.cos(xs[i]), r * np.sin(xs[i]), h * ys[i]])
-            coor.append([r * np.sin(xs[i]), r * np.cos(xs[i]), h * ys[i]])
-
-        return coor
-
-    def SphereCoords(self, obj, coor, debug=False):
-        """Calculate coord for sphere."""
-        coor = np.array(coor)
-
-        if debug is True:
-            print(f"Sphere coord: {coor}")
-
-        l, d = coor.shape
-        xs = coor[:, 0]
-        ys = coor[:, 1]
-        zs = coor[:, 2]
-
-        xs -= xs.min()
-        xs /= xs.max()
-        xs *= 2 * np.pi
-
-        if debug is True:
-            print(f"xs: min: {xs.min()} max: {xs.max()}")
-            print(f"{xs}")
-
-        ys -= ys.min()
-        ys /= ys.max()
-        ys -= 0.5
-        ys *= np.pi
-
-        if debug is True:
-            print(f"ys: min: {ys.min()} max: {ys.max()}")
-            print(f"{ys}")
-
-        if debug is True:
-            print(f"zs min: {zs.min()} max: {zs.max()}")
-            print(f"{zs}")
-
-        # same as for cylinder
-        if zs.max() != 0.:
-            zs -= zs.min()
-            zs /= zs.max()
-
-        coor = []
-        r = 400
-
-        # Sphere parametrization is:
-        # x(u, v) = a * cos(u) * sin(v)
-        # y(u, v) = a * sin(u) * sin(v)
-        # z(u, v) = a * cos(v)
-
-        for i in range(l):
-            r = 400 + 400 * zs[i]
-            r = 400 - 60 * zs[i]
-            coor.append(
-                [
-                    r * np.cos(xs[i]) * np.cos(ys[i]),
-                    r * np.sin(xs[i]) * np.cos(ys[i]),
-                    r * np.sin(ys[i]),
-                ]
-            )
-
-        return coor
-
-    def SphereCoords2(self, obj, debug=False):
-        """Calculate coord for sphere.
-
-        Sphere parametrization is:
-            x(u, v) = a * cos(u) * sin(v)
-            y(u, v) = a * sin(u) * sin(v)
-            z(u, v) = a * cos(v)
-        """
-        #
-        rad = obj.Radius
-
-        coor = []
-
-        stu = obj.stepU
-        stv = obj.stepV
-
-        for i in range(l):
-            coor.append(
-                [
-                    rad * np.cos(up) * np.sin(vp),
-                    rad * np.sin(up) * np.sin(vp),
-                    rad * np.cos(vp)
-                ]
-            )
-
-        if debug is True:
-            print(f"Sphere coord: {coor}")
-
-        return coor
-
+    @nurbs_trace.traced("Nurbs.createSurface")
     def createSurface(self, obj, poles=None):
         """Create the nurbs surface and aux parts."""
         # some debug information to tune things
-        debug = True
+        debug = log.isEnabledFor(logging.DEBUG)
         dbg_poles = False
         dbg_lists = False
         #
-        print(f"--- createSurface: {obj.model} ---")
+        log.debug("--- createSurface: %s ---", obj.model)
 
         starttime = time.time()
 
@@ -889,17 +1074,13 @@ class Nurbs(NurbsObj):
 
         # Keep here as probably it needed for cylinder and sphere
         # moving it afte the model type check, create error.
-        print("--- Test obj.poles")
+        log.debug("--- Test obj.polesData")
 
         if poles is not None:
-            print("poles are existing so coord are loaded")
-            cc = ""
-            for l in poles:
-                cc += str(l)
-
-            coor = eval(cc)
+            log.debug("poles are existing so coord are loaded")
+            coor = np.array(poles, dtype=float).reshape(-1, 3)
         else:
-            print("poles are None assign coor")
+            log.debug("poles are None assign coor")
             coor = [
                 [0, 0, 1], [1, 0, 1], [2, 0, 1], [3, 0, 1], [4, 0, 1],
                 [0, 1, 1], [1, 1, 0], [2, 1, 0], [3, 1, 0], [4, 1, 1],
@@ -910,27 +1091,21 @@ class Nurbs(NurbsObj):
                 [0, 4, 1], [1, 4, 1], [2, 4, 1], [3, 4, 1], [4, 4, 1],
             ]
 
-        # NOTE: added a debug flag to the coord amend methods
-
-        if obj.model == "NurbsCylinder":
-            coor = self.CylinderCoords(obj, coor, True)
-
-        elif obj.model == "NurbsSphere":
-            rad = 400
-            coor = self.SphereCoords2(obj, rad, True)
-            # coor = self.SphereCoords(obj, coor, True)
+        # cylinder, sphere and torus are exact rational primitives, the
+        # z of the generator grid is a displacement along the normal
+        primitive = None
 
-            # CHECK: Why amend knot_u and knot_w for sphere?
-            if obj.degree_u == 3:
-                l = [1.0 / (uc - 3) * i for i in range(uc - 2)]
-                obj.knot_u = [0, 0, 0, 0] + l + [1, 1, 1, 1]
+        if obj.model in nurbs_primitives.MODELS:
+            offsets = np.asarray(coor, dtype=float).reshape(
+                o_nNo_u, o_nNo_v, 3)[..., 2]
 
-            if obj.degree_v == 3:
-                l = [1.0 / (vc - 3) * i for i in range(vc - 2)]
-                obj.knot_v = [0, 0, 0, 0] + l + [1, 1, 1, 1]
-
-        else:
-            pass
+            try:
+                primitive = nurbs_primitives.from_model(
+                    obj.model, o_nNo_u, o_nNo_v, obj.Radius, obj.Radius2,
+                    obj.Height, offsets)
+            except ValueError as err:
+                log.error("%s: %s", obj.model, err)
+                return None
 
         # FIXME: old test cases?
         # knot_u=[0,0,0.2,0.4,0.6,0.8,1,1]
@@ -940,10 +1115,9 @@ class Nurbs(NurbsObj):
         # knot_v=[0,0,0.5,1,1]
 
         # Moved after calculations
-        # obj.poles = str(coor)
+        # nurbs_set_poles(obj, coor)
 
-        # FIXME: weights are not working
-        print(obj.weights)
+        log.debug("%s", obj.weights)
 
         try:
             weights = np.array(obj.weights)
@@ -958,177 +1132,159 @@ class Nurbs(NurbsObj):
 
         # TODO: probably move it near poles assign
 
-        obj.weights = list(np.ravel(weights))
+        if primitive is not None:
+            weights = primitive.weights
 
-        # This assign bs to self.bs, it is only the base object
-        bs = Part.BSplineSurface()
+        obj.weights = list(np.ravel(weights))
 
-        self.bs = bs
+        if primitive is None:
+            log.debug("Nurbs surface !!!")
+            poles2 = np.array(coor).reshape(o_nNo_u, o_nNo_v, 3)
 
-        # TODO: see if this could not be moved elsewhere
-        bs.increaseDegree(o_deg_u, o_deg_v)
+            # knot_u and knot_v hold the vectors of the built surface,
+            # see _set_degree, refine_knots and elevate_degree
+            deg_u = obj.degree_u
+            deg_v = obj.degree_v
+            wgs = self._pole_weights(obj, o_nNo_u * o_nNo_v)
 
-        if obj.model == "NurbsCylinder":
-            # cylinder - experimental  play with periodic nurbs
-            bs.setUPeriodic()
+            if wgs is not None:
+                wgs = wgs.reshape(o_nNo_u, o_nNo_v)
 
-        elif obj.model == "NurbsSphere":
-            # sphere - experimental  play with periodic nurbs
-            bs.setUPeriodic()
+            ku, mu = split_knots(knot_u)
+            kv, mv = split_knots(knot_v)
 
         else:
-            pass
-
-        if debug:
-            print("Data prior knots insertion")
-            print(f"knot_u: {knot_u}")
-            print(f"knot_v: {knot_v}")
-            print(f"bs.NbUKnots: {bs.NbUKnots}")
-            print(f"bs.NbVKnots: {bs.NbVKnots}")
+            poles2 = primitive.poles
 
-        #  mec: split knot vectors in single values vector and multiplicity vector
+            ku, mu = split_knots(primitive.knots_u)
+            kv, mv = split_knots(primitive.knots_v)
 
-        for i in range(0, len(knot_u)):
-            # if knot_u[i+1] > knot_u[i]:
-            bs.insertUKnot(knot_u[i], 1, kn_tol)
+            deg_u = primitive.degree_u
+            deg_v = primitive.degree_v
+            wgs = primitive.weights
 
-        for i in range(0, len(knot_v)):
-            # if knot_v[i+1] > knot_v[i]:
-            bs.insertVKnot(knot_v[i], 1, kn_tol)
+            obj.knot_u = primitive.knots_u.tolist()
+            obj.knot_v = primitive.knots_v.tolist()
 
         if debug:
-            print("Data after knots insertion")
-            print(f"Dim nodes U:{o_nNo_u} V:{o_nNo_v}")
-            print(f"Len coor: {len(coor)}")
-            # knot_u and knot_v are not affected.
-            t = bs.getPoles()
-            print("shape poles", len(t), len(t[0]))
-
-        if obj.model == "NurbsSurface":
-            print("Nurbs surface !!!")
-            poles2 = np.array(coor).reshape(o_nNo_u, o_nNo_v, 3)
-
-            ku = [1.0 / (o_nNo_u - 1) * i for i in range(o_nNo_u)]
-            kv = [1.0 / (o_nNo_v - 1) * i for i in range(o_nNo_v)]
+            log.debug("-- CreateSurface: Debug data passed to buildFPMK")
+            log.debug("poles2 (%s) shape: %s", len(poles2), poles2.shape)
+            log.debug("mu (%s): %s", len(mu), mu)
+            log.debug("mv (%s): %s", len(mv), mv)
+            log.debug("ku (%s): %s", len(ku), ku)
+            log.debug("kv (%s): %s", len(kv), kv)
+            log.debug("U nodes: %s", o_nNo_u)
+            log.debug("V nodes: %s", o_nNo_v)
+            log.debug("Weights: %s", wgs)
 
-            mu = [3] + [1] * (o_nNo_u - 2) + [3]
-            mv = [3] + [1] * (o_nNo_v - 2) + [3]
-
-            w_num = o_nNo_v * (o_nNo_u - 1)
-            wgs = [1.0 for i in range(w_num)]
-            # np.ones(nNodes_v * (nNodes_u - 1)).tolist()
+        # NOTE: Part.BSplineSurface.buildFromPolesMultsKnots
+        # Args:
+        #   poles (sequence of sequence of Base.Vector),
+        #   umults, vmults,
+        #   uknots, vknots,
+        #   uperiodic, vperiodic,
+        #   udegree, vdegree,
+        #   weights (sequence of sequence of float)
 
-        elif obj.model in ("NurbsSphere", "NurbsCylinder"):
-            # poles position swapped v,u instead of u,v in microelly calls
-            poles2 = np.array(coor).reshape(o_nNo_u, o_nNo_v, 3)
+        # FIXME:
+        #       - Check all occurencies of buildFromPolesMultsKnots as
+        #         parameters are swapped
 
-            kv = [1.0 / (o_nNo_v - 1) * i for i in range(o_nNo_v)]
-            ku = [1.0 / (o_nNo_u - 1) * i for i in range(o_nNo_u)]
+        self._build_args = (mu, mv, ku, kv, False, False, deg_u, deg_v)
+        key = nurbs_cache.surface_key(poles2, *self._build_args, weights=wgs)
+        entry = nurbs_cache.cache.get(key)
 
-            mu = [3] + [1] * (o_nNo_u - 2) + [3]
-            mv = [3] + [1] * (o_nNo_v - 2) + [3]
+        if entry is None:
+            # This assign bs to self.bs, it is only the base object
+            bs = Part.BSplineSurface()
 
-            # weights
-            w_num = o_nNo_v * (o_nNo_u - 1)
-            wgs = [1.0 for i in range(w_num)]
-            # np.ones(nNodes_v * (nNodes_u - 1)).tolist()
+            self.bs = bs
 
-            # microelly definition
-            # bs.buildFromPolesMultsKnots(poles2,
-            #    [3] + [1] * (nNodes_v - 2) + [3],
-            #    [2] + [1] * (nNodes_u - 2) + [2],
-            #    kv,ku, False, True, 3, 3,
-            #    1.0 * np.ones(nNodes_v * (nNodes_u - 1)),)
+            # TODO: see if this could not be moved elsewhere
+            bs.increaseDegree(o_deg_u, o_deg_v)
 
-        elif obj.model == "NurbsTorus":
-            # 7 x 4 array
-            coor = [
-                # line 1
-                [20.0, 0, -40], [60, 0, -40], [30, 0, 50], [0, 0, -40],
-                [20, 10, -40], [40, 10, -40], [40, 10, 55],
-                # line 2
-                [0, 10, -40], [20, 15, -40], [65, 15, -40], [60, 15, 75],
-                [35, 15, -40], [0, 20, 10], [0, 40, 20],
-                # line 3
-                [0, 45, 65], [0, 20, 20], [-20, 0, 0], [-40, 0, 20],
-                [-70, 0, 75], [-20, 0, 40], [-30, -10, 5],
-                # line 4
-                [-40, -10, 20], [-40, -10, 55], [-20, -20, 40], [5, -20, 5],
-                [0, -40, 30], [0, -45, 65], [5, -20, 10],
-            ]
+            if debug:
+                log.debug("Data prior knots insertion")
+                log.debug("knot_u: %s", knot_u)
+                log.debug("knot_v: %s", knot_v)
+                log.debug("bs.NbUKnots: %s", bs.NbUKnots)
+                log.debug("bs.NbVKnots: %s", bs.NbVKnots)
 
-            tt = 10 * np.array(coor)
+            #  mec: split knot vectors in single values vector and multiplicity vector
 
-            poles2 = tt.reshape(7, 4, 3)
+            for i in range(0, len(knot_u)):
+                # if knot_u[i+1] > knot_u[i]:
+                bs.insertUKnot(knot_u[i], 1, kn_tol)
 
-            ku = [0, 0.2, 0.4, 0.5, 0.7, 0.8, 1]
-            kv = [0, 0.4, 0.6, 1]
-            mu = [2, 1, 1, 1, 1, 1, 2]
-            mv = [0, 0.4, 0.6, 1]
-            w_num = o_nNo_v * (o_nNo_u - 1)
-            wgs = [1.0 for i in range(w_num)]
-            # np.ones(nNodes_v * (nNodes_u - 1)).tolist()
+            for i in range(0, len(knot_v)):
+                # if knot_v[i+1] > knot_v[i]:
+                bs.insertVKnot(knot_v[i], 1, kn_tol)
 
-        if debug:
-            debug_spline(bs, "CreateSurface", 0)
+            if debug:
+                log.debug("Data after knots insertion")
+                log.debug("Dim nodes U:%s V:%s", o_nNo_u, o_nNo_v)
+                log.debug("Len coor: %s", len(coor))
+                # knot_u and knot_v are not affected.
+                t = bs.getPoles()
+                log.debug("shape poles %s %s", len(t), len(t[0]))
 
-        if debug:
-            print("-- CreateSurface: Debug data passed to buildFPMK")
-            print(f"poles2 ({len(poles2)}) shape: {poles2.shape}")
-            print(f"mu ({len(mu)}): {mu}")
-            print(f"mv ({len(mv)}): {mv}")
-            print(f"ku ({len(ku)}): {ku}")
-            print(f"kv ({len(kv)}): {kv}")
-            print(f"U nodes: {o_nNo_u}")
-            print(f"V nodes: {o_nNo_v}")
-            print(f"Weights: ({len(wgs)}) : {wgs}")
+            if debug:
+                debug_spline(bs, "CreateSurface", 0)
 
-        # NOTE: Part.BSplineSurface.buildFromPolesMultsKnots
-        # Args:
-        #   poles (sequence of sequence of Base.Vector),
-        #   umults, vmults,
-        #   uknots, vknots,
-        #   uperiodic, vperiodic,
-        #   udegree, vdegree,
-        #   weights (sequence of sequence of float)
+            bs_poles = npa_to_pts(poles2)
 
-        # FIXME:
-        #       - Weights are not correct see why
-        #       - Check all occurencies of buildFromPolesMultsKnots as
-        #         parameters are swapped
+            if wgs is None:
+                bs.buildFromPolesMultsKnots(
+                    bs_poles, mu, mv, ku, kv, False, False, deg_u, deg_v)
+            else:
+                bs.buildFromPolesMultsKnots(
+                    bs_poles, mu, mv, ku, kv, False, False, deg_u, deg_v,
+                    wgs.tolist())
 
-        bs_poles = npa_to_pts(poles2)
+            entry = nurbs_cache.cache.put(key, bs)
+        else:
+            log.debug("surface taken from the cache")
+            bs = entry.surface()
+            self.bs = bs
 
-        bs.buildFromPolesMultsKnots(
-            bs_poles, mu, mv, ku, kv, False, False, 3, 3)  # , wgs)
+        self._cache_entry = entry
 
         # -----------------------------------------
         # --- Assign poles (and weight) to obj
         # -----------------------------------------
 
-        # TODO: assign calculated poles to obj.poles
         # FIXME: Seems to be not working flawlessy as modifying
         #     stepU will not result is a correct operation.
         #     it prints "prop: stepU except executed"
 
-        obj.poles = np.array2string(
-            poles2, precision=10, separator=',')
+        # the generator grid is stored, primitive poles are derived
+        # from it on every build
+        nurbs_set_poles(obj, np.asarray(coor, dtype=float).reshape(
+            o_nNo_u, o_nNo_v, 3))
+
+        # state used by the local update, see _update_local
+        self._built_poles = poles2.reshape(-1, 3).copy()
+        self._built_weights = (
+            None if wgs is None else np.array(wgs, dtype=float).ravel())
+        self._flat_u = full_knots(bs.getUKnots(), bs.getUMultiplicities())
+        self._flat_v = full_knots(bs.getVKnots(), bs.getVMultiplicities())
+        self.dirty_spans = None
 
         # ----------------------------------------
         # -- create aux parts
         # ----------------------------------------
 
-        print("--- aux parts ---")
+        log.debug("--- aux parts ---")
         # Solid
 
         if obj.solid:
-            obj.Shape = self.create_solid(bs)
+            obj.Shape = entry.derived("solid", lambda: self.create_solid(bs))
         else:
             if FreeCAD.ParamGet(
                     "User parameter:Plugins/nurbs").GetBool(
                         "createNurbsShape", True):
 
-                obj.Shape = bs.toShape()
+                obj.Shape = entry.face()
 
         # Grids
 
@@ -1137,19 +1293,21 @@ class Nurbs(NurbsObj):
 
         if obj.grid:
             if obj.gridobj is not None:
-                vis = obj.gridobj.ViewObject.Visibility
+                if FreeCAD.GuiUp:
+                    vis = obj.gridobj.ViewObject.Visibility
                 FreeCAD.ActiveDocument.removeObject(obj.gridobj.Name)
 
             obj.gridobj = self.create_grid(bs, obj.gridCount)
             obj.gridobj.Label = "Nurbs Grid"
-            obj.gridobj.ViewObject.Visibility = vis
+            if FreeCAD.GuiUp:
+                obj.gridobj.ViewObject.Visibility = vis
 
         if 0 and obj.base:
             # create the socket box
             mx = np.array(coor).reshape(o_nNo_v, o_nNo_u, 3)
-            print("create box")
+            log.debug("create box")
 
-            print((mx.shape))
+            log.debug("%s", mx.shape)
             a0 = tuple(mx[0, 0])
             b0 = tuple(mx[0, -1])
             c0 = tuple(mx[-1, -1])
@@ -1160,7 +1318,7 @@ class Nurbs(NurbsObj):
             b = tuple(mx[0, -1] + [0, 0, -bh])
             c = tuple(mx[-1, -1] + [0, 0, -bh])
             d = tuple(mx[-1, 0] + [0, 0, -bh])
-            print((a, b, c, d))
+            log.debug("%s %s %s %s", a, b, c, d)
 
             lls = [
                 Part.makeLine(a0, b0),
@@ -1222,7 +1380,7 @@ class Nurbs(NurbsObj):
             obj.Shape = sol
 
         # create a pole grid with spines
-        print("--- aux parts 2 ---")
+        log.debug("--- aux parts 2 ---")
         # vis = False
         vis = True
 
@@ -1232,23 +1390,31 @@ class Nurbs(NurbsObj):
         except:
             pass
 
-        obj.polgrid = self.create_uv_grid()
-        obj.polgrid.Label = "Pole Grid"
-        obj.polgrid.ViewObject.Visibility = vis
+        vp = self._view_proxy(obj)
+
+        if vp is not None:
+            # pole grid and poles are drawn by the view provider
+            obj.polgrid = None
+            vp.update_control_net(self._net_poles())
+        else:
+            obj.polgrid = self.create_uv_grid()
+            obj.polgrid.Label = "Pole Grid"
+            if FreeCAD.GuiUp:
+                obj.polgrid.ViewObject.Visibility = vis
 
         nurbstime = time.time()
 
-        print("XB")
+        log.debug("XB")
 
         polesobj = None
         comptime = time.time()
 
-        print(f"Obj polpoints: {obj.polpoints}")
+        log.debug("Obj polpoints: %s", obj.polpoints)
 
-        if obj.polpoints:
+        if obj.polpoints and vp is None:
             # create the poles for visualization
             # the pole point cloud
-            pts = [FreeCAD.Vector(tuple(c)) for c in coor]
+            pts = [FreeCAD.Vector(*c) for c in poles2.reshape(-1, 3).tolist()]
             vts = [Part.Vertex(pp) for pp in pts]
 
             # and the surface
@@ -1266,59 +1432,61 @@ class Nurbs(NurbsObj):
 
         endtime = time.time()
 
-        print(
-            (
-                "create nurbs components, surface time ",
-                round(nurbstime - starttime, 2),
-                round(comptime - nurbstime, 2),
-                round(endtime - comptime, 2),
-            )
-        )
+        log.debug(
+            "create nurbs components, surface time %.2f %.2f %.2f",
+            nurbstime - starttime, comptime - nurbstime, endtime - comptime)
         # print("--- aux parts end ---")
         return polesobj
 
     @staticmethod
     def _set_degree(obj, uc, vc):
-        """Set obj degree based on knot_u and jnot_v.
+        """Set obj knot vectors based on the degrees and the pole counts.
+
+        Knot vectors matching the pole count and the degree are kept,
+        e.g. after a knot refinement or a degree change, other ones are
+        set to the uniform vector of the degree. Degrees are limited to
+        the pole count - 1.
 
         made to reduce complexity of createSurface.
         """
         #
-        if obj.degree_u == 1:
-            l = [1.0 / (uc - 1) * i for i in range(uc)]
-            obj.knot_u = [0] + l + [1]
-        elif obj.degree_u == 1:
-            l = [1.0 / (uc - 2) * i for i in range(uc - 1)]
-            obj.knot_u = [0, 0] + l + [1, 1]
-        elif obj.degree_u == 3:
-            l = [1.0 / (uc - 3) * i for i in range(uc - 2)]
-            obj.knot_u = [0, 0, 0] + l + [1, 1, 1]
-        else:
-            print("obj_degree_u is > 3")
-
-        if obj.degree_v == 1:
-            l = [1.0 / (vc - 1) * i for i in range(vc)]
-            obj.knot_v = [0] + l + [1]
-        elif obj.degree_v == 2:
-            l = [1.0 / (vc - 2) * i for i in range(vc - 1)]
-            obj.knot_v = [0, 0] + l + [1, 1]
-        elif obj.degree_v == 3:
-            l = [1.0 / (vc - 3) * i for i in range(vc - 2)]
-            obj.knot_v = [0, 0, 0] + l + [1, 1, 1]
-        else:
-            print("obj_degree_v is > 3")
+        for dd, count in (("u", uc), ("v", vc)):
+            degree = min(max(getattr(obj, "degree_" + dd), 1), count - 1)
+
+            if degree != getattr(obj, "degree_" + dd):
+                log.warning("degree_%s set to %s for %s poles",
+                            dd, degree, count)
+                setattr(obj, "degree_" + dd, degree)
+
+            knots = getattr(obj, "knot_" + dd)
+
+            if nurbs_refine.valid_knots(knots, count, degree):
+                continue
+
+            if degree == 3:
+                # the vector always built before, ends of multiplicity 3
+                knots = ([0.0, 0.0] + [i / (count - 1) for i in range(count)]
+                         + [1.0, 1.0])
+            else:
+                knots = nurbs_degree.uniform_knots(count, degree)
+
+            setattr(obj, "knot_" + dd, knots)
 
         return obj.knot_u, obj.knot_v
 
     def getBS(self):
-        """Docstring missing."""
+        """Return the surface, rebuild it if missing.
+
+        After a restore or a proxy reset the surface is rebuilt, a known
+        state is taken from nurbs_cache.
+        """
         try:
             rc = self.bs
         except:
-            print("BSPline no longer exists needs to be recalculated ....")
+            log.info("BSPline no longer exists, rebuilding it")
             # uc = self.obj2.nNodes_v
             # vc = self.obj2.nNodes_u
-            self.createSurface(self.obj2, self.obj2.poles)
+            self.createSurface(self.obj2, nurbs_get_poles(self.obj2))
             rc = self.bs
         return rc
 
@@ -1336,11 +1504,7 @@ class Nurbs(NurbsObj):
                     )
             return ps
         else:
-            print("------ GetPoints ------")
-            t = eval(str(self.obj2.poles))
-            print(t)
-            print("-------------------------")
-            return eval(t[0])
+            return nurbs_get_poles(self.obj2)
 
     def togrid(self, ps):
         """Return points to 2D grid."""
@@ -1348,12 +1512,20 @@ class Nurbs(NurbsObj):
         self.g = np.array(ps).reshape(self.obj2.nNodes_v, self.obj2.nNodes_u, 3)
         return self.g
 
+    @nurbs_trace.traced("Nurbs.showGriduv")
     def showGriduv(self):
         """Recompute and show the Pole grid."""
         #
         starttime = time.time()
         gg = self.g
 
+        vp = self._view_proxy()
+
+        if vp is not None and getattr(self, "bs", None) is not None:
+            # coordinates are changed in place, no document object
+            vp.update_control_net(self._net_poles())
+            return
+
         try:
             if not self.calculatePoleGrid:
                 return
@@ -1372,6 +1544,7 @@ class Nurbs(NurbsObj):
                 if v < vc - 1:
                     ls.append(Part.makeLine(tuple(gg[u][v]), tuple(gg[u][v + 1])))
 
+        nurbs_trace.count("Part.makeLine", len(ls))
         comp = Part.makeCompound(ls)
 
         if self.grid is not None:
@@ -1386,7 +1559,7 @@ class Nurbs(NurbsObj):
         FreeCAD.activeDocument().recompute()
         FreeCADGui.updateGui()
         endtime = time.time()
-        print(("create PoleGrid time", endtime - starttime))
+        log.debug("create PoleGrid time %.2f", endtime - starttime)
 
     def setpointZ(self, u, v, h=0, w=20):
         """Set height and weight of a pole point."""
@@ -1400,7 +1573,7 @@ class Nurbs(NurbsObj):
             wl[v * self.obj2.nNodes_u + u] = w
             self.obj2.weights = wl
         except:
-            print()
+            log.debug("setpointZ failed", exc_info=True)
 
     def setpointRelativeZ(self, u, v, h=0, w=0, update=False):
         """Set relative height and weight of a pole point."""
@@ -1409,7 +1582,7 @@ class Nurbs(NurbsObj):
         # self.g[v][u][2] = self.gBase[v][u][2] + h
         # unrestricted
         self.g[v][u][2] = self.gBase[v][u][2] + 100 * np.tan(0.5 * np.pi * h / 101)
-        print(f"set  rel h {h}, height {self.g[v][u][2]}")
+        log.debug("set  rel h %s, height %s", h, self.g[v][u][2])
 
         if update:
             self.gBase = self.g.copy()
@@ -1419,35 +1592,91 @@ class Nurbs(NurbsObj):
             wl[v * self.obj2.nNodes_u + u] = w
             self.obj2.weights = wl
         except:
-            print()
+            log.debug("setpointRelativeZ failed", exc_info=True)
 
     def movePoint(self, u, v, dx, dy, dz):
         """Move relative to a pole point."""
         #
-        FreeCAD.ActiveDocument.openTransaction(f"move Point {str((u, v, dx, dy, dz))}")
-        # EDITED : g is
-        self.g[v][u][0] += dx
-        self.g[v][u][1] += dy
-        self.g[v][u][2] += dz
+        with self.edit_batch(f"move Point {str((u, v, dx, dy, dz))}") as batch:
+            batch.move((v, u), (dx, dy, dz))
+
+    def _weight_grid(self):
+        """Return the weights of the active batch or of the object.
+
+        Returns:
+            np_array: (rows, cols) weights of the pole grid self.g
+        """
+        #
+        batch = getattr(self, "_batch", None)
 
-        self.updatePoles()
-        self.showGriduv()
-        FreeCAD.ActiveDocument.commitTransaction()
+        if batch is not None:
+            return batch.weights
 
+        rows, cols = self.g.shape[:2]
+        weights = np.asarray(self.obj2.weights, dtype=float)
+        if weights.size != rows * cols:
+            weights = np.ones(rows * cols)
+
+        return weights.reshape(rows, cols)
+
+    @contextlib.contextmanager
+    def edit_batch(self, name="Nurbs edit"):
+        """Collect pole edits, rebuild the surface once at the end.
+
+        The edits are done on the yielded PoleBatch or directly on
+        self.g. The outermost batch opens one transaction, on exit it
+        stores the weights, runs updatePoles and showGriduv and commits.
+        Nested batches join the outer one. On an exception the poles
+        are restored and the transaction aborted.
+
+            with obj.Proxy.edit_batch("bumps") as batch:
+                for i in range(500):
+                    batch.move((i % rows, i % cols), (0, 0, 1))
+
+        Args:
+            name (str): transaction name. Defaults to "Nurbs edit"
+
+        Yields:
+            PoleBatch
+        """
+        #
+        if getattr(self, "_batch", None) is not None:
+            yield self._batch
+            return
+
+        doc = self.obj2.Document
+        saved = self.g.copy()
+
+        self._batch = PoleBatch(self, self._weight_grid())
+        doc.openTransaction(name)
+
+        try:
+            yield self._batch
+
+        except BaseException:
+            self.g = saved
+            doc.abortTransaction()
+            raise
+
+        else:
+            if self._batch.weights_changed:
+                self.obj2.weights = self._batch.weights.ravel().tolist()
+
+            self.updatePoles()
+            self.showGriduv()
+            doc.commitTransaction()
+
+        finally:
+            self._batch = None
+
+    @nurbs_trace.traced("Nurbs.elevateUline")
     def elevateUline(self, vp, height=40):
         """Change the height of all poles with the same u value."""
         #
-        FreeCAD.ActiveDocument.openTransaction("elevate ULine" + str([vp, height]))
-
         uc = self.obj2.nNodes_u
-        # vc = self.obj2.nNodes_v
-
-        for i in range(1, uc - 1):
-            self.g[vp][i][2] = height
 
-        self.updatePoles()
-        self.showGriduv()
-        FreeCAD.ActiveDocument.commitTransaction()
+        with self.edit_batch("elevate ULine" + str([vp, height])) as batch:
+            batch.set((vp, slice(1, uc - 1)), height, axis=2)
 
     def elevateVline(self, vp, height=40):
         """Change height of all poles with the same v value."""
@@ -1467,259 +1696,812 @@ class Nurbs(NurbsObj):
         # self.showGriduv()
         # FreeCAD.ActiveDocument.commitTransaction()
 
+    @nurbs_trace.traced("Nurbs.elevateRectangle")
     def elevateRectangle(self, v, u, dv, du, height=50):
         """Change height of all poles inside a pole grid rectangle."""
         #
-        FreeCAD.ActiveDocument.openTransaction(
-            "elevate rectangle " + str((u, v, dv, du, height))
-        )
+        # poles outside the grid are skipped
+        sel = (slice(max(u, 0), u + du + 1), slice(max(v, 0), v + dv + 1))
 
-        # TODO: See why these variables are present here
-        # uc = self.obj2.nNodes_u
-        # vc = self.obj2.nNodes_v
-
-        for iv in range(v, v + dv + 1):
-            for iu in range(u, u + du + 1):
-                try:
-                    self.g[iu][iv][2] = height
-                except:
-                    pass
-
-        self.updatePoles()
-        self.showGriduv()
-        FreeCAD.ActiveDocument.commitTransaction()
+        with self.edit_batch(
+                "elevate rectangle " + str((u, v, dv, du, height))) as batch:
+            batch.set(sel, height, axis=2)
 
+    @nurbs_trace.traced("Nurbs.elevateCircle")
     def elevateCircle(self, u=20, v=30, radius=10, height=60):
         """Change the height for poles around a central pole."""
         #
-        FreeCAD.ActiveDocument.openTransaction(
-            "elevate Circle " + str((u, v, radius, height))
-        )
+        # poles within radius in xy of the center pole set to height
+        brush = nurbs_brush.Brush(radius, height, "constant", "absolute")
 
-        uc = self.obj2.nNodes_u
-        vc = self.obj2.nNodes_v
+        with self.edit_batch("elevate Circle " + str((u, v, radius, height))):
+            brush.apply(self.g, self.g[u, v].copy())
 
-        g = self.g
-        for iv in range(vc):
-            for iu in range(uc):
-                try:
-                    if (g[iu][iv][0] - g[u][v][0]) ** 2 + (
-                            g[iu][iv][1] - g[u][v][1]) ** 2 <= radius**2:
+    @nurbs_trace.traced("Nurbs.elevateCircle2")
+    def elevateCircle2(self, u=20, v=30, radius=10, height=60):
+        """Change the height for poles around a cenral pole."""
+        #
+        # square window, poles outside the grid are skipped
+        sel = (slice(max(u - radius, 0), u + radius + 1),
+               slice(max(v - radius, 0), v + radius + 1))
 
-                        g[iu][iv][2] = height
-                except:
-                    pass
-        self.g = g
+        with self.edit_batch(
+                "elevate Circle " + str((u, v, radius, height))) as batch:
+            batch.set(sel, height, axis=2)
 
-        self.updatePoles()
-        self.showGriduv()
-        FreeCAD.ActiveDocument.commitTransaction()
+    @nurbs_trace.traced("Nurbs.brush")
+    def brush(self, brush, centers):
+        """Apply the dabs of a brush stroke in one edit batch.
 
-    def elevateCircle2(self, u=20, v=30, radius=10, height=60):
-        """Change the height for poles around a cenral pole."""
+        Called inside an outer edit_batch the rebuild waits for the
+        outer batch and the coarse preview is shown instead, so a stroke
+        can be fed one mouse event at a time.
+
+        Args:
+            brush (nurbs_brush.Brush): the brush
+            centers (list): dab centers, see Brush.select
+        """
         #
-        FreeCAD.ActiveDocument.openTransaction(
-            "elevate Circle " + str((u, v, radius, height))
-        )
+        nested = getattr(self, "_batch", None) is not None
 
-        # TODO: See why these variables are present here
-        # uc = self.obj2.nNodes_u
-        # vc = self.obj2.nNodes_v
+        with self.edit_batch(f"brush {brush.mode}") as batch:
+            index = brush.neighbourhood(self.g)
 
-        g = self.g
+            for center in centers:
+                brush.apply(self.g, center, batch.weights, index)
 
-        for iv in range(v - radius, v + radius + 1):
-            for iu in range(u - radius, u + radius + 1):
-                try:
-                    g[iu][iv][2] = height
-                except:
-                    pass
-        self.g = g
+            if brush.target == "weights":
+                batch.weights_changed = True
 
-        self.updatePoles()
-        self.showGriduv()
-        FreeCAD.ActiveDocument.commitTransaction()
+            if nested:
+                batch.preview()
 
+    @nurbs_trace.traced("Nurbs.createWaves")
     def createWaves(self, height=10, depth=-5):
         """Crate wave pattern over all."""
         #
-        FreeCAD.ActiveDocument.openTransaction("create waves " + str((height, depth)))
+        rows, cols = self.g.shape[:2]
+        iu, iv = np.indices((rows, cols))
+        inner = (iu > 0) & (iu < rows - 1) & (iv > 0) & (iv < cols - 1)
+        even = (iu + iv) % 2 == 0
 
-        uc = self.obj2.nNodes_u
-        vc = self.obj2.nNodes_v
+        with self.edit_batch("create waves " + str((height, depth))) as batch:
+            batch.set(inner & even, height, axis=2)
+            batch.set(inner & ~even, depth, axis=2)
 
-        for iv in range(1, vc - 1):
-            for iu in range(1, uc - 1):
-                if (iv + iu) % 2 == 0:
-                    self.g[iu][iv][2] = height
-                else:
-                    self.g[iu][iv][2] = depth
+    def _editable_knots(self):
+        """Return True if knots and degrees of the model can be changed."""
+        #
+        fp = self.obj2
 
-        self.updatePoles()
-        self.showGriduv()
-        FreeCAD.ActiveDocument.commitTransaction()
+        if fp.model != "NurbsSurface":
+            log.warning("%s: the knots of a %s are set by the model",
+                        fp.Label, fp.model)
+            return False
 
-    def addUline(self, vp, pos=0.5):
-        """Insert a line of poles after vp, pos is relative to the next Uline."""
-        # FIXME: check why the code is commented out
+        self.getBS()
+        return True
 
-        FreeCAD.ActiveDocument.openTransaction("add ULine " + str((vp, pos)))
+    def _structure_data(self, weights):
+        """Return the homogeneous poles as a (nNodes_u, nNodes_v, 4) array.
 
-        # TODO: See why these variables are present here
-        # uc = self.obj2.nNodes_u
-        # -vc = self.obj2.nNodes_v
+        Poles are in the layout of the built surface, nNodes_u rows of
+        nNodes_v poles, (w * P, w) so knot insertion and degree changes
+        keep the rational surface.
+
+        Args:
+            weights (np_array): (rows, cols) weights, see _weight_grid
+        """
+        #
+        nu, nv = self.obj2.nNodes_u, self.obj2.nNodes_v
+        w = weights.reshape(nu, nv, 1)
+
+        return np.concatenate((self.g.reshape(nu, nv, 3) * w, w), axis=-1)
+
+    def _set_structure(self, batch, data, ku, kv, deg_u, deg_v):
+        """Store poles, weights, knots and degrees of a new structure.
+
+        Args:
+            batch (PoleBatch): the active edit batch
+            data (np_array): (nu, nv, 4) homogeneous poles, see
+                _structure_data
+            ku (array_like): flat knot vector in u
+            kv (array_like): flat knot vector in v
+            deg_u (int): degree in u
+            deg_v (int): degree in v
+        """
+        #
+        fp = self.obj2
+        nu, nv = data.shape[:2]
+
+        # no regeneration of the poles from the new counts
+        self._resizing = True
+        try:
+            fp.nNodes_u = nu
+            fp.nNodes_v = nv
+            fp.degree_u = int(deg_u)
+            fp.degree_v = int(deg_v)
+        finally:
+            self._resizing = False
+
+        fp.knot_u = np.asarray(ku, dtype=float).tolist()
+        fp.knot_v = np.asarray(kv, dtype=float).tolist()
+
+        w = data[..., 3:]
+        self.g = (data[..., :3] / w).reshape(nv, nu, 3)
+        batch.weights = w.reshape(nv, nu)
+        batch.weights_changed = True
+
+    @nurbs_trace.traced("Nurbs.refine_knots")
+    def refine_knots(self, knots_u=(), knots_v=(), name=None):
+        """Insert knots, the surface is not changed.
+
+        All the knots are inserted in one pass, poles, weights, knot_u,
+        knot_v and the pole counts are updated together in one edit
+        batch. A u knot adds a row of the built layout, a v knot a
+        column, see _structure_data.
+
+        Args:
+            knots_u (list): knots to insert in u, a value may be
+                repeated to insert it more times. Defaults to ()
+            knots_v (list): knots to insert in v. Defaults to ()
+            name (str): transaction name. Defaults to None
+
+        Returns:
+            bool: False if the knots of the model can not be changed
+        """
+        #
+        if not self._editable_knots():
+            return False
+
+        if len(knots_u) == 0 and len(knots_v) == 0:
+            return True
+
+        fp = self.obj2
+
+        if name is None:
+            name = "refine knots " + str((list(knots_u), list(knots_v)))
 
-        if pos <= 0:
-            pos = 0.00001
-        if pos >= 1:
-            pos = 1 - 0.00001
-        pos = 1 - pos
+        with self.edit_batch(name) as batch:
+            data = self._structure_data(batch.weights)
 
-        g = self.g
+            data, ku = nurbs_refine.refine_knots(
+                data, fp.knot_u, fp.degree_u, knots_u, axis=0)
+            data, kv = nurbs_refine.refine_knots(
+                data, fp.knot_v, fp.degree_v, knots_v, axis=1)
 
+            self._set_structure(batch, data, ku, kv, fp.degree_u, fp.degree_v)
+
+        return True
+
+    @nurbs_trace.traced("Nurbs.elevate_degree")
+    def elevate_degree(self, times_u=1, times_v=0):
+        """Raise the degrees, the surface is not changed.
+
+        Unclamped knot vectors are clamped to the domain, poles,
+        weights, knots and degrees are updated in one edit batch.
+
+        Args:
+            times_u (int): increment in u. Defaults to 1
+            times_v (int): increment in v. Defaults to 0
+
+        Returns:
+            bool: False if the degrees of the model can not be changed
         """
-        vline = []
-        for i in range(uc):
-            vline.append(
-                [
-                    (g[vp - 1][i][0] + g[vp][i][0]) / 2,
-                    (g[vp - 1][i][1] + g[vp][i][1]) / 2,
-                    0,
-                ]
-            )  # (g[vp-1][i][2]+g[vp][i][2])/2
-
-        vline = []
-        for i in range(uc):
-            vline.append(
-                [
-                    (pos * g[vp - 1][i][0] + (1 - pos) * g[vp][i][0]),
-                    (pos * g[vp - 1][i][1] + (1 - pos) * g[vp][i][1]),
-                    0,
-                ]
-            )  # (g[vp-1][i][2]+g[vp][i][2])/2
+        #
+        if not self._editable_knots():
+            return False
+
+        fp = self.obj2
+
+        with self.edit_batch(
+                "elevate degree " + str((times_u, times_v))) as batch:
+            data = self._structure_data(batch.weights)
+
+            data, ku, pu = nurbs_degree.elevate_degree(
+                data, fp.knot_u, fp.degree_u, times_u, axis=0)
+            data, kv, pv = nurbs_degree.elevate_degree(
+                data, fp.knot_v, fp.degree_v, times_v, axis=1)
+
+            self._set_structure(batch, data, ku, kv, pu, pv)
+
+        return True
+
+    @nurbs_trace.traced("Nurbs.reduce_degree")
+    def reduce_degree(self, times_u=1, times_v=0, tol=None):
+        """Lower the degrees if the surface moves less than tol.
+
+        Args:
+            times_u (int): decrement in u. Defaults to 1
+            times_v (int): decrement in v. Defaults to 0
+            tol (float): maximum deviation. Defaults to the
+                "DegreeTolerance" parameter, 0.01
+
+        Returns:
+            float: the deviation, the surface is not changed if it is
+                over tol, None if the degrees of the model can not be
+                changed
         """
+        #
+        if not self._editable_knots():
+            return None
 
-        vline = np.array(vline)
+        if tol is None:
+            tol = FreeCAD.ParamGet(
+                "User parameter:Plugins/nurbs").GetFloat(
+                    "DegreeTolerance", 0.01)
 
-        gg = np.concatenate((g[:vp], [vline], g[vp:]))
-        self.g = gg
+        fp = self.obj2
+        data = self._structure_data(self._weight_grid())
 
-        self.obj2.nNodes_v += 1
+        # the error is measured on the projected poles
+        data, ku, pu, eu = nurbs_degree.reduce_degree(
+            data, fp.knot_u, fp.degree_u, times_u, axis=0, rational=True)
+        data, kv, pv, ev = nurbs_degree.reduce_degree(
+            data, fp.knot_v, fp.degree_v, times_v, axis=1, rational=True)
 
-        self.updatePoles()
-        self.showGriduv()
-        FreeCAD.ActiveDocument.commitTransaction()
+        err = eu + ev
 
-    def addVline(self, vp, pos=0.5):
-        """Insert a line of poles after vp, pos is relative to the next Vline."""
-        # FreeCAD.ActiveDocument.openTransaction("add Vline " + str((vp,pos)))
+        if err > tol:
+            log.warning("%s: degree not reduced, deviation %.4g > %.4g",
+                        fp.Label, err, tol)
+            return err
 
-        # uc = self.obj2.nNodes_u
-        vc = self.obj2.nNodes_v
+        # the batch is opened only for an accepted reduction
+        with self.edit_batch(
+                "reduce degree " + str((times_u, times_v))) as batch:
+            self._set_structure(batch, data, ku, kv, pu, pv)
+
+        return err
 
-        if pos <= 0:
-            pos = 0.00001
-        if pos >= 1:
-            pos = 1 - 0.00001
-        pos = 1 - pos
+    def set_surface(self, data, name="set surface"):
+        """Replace poles, weights, knots and degrees in one edit batch.
 
-        g = self.g
-        g = g.swapaxes(0, 1)
+        Args:
+            data (SurfaceData): the new surface, u along the rows of the
+                built layout, see _structure_data
+            name (str): transaction name. Defaults to "set surface"
 
-        vline = []
-        for i in range(vc):
-            vline.append(
-                [
-                    (pos * g[vp - 1][i][0] + (1 - pos) * g[vp][i][0]),
-                    (pos * g[vp - 1][i][1] + (1 - pos) * g[vp][i][1]),
-                    0,
-                ]
-            )  # (g[vp-1][i][2]+g[vp][i][2])/2
+        Returns:
+            bool: False if the knots of the model can not be changed
+        """
+        #
+        if not self._editable_knots():
+            return False
 
-        vline = np.array(vline)
+        with self.edit_batch(name) as batch:
+            self._set_structure(
+                batch, data.homogeneous, data.knots_u, data.knots_v,
+                data.degree_u, data.degree_v)
 
-        gg = np.concatenate((g[:vp], [vline], g[vp:]))
-        gg = gg.swapaxes(0, 1)
-        self.g = gg
+        return True
 
-        self.obj2.nNodes_u += 1
+    @nurbs_trace.traced("Nurbs.interpolate")
+    def interpolate(self, points, degree_u=3, degree_v=3, method="chord"):
+        """Make the surface pass through a (n, m, 3) grid of points.
 
-        self.updatePoles()
-        self.showGriduv()
-        # FreeCAD.ActiveDocument.commitTransaction()
+        The surface gets n x m poles, see nurbs_interpolate.
+
+        Args:
+            points (array_like): (n, m, 3) points
+            degree_u (int): degree in u. Defaults to 3
+            degree_v (int): degree in v. Defaults to 3
+            method (str): "uniform", "chord" or "centripetal"
+                parameterization. Defaults to "chord"
+
+        Returns:
+            bool: False if the knots of the model can not be changed
+        """
+        #
+        data = nurbs_interpolate.interpolate_surface(
+            points, degree_u, degree_v, method)
+
+        return self.set_surface(
+            data, "interpolate " + str(data.poles.shape[:2]))
+
+    @nurbs_trace.traced("Nurbs.fit")
+    def fit(self, chunks, count_u=None, count_v=None, degree_u=3,
+            degree_v=3, smoothing=0.0, fairing=0.0):
+        """Fit the surface to a point cloud read in chunks.
+
+        The points are parameterized by projection on the current
+        surface, see nurbs_fit.
+
+        Args:
+            chunks (iterable): (n, 3) point arrays, see
+                nurbs_fit.iter_chunks and nurbs_fit.read_chunks
+            count_u (int): poles in u. Defaults to nNodes_u
+            count_v (int): poles in v. Defaults to nNodes_v
+            degree_u (int): degree in u. Defaults to 3
+            degree_v (int): degree in v. Defaults to 3
+            smoothing (float): membrane weight. Defaults to 0.0
+            fairing (float): thin plate weight. Defaults to 0.0
+
+        Returns:
+            float: rms distance of the points, None if the knots of the
+                model can not be changed
+        """
+        #
+        if not self._editable_knots():
+            return None
+
+        bs = self.getBS()
+        fp = self.obj2
+
+        base = SurfaceData(
+            self._net_poles(), self._built_weights,
+            self._flat_u, self._flat_v, bs.UDegree, bs.VDegree)
+
+        data, rms = nurbs_fit.fit_surface(
+            chunks, base,
+            fp.nNodes_u if count_u is None else count_u,
+            fp.nNodes_v if count_v is None else count_v,
+            degree_u, degree_v, smoothing, fairing, sf=bs)
+
+        self.set_surface(data, "fit " + str(data.poles.shape[:2]))
+
+        return rms
+
+    def addUline(self, vp, pos=0.5):
+        """Insert a line of poles between the Ulines vp - 1 and vp.
+
+        The line is added by inserting one u knot, so the surface is
+        not changed, pos is the relative position of the knot from the
+        parameter of the line vp - 1 to the one of the line vp.
+        """
+        #
+        self.getBS()
+        t = nurbs_refine.knot_between(
+            self.obj2.knot_u, self.obj2.degree_u, vp, pos)
+
+        return self.refine_knots(
+            knots_u=[t], name="add ULine " + str((vp, pos)))
+
+    def addVline(self, vp, pos=0.5):
+        """Insert a line of poles between the Vlines vp - 1 and vp.
+
+        See addUline, one v knot is inserted.
+        """
+        #
+        self.getBS()
+        t = nurbs_refine.knot_between(
+            self.obj2.knot_v, self.obj2.degree_v, vp, pos)
+
+        return self.refine_knots(
+            knots_v=[t], name="add Vline " + str((vp, pos)))
 
     def addS(self, vp):
         """Add hard edge on left Soft transition, hard edge on right."""
         # TODO: check docstring auto translated from german
-        FreeCAD.ActiveDocument.openTransaction("add vertical S " + str(vp))
-
-        # uc = self.obj2.nNodes_u
-        vc = self.obj2.nNodes_v
-
-        g = self.g
-        g = g.swapaxes(0, 1)
-
-        vline = []
-        for i in range(vc):
-            pos = 0.5
-            if i < 0.3 * vc:
-                pos = 0.0001
-            if i > 0.6 * vc:
-                pos = 0.9999
-
-            vline.append(
-                [
-                    (pos * g[vp - 1][i][0] + (1 - pos) * g[vp][i][0]),
-                    (pos * g[vp - 1][i][1] + (1 - pos) * g[vp][i][1]),
-                    (pos * g[vp - 1][i][2] + (1 - pos) * g[vp][i][2]),
-                ]
-            )
+        #
+        # a Vline is inserted by knot refinement, then its poles are
+        # moved onto the next line in the lower rows and onto the
+        # previous line in the upper rows
+        with self.edit_batch("add vertical S " + str(vp)):
+            if not self.addVline(vp, 0.5):
+                return
 
-        vline = np.array(vline)
+            nu, nv = self.obj2.nNodes_u, self.obj2.nNodes_v
+            pp = self.g.reshape(nu, nv, 3).copy()
 
-        gg = np.concatenate((g[:vp], [vline], g[vp:]))
+            rows = np.arange(nu)
+            low = rows < 0.3 * nu
+            high = rows > 0.6 * nu
 
-        self.g = gg.swapaxes(0, 1)
-        self.obj2.nNodes_u += 1
+            pp[low, vp] = pp[low, vp + 1]
+            pp[high, vp] = pp[high, vp - 1]
 
-        self.updatePoles()
-        self.showGriduv()
-        FreeCAD.ActiveDocument.commitTransaction()
+            self.g = pp.reshape(self.g.shape)
 
+    @nurbs_trace.traced("Nurbs.updatePoles")
     def updatePoles(self):
-        """Recompute polestring and recompute surface."""
+        """Store poles and recompute surface."""
         # FIXME: something is wrong here
         uc = self.obj2.nNodes_u
         vc = self.obj2.nNodes_v
 
-        ll = ""
-
-        print(f"--- updatePoles -------------- : {self.g}")
+        log.debug("--- updatePoles -------------- : %s", self.g)
 
         gf = self.g.reshape(uc * vc, 3)  # wrong?
 
-        print(f"GF: {gf}")
+        log.debug("GF: %s", gf)
 
-        for i in gf:
-            ll += f"{str(list(i))}, "
+        nurbs_set_poles(self.obj2, gf)
+        # self.onChanged(self.obj2,"Height")
 
-        ll = f"[{ll}]"
+        if not self._update_local(self.obj2, gf):
+            self.update(self.obj2)
 
-        print(f"LL: {ll}")
+        self.end_preview()
 
-        self.obj2.poles = ll
-        # self.onChanged(self.obj2,"Height")
-        self.update(self.obj2)
+    @nurbs_trace.traced("Nurbs._update_local")
+    def _update_local(self, fp, gf):
+        """Apply changed poles to the cached surface self.bs.
+
+        A pole of a degree (p, q) surface only affects (p + 1) x (q + 1)
+        knot spans, so the built surface is modified in place with
+        setPole and setWeight and only the dependent display data are
+        refreshed, the solid too, see _update_dependent.
+
+        Args:
+            fp (DocumentObject): the Nurbs object
+            gf (np_array): (N, 3) poles in storage order
+
+        Returns:
+            bool: False if a full update is needed
+        """
+        #
+        built = getattr(self, "_built_poles", None)
+
+        if built is None or getattr(self, "bs", None) is None:
+            return False
+
+        # other models transform the poles
+        if fp.model != "NurbsSurface":
+            return False
+
+        bs = self.bs
+        nbu, nbv = bs.NbUPoles, bs.NbVPoles
+
+        if built.shape != gf.shape or nbu * nbv != len(gf):
+            # the pole count changed, e.g. by refine_knots
+            return self._update_structure(fp, gf)
+
+        if not self._same_structure(fp, bs):
+            # knots or degrees changed with the same pole count, e.g. by
+            # interpolate, the poles do not fit the built surface
+            return self._update_structure(fp, gf)
+
+        weights = self._pole_weights(fp, len(gf))
+        new_w = np.ones(len(gf)) if weights is None else weights
+        old_w = self._built_weights
+        old_w = np.ones(len(gf)) if old_w is None else old_w.ravel()
+
+        changed = np.flatnonzero(np.any(gf != built, axis=1) | (new_w != old_w))
+
+        if len(changed) == 0:
+            return True
+
+        if len(changed) > max(16, len(gf) // 4):
+            # not local, rebuilding is cheaper
+            return False
+
+        log.debug("--- local update: %s poles", len(changed))
+
+        spans = set()
+        for k in changed.tolist():
+            iu, iv = divmod(k, nbv)
+            bs.setPole(iu + 1, iv + 1, FreeCAD.Vector(*gf[k]))
+            if new_w[k] != old_w[k]:
+                bs.setWeight(iu + 1, iv + 1, float(new_w[k]))
+            spans |= self._pole_spans(iu, iv)
+
+        built[changed] = gf[changed]
+        self._built_weights = None if weights is None else weights.copy()
+
+        if self.dirty_spans is not None:
+            self.dirty_spans |= spans
+
+        # the modified surface is a known state for undo and redo
+        key = nurbs_cache.surface_key(
+            built.reshape(nbu, nbv, 3), *self._build_args,
+            weights=self._built_weights)
+        self._cache_entry = nurbs_cache.cache.put(key, bs)
+
+        self._update_dependent(fp, gf)
+
+        return True
+
+    def _pole_weights(self, fp, count):
+        """Return the weights of fp as a flat array, None if all are 1.
+
+        Weights that do not match the pole count or are not positive are
+        not used, the surface is built non rational.
+        """
+        #
+        weights = np.asarray(fp.weights, dtype=float)
+
+        if weights.size != count or np.all(weights == 1.0):
+            return None
+
+        if np.any(weights <= 0.0):
+            log.warning("%s: weights must be positive, not used", fp.Label)
+            return None
+
+        return weights
+
+    def _same_structure(self, fp, bs):
+        """Return True if knots and degrees of fp are the ones of bs."""
+        #
+        if fp.degree_u != bs.UDegree or fp.degree_v != bs.VDegree:
+            return False
+
+        for knots, flat in ((fp.knot_u, self._flat_u),
+                            (fp.knot_v, self._flat_v)):
+            knots = np.asarray(knots, dtype=float)
+
+            if len(knots) != len(flat) or not np.allclose(
+                    knots, flat, rtol=0.0, atol=1e-9):
+                return False
+
+        return True
+
+    @nurbs_trace.traced("Nurbs._update_structure")
+    def _update_structure(self, fp, gf):
+        """Rebuild self.bs from poles and knot vectors of a new size.
+
+        Used after a knot refinement, poles and knot_u, knot_v are
+        already consistent, only the surface and the dependent display
+        data are rebuilt, the aux objects are kept.
+
+        Args:
+            fp (DocumentObject): the Nurbs object
+            gf (np_array): (N, 3) poles in storage order
+
+        Returns:
+            bool: False if a full update is needed
+        """
+        #
+        nu, nv = fp.nNodes_u, fp.nNodes_v
+        deg_u, deg_v = fp.degree_u, fp.degree_v
+
+        if (len(gf) != nu * nv
+                or not nurbs_refine.valid_knots(fp.knot_u, nu, deg_u)
+                or not nurbs_refine.valid_knots(fp.knot_v, nv, deg_v)):
+            return False
+
+        ku, mu = split_knots(fp.knot_u)
+        kv, mv = split_knots(fp.knot_v)
+
+        self._build_args = (mu, mv, ku, kv, False, False, deg_u, deg_v)
+        poles = gf.reshape(nu, nv, 3)
+        weights = self._pole_weights(fp, len(gf))
+        key = nurbs_cache.surface_key(poles, *self._build_args, weights=weights)
+        entry = nurbs_cache.cache.get(key)
+
+        if entry is None:
+            bs = Part.BSplineSurface()
+            if weights is None:
+                bs.buildFromPolesMultsKnots(npa_to_pts(poles), *self._build_args)
+            else:
+                bs.buildFromPolesMultsKnots(
+                    npa_to_pts(poles), *self._build_args,
+                    weights.reshape(nu, nv).tolist())
+            entry = nurbs_cache.cache.put(key, bs)
+
+        self.bs = entry.surface()
+        self._cache_entry = entry
+
+        self._built_poles = gf.copy()
+        self._built_weights = None if weights is None else weights.copy()
+        self._flat_u = np.asarray(fp.knot_u, dtype=float)
+        self._flat_v = np.asarray(fp.knot_v, dtype=float)
+        self.dirty_spans = None
+
+        self._update_dependent(fp, gf)
+
+        return True
+
+    def _update_dependent(self, fp, gf):
+        """Refresh shape, grid and control net from self.bs."""
+        #
+        bs = self.bs
+
+        if fp.solid:
+            # as createSurface, the solid of a known state is cached
+            fp.Shape = self._cache_entry.derived(
+                "solid", lambda: self.create_solid(bs))
+        elif FreeCAD.ParamGet(
+                "User parameter:Plugins/nurbs").GetBool(
+                    "createNurbsShape", True):
+            fp.Shape = self._cache_entry.face()
+
+        if fp.grid and fp.gridobj is not None:
+            if FreeCAD.GuiUp:
+                vis = fp.gridobj.ViewObject.Visibility
+            FreeCAD.ActiveDocument.removeObject(fp.gridobj.Name)
+            fp.gridobj = self.create_grid(bs, fp.gridCount)
+            fp.gridobj.Label = "Nurbs Grid"
+            if FreeCAD.GuiUp:
+                fp.gridobj.ViewObject.Visibility = vis
+
+        vp = self._view_proxy(fp)
+
+        if vp is not None:
+            vp.update_control_net(self._net_poles())
+        else:
+            if fp.polgrid is not None:
+                fp.polgrid.Shape = self.create_uv_grid_shape()
+
+            if fp.polobj is not None and fp.polpoints:
+                fp.polobj.Shape = Part.makeCompound(
+                    [Part.Vertex(FreeCAD.Vector(*c)) for c in gf.tolist()])
+
+    def _pole_spans(self, iu, iv):
+        """Return the knot spans affected by the pole (iu, iv).
+
+        Spans are indexed on the distinct knots, span (a, b) is
+        [uk[a], uk[a + 1]] x [vk[b], vk[b + 1]].
+        """
+        #
+        bs = self.bs
+
+        def span_range(flat, i, deg):
+            ks = np.unique(flat)
+            first = np.searchsorted(ks, flat[i], side="right") - 1
+            last = np.searchsorted(ks, flat[i + deg + 1], side="left") - 1
+            first = min(max(first, 0), len(ks) - 2)
+            last = min(max(last, first), len(ks) - 2)
+            return range(first, last + 1)
+
+        su = span_range(self._flat_u, iu, bs.UDegree)
+        sv = span_range(self._flat_v, iv, bs.VDegree)
+
+        return {(a, b) for a in su for b in sv}
+
+    def _view_proxy(self, fp=None):
+        """Return the VP_NurbsObj owning the control net, None if no GUI."""
+        #
+        if fp is None:
+            fp = self.obj2
+
+        if not FreeCAD.GuiUp or fp.ViewObject is None:
+            return None
+
+        vp = fp.ViewObject.Proxy
+
+        if hasattr(vp, "update_control_net"):
+            return vp
+
+        return None
+
+    def preview(self, poles=None):
+        """Show a coarse surface of the edited poles without a rebuild.
+
+        The surface is sampled with the vectorized evaluator on
+        "PreviewSamples" points per knot span (default 4), nothing is
+        built by OCC. The next updatePoles shows the full quality shape.
+
+        Args:
+            poles (np_array): poles in storage order, None for self.g.
+                Defaults to None
+
+        Returns:
+            bool: False if no preview could be shown
+        """
+        #
+        fp = self.obj2
+        vp = self._view_proxy(fp)
+
+        if vp is None or not hasattr(vp, "show_preview"):
+            return False
+
+        bs = getattr(self, "bs", None)
+
+        # other models transform the poles before the build
+        if bs is None or fp.model != "NurbsSurface":
+            return False
+
+        nbu, nbv = bs.NbUPoles, bs.NbVPoles
+
+        if poles is None:
+            poles = self.g
+
+        if np.size(poles) != nbu * nbv * 3:
+            return False
+
+        poles = np.asarray(poles, dtype=float).reshape(nbu, nbv, 3)
+
+        data = SurfaceData(poles, np.array(bs.getWeights(), dtype=float),
+                           self._flat_u, self._flat_v, bs.UDegree, bs.VDegree)
+
+        k = FreeCAD.ParamGet(
+            "User parameter:Plugins/nurbs").GetInt("PreviewSamples", 4)
+        k = max(k, 1)
+
+        ku = np.unique(self._flat_u[bs.UDegree:nbu + 1])
+        kv = np.unique(self._flat_v[bs.VDegree:nbv + 1])
+
+        # k samples in every span plus the end knot
+        su = np.linspace(0.0, 1.0, k, endpoint=False)
+        us = np.append((ku[:-1, None] + np.diff(ku)[:, None] * su).ravel(), ku[-1])
+        vs = np.append((kv[:-1, None] + np.diff(kv)[:, None] * su).ravel(), kv[-1])
+
+        vp.show_preview(data.evaluate(us, vs, grid=True))
+        vp.update_control_net(poles)
+
+        return True
+
+    def end_preview(self):
+        """Remove the coarse surface shown by preview."""
+        vp = self._view_proxy()
+
+        if vp is not None and hasattr(vp, "end_preview"):
+            vp.end_preview()
+
+    def _net_poles(self):
+        """Return the poles of the built surface as (nu, nv, 3) array."""
+        return self._built_poles.reshape(self.bs.NbUPoles, self.bs.NbVPoles, 3)
+
+    def take_dirty_spans(self):
+        """Return and reset the knot spans changed by local updates.
+
+        Returns:
+            set: (span_u, span_v) tuples, None if the surface was rebuilt
+                as a whole since the last call
+        """
+        #
+        spans = getattr(self, "dirty_spans", None)
+        self.dirty_spans = set()
+        return spans
+
+    @nurbs_trace.traced("Nurbs.bezier_patches")
+    def bezier_patches(self):
+        """Return the Bezier patches of the built surface.
+
+        The patches are stored with the surface in nurbs_cache, after a
+        local pole edit only the patches of the changed knot spans are
+        computed, see take_dirty_spans. The array is shared, it must
+        not be modified.
+
+        Returns:
+            nurbs_bezier.PatchSet: patches is a (n_patches, p + 1,
+                q + 1, 4) array of homogeneous poles
+        """
+        #
+        bs = self.getBS()
+        dirty = self.take_dirty_spans()
+        prev = getattr(self, "_patches", None)
+
+        def build():
+            data = SurfaceData(
+                self._net_poles(), self._built_weights,
+                self._flat_u, self._flat_v, bs.UDegree, bs.VDegree)
+
+            if prev is not None and dirty is not None and prev.compatible(data):
+                return prev.update(data, dirty)
+
+            return nurbs_bezier.PatchSet.from_surface(data)
+
+        self._patches = self._cache_entry.data("bezier", build)
+
+        return self._patches
+
+    def project(self, points):
+        """Return the parameters of the closest surface points.
+
+        The sampled surface of nurbs_project is stored with the surface
+        in nurbs_cache, repeated projections on the same surface reuse
+        it.
+
+        Args:
+            points (array_like): (N, 3) points
+
+        Returns:
+            np_array: (N, 2) parameters
+        """
+        #
+        bs = self.getBS()
+
+        def build():
+            data = SurfaceData(
+                self._net_poles(), self._built_weights,
+                self._flat_u, self._flat_v, bs.UDegree, bs.VDegree)
+            return nurbs_project.Projector(data)
+
+        proj = self._cache_entry.data("projector", build)
+
+        return nurbs_project.project_points(bs, points, proj=proj)
 
     def showSelection(self, pole1, pole2):
         """Show pole grid."""
         try:
-            print(("delete ", self.obj2.polselection.Name))
+            log.debug("delete %s", self.obj2.polselection.Name)
             FreeCAD.ActiveDocument.removeObject(self.obj2.polselection.Name)
         except:
             pass
 
-        print(f"showSel: {pole1, pole2}")
+        log.debug("showSel: %s", (pole1, pole2))
 
         [u1, v1] = pole1
         [u2, v2] = pole2
@@ -1751,22 +2533,63 @@ def create_nurbs_do(uc=5, vc=7):
 
     Nurbs(do, uc, vc)
 
-    VP_NurbsObj(do.ViewObject)
+    if FreeCAD.GuiUp:
+        VP_NurbsObj(do.ViewObject)
 
-    do.ViewObject.ShapeColor = (0.00, 1.00, 1.00)
-    do.ViewObject.Transparency = 50
+        do.ViewObject.ShapeColor = (0.00, 1.00, 1.00)
+        do.ViewObject.Transparency = 50
 
     return do
 
 
-def nurbs_set_polestring():
-    """Create a polestring to put on Obj.poles property."""
-    pass
+def nurbs_set_poles(obj, poles):
+    """Store poles on Obj.polesData property.
+
+    Args:
+        obj (DocumentObject): Nurbs object
+        poles (array_like): poles, any shape ending with 3 coordinates
+    """
+    #
+    pts = np.asarray(poles, dtype=float).reshape(-1, 3)
+    obj.polesData = pts.tolist()
+
+    if obj.polesFormat != POLES_FORMAT:
+        obj.polesFormat = POLES_FORMAT
+
 
+def nurbs_get_poles(obj):
+    """Create an array from Obj.polesData property.
 
-def nurbs_get_poles():
-    """Create an array from Obj.poles property."""
-    pass
+    Args:
+        obj (DocumentObject): Nurbs object
+
+    Returns:
+        np_array: (N, 3) float array or None if no poles are stored
+    """
+    #
+    if len(obj.polesData) == 0:
+        return None
+
+    return np.array(obj.polesData, dtype=float).reshape(-1, 3)
+
+
+def _parse_legacy_poles(strings):
+    """Parse the legacy text format of the poles, without using eval.
+
+    Legacy strings come from np.array2string or from a list of lists
+    repr, numpy scalars could be written as "np.float64(1.0)".
+
+    Args:
+        strings (list): content of the legacy Obj.poles property
+
+    Returns:
+        np_array: (N, 3) float array
+    """
+    #
+    text = _LEGACY_FLOAT.sub("(", "".join(strings))
+    vals = np.array(_LEGACY_NUM.findall(text), dtype=float)
+
+    return vals.reshape(-1, 3)
 
 
 def npa_to_pts(poles, dbg_p=False):
@@ -1778,37 +2601,37 @@ def npa_to_pts(poles, dbg_p=False):
     """
     #
     if dbg_p is True:
-        print(f"Array received: {poles}")
-        print(f"Array Length: {len(poles)}")
+        log.debug("Array received: %s", poles)
+        log.debug("Array Length: %s", len(poles))
     #
     r_poles = []
     ka, kb, tt = poles.shape
     if dbg_p is True:
-        print(f"p_row: {ka}, p_col: {kb}, p_tt: {tt}")
+        log.debug("p_row: %s, p_col: %s, p_tt: %s", ka, kb, tt)
 
     for n in range(ka):
         pts = [FreeCAD.Vector(tuple(p)) for p in poles[n]]
         r_poles.append(pts)
 
     if dbg_p is True:
-        print(f"Returned pole list: {r_poles}")
+        log.debug("Returned pole list: %s", r_poles)
 
     return r_poles
 
 
 def debug_spline(bs, dbg_nm="Surface", dbg_lev=0):
     """Debug BSplineSurface."""
-    print(f"--- Debug BSplineSurface {dbg_nm}")
-    print(f"bs.NbUPoles: {bs.NbUPoles}")
-    print(f"bs.NbUPoles: {bs.NbVPoles}")
-    print(f"bs.NbUKnots: {bs.NbUKnots}")
-    print(f"bs.NbVKnots: {bs.NbVKnots}")
+    log.debug("--- Debug BSplineSurface %s", dbg_nm)
+    log.debug("bs.NbUPoles: %s", bs.NbUPoles)
+    log.debug("bs.NbUPoles: %s", bs.NbVPoles)
+    log.debug("bs.NbUKnots: %s", bs.NbUKnots)
+    log.debug("bs.NbVKnots: %s", bs.NbVKnots)
 
     if dbg_lev > 0:
-        print(f"bs.getUKnots: {bs.getUKnots()}")
-        print(f"bs.getVKnots: {bs.getVKnots()}")
-        print(f"bs.getUMults: {bs.getUMultiplicities()}")
-        print(f"bs.getVMults: {bs.getVMultiplicities()}")
+        log.debug("bs.getUKnots: %s", bs.getUKnots())
+        log.debug("bs.getVKnots: %s", bs.getVKnots())
+        log.debug("bs.getUMults: %s", bs.getUMultiplicities())
+        log.debug("bs.getVMults: %s", bs.getVMultiplicities())
 
 # --- Examples and tests
 
@@ -1820,7 +2643,7 @@ def createnurbs():
     nobj.base = False
     # nobj.grid=False
 
-    polestring = """[
+    polarr = [
     [0.0, 0.0, 0.0], [40.0, 0.0, 0.0], [80.0, 0.0, 0.0], [120.0, 0.0, 0.0],
     [160.0, 0.0, 0.0], [200.0, 0.0, 0.0], [0.0, 30.0, 0.0], [40.0, 30.0, 0.0],
     [80.0, 30.0, 0.0], [120.0, 30.0, 0.0], [160.0, 30.0, -60.0], [200.0, 30.0, 0.0],
@@ -1836,13 +2659,11 @@ def createnurbs():
     [160.0, 210.0, 0.0], [200.0, 210.0, 0.0], [0.0, 240.0, 0.0], [40.0, 240.0,0.0],
     [80.0, 240.0, 0.0], [120.0, 240.0, 0.0], [160.0, 240.0, 0.0],
     [200.0, 240.0, 0.0], [0.0, 270.0, 0.0], [40.0, 270.0, 0.0], [80.0, 270.0, 0.0],
-    [120.0, 270.0, 0.0], [160.0, 270.0, 0.0], [200.0, 270.0, 0.0]]"""
-
-    polarr = eval(polestring)
+    [120.0, 270.0, 0.0], [160.0, 270.0, 0.0], [200.0, 270.0, 0.0]]
 
     ps = [FreeCAD.Vector(tuple(v)) for v in polarr]
 
-    nobj.poles = polestring
+    nurbs_set_poles(nobj, polarr)
     # ps = nobj.Proxy.getPoints()
 
     nobj.Proxy.togrid(ps)
@@ -2228,9 +3049,9 @@ def testTorus(def_name=None, c_rand=True, suffix=None, clean_doc=True):
     dest_doc = FreeCAD.activeDocument()
 
     FreeCAD.setActiveDocument(out_doc)
-    #
-    uc = 7
-    vc = 4
+    # both directions are full circles, at least 7 poles
+    uc = 12
+    vc = 12
 
     nobj = create_nurbs_do(uc, vc)
     nobj.model = "NurbsTorus"
@@ -0,0 +1,286 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_bezier.py
+
+Bezier patches of a B-spline surface.
+
+    Every inner knot is inserted up to multiplicity degree, the poles
+    of the refined surface are then cut in (p + 1) x (q + 1) blocks,
+    one rational Bezier patch for every non empty knot span of the
+    domain. Bounding boxes, picking and intersection seeds are cheap
+    on the patches, a patch is inside the convex hull of its poles.
+
+        ps = PatchSet.from_surface(data)
+        ps.patches          # (n_patches, p + 1, q + 1, 4), (w * P, w)
+        ps.bounds()         # (n_patches, 2, 3) min and max corners
+        ps.evaluate(u, v)   # points, without span search in the knots
+
+    After a local pole edit only the patches of the changed knot spans
+    are computed again, see PatchSet.update.
+
+    Patches are computed with numpy, nurbs_refine and nurbs_degree,
+    FreeCAD is not imported.
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import numpy as np
+
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_degree import clamp
+from freecad.nurbswb.nurbs_eval import comb, split_knots
+from freecad.nurbswb.nurbs_refine import refine_knots
+
+
+def decompose(pw, knots, degree, axis=0):
+    """Split a spline in Bezier segments.
+
+    Args:
+        pw (np_array): poles, homogeneous for rational splines
+        knots (array_like): flat knot vector
+        degree (int): degree
+        axis (int): axis of pw along the knot vector. Defaults to 0
+
+    Returns:
+        tuple: (segments, breaks) segments has the axis replaced by
+            (n_segments, degree + 1), breaks are the n_segments + 1
+            distinct knots of the domain
+    """
+    pw, knots = clamp(np.asarray(pw, dtype=float), knots, degree, axis)
+
+    values, mults = split_knots(knots)
+    ins = np.repeat(values[1:-1], degree - np.asarray(mults[1:-1], dtype=int))
+    pw, knots = refine_knots(pw, knots, degree, ins, axis)
+
+    nseg = len(values) - 1
+    idx = degree * np.arange(nseg)[:, None] + np.arange(degree + 1)[None, :]
+    segs = np.take(pw, idx, axis=axis)
+
+    return segs, np.asarray(values)
+
+
+def bernstein(degree, s):
+    """Return the Bernstein polynomials of degree at s.
+
+    Returns:
+        np_array: (len(s), degree + 1) values
+    """
+    s = np.asarray(s, dtype=float)[:, None]
+    i = np.arange(degree + 1)[None, :]
+    coef = np.array([comb(degree, k) for k in range(degree + 1)], dtype=float)
+
+    return coef * s ** i * (1.0 - s) ** (degree - i)
+
+
+class PatchSet(object):
+    """The rational Bezier patches of a surface.
+
+    Attributes:
+        patches (np_array): (nsu * nsv, p + 1, q + 1, 4) homogeneous
+            poles, patch (su, sv) is at index su * nsv + sv
+        knots_u (np_array): flat knot vector of the surface in u
+        knots_v (np_array): flat knot vector of the surface in v
+        degree_u (int): degree in u
+        degree_v (int): degree in v
+        breaks_u (np_array): nsu + 1 distinct knots of the u domain
+        breaks_v (np_array): nsv + 1 distinct knots of the v domain
+        offset (tuple): index of the first domain span in the distinct
+            knots of the surface, used to map knot spans to patches
+    """
+
+    def __init__(self, patches, knots_u, knots_v, degree_u, degree_v):
+        """Init the set, see from_surface."""
+        self.patches = patches
+        self.knots_u = np.asarray(knots_u, dtype=float)
+        self.knots_v = np.asarray(knots_v, dtype=float)
+        self.degree_u = degree_u
+        self.degree_v = degree_v
+
+        self.breaks_u, off_u = self._breaks(self.knots_u, degree_u)
+        self.breaks_v, off_v = self._breaks(self.knots_v, degree_v)
+        self.offset = (off_u, off_v)
+
+    @staticmethod
+    def _breaks(knots, degree):
+        """Return the distinct knots of the domain and the first index."""
+        values = np.unique(knots)
+        a, b = knots[degree], knots[len(knots) - degree - 1]
+
+        return values[(values >= a) & (values <= b)], int(
+            np.searchsorted(values, a))
+
+    @classmethod
+    @nurbs_trace.traced("PatchSet.from_surface")
+    def from_surface(cls, data):
+        """Decompose a surface.
+
+        Args:
+            data (SurfaceData): the surface
+
+        Returns:
+            PatchSet
+        """
+        p, q = data.degree_u, data.degree_v
+
+        # (nu, nv, 4) -> (nsu, p + 1, nv, 4) -> (nsu, p + 1, nsv, q + 1, 4)
+        segs, bu = decompose(data.homogeneous, data.knots_u, p, axis=0)
+        segs, bv = decompose(segs, data.knots_v, q, axis=2)
+
+        nsu, nsv = len(bu) - 1, len(bv) - 1
+        patches = segs.transpose(0, 2, 1, 3, 4).reshape(
+            nsu * nsv, p + 1, q + 1, 4)
+
+        return cls(patches, data.knots_u, data.knots_v, p, q)
+
+    def compatible(self, data):
+        """Return True if data has the knots and degrees of the set."""
+        return (data.degree_u == self.degree_u
+                and data.degree_v == self.degree_v
+                and np.array_equal(data.knots_u, self.knots_u)
+                and np.array_equal(data.knots_v, self.knots_v))
+
+    @property
+    def shape(self):
+        """Return the number of patches (nsu, nsv)."""
+        return len(self.breaks_u) - 1, len(self.breaks_v) - 1
+
+    @property
+    def nbytes(self):
+        """Return the size of the arrays."""
+        return self.patches.nbytes + self.breaks_u.nbytes + self.breaks_v.nbytes
+
+    def index(self, span_u, span_v):
+        """Return the patch index of a knot span of the surface.
+
+        Args:
+            span_u (int): span on the distinct knots of the surface, as
+                in Nurbs.take_dirty_spans
+            span_v (int): see span_u
+
+        Returns:
+            int: patch index, -1 outside the domain
+        """
+        su = span_u - self.offset[0]
+        sv = span_v - self.offset[1]
+        nsu, nsv = self.shape
+
+        if 0 <= su < nsu and 0 <= sv < nsv:
+            return su * nsv + sv
+
+        return -1
+
+    def ranges(self):
+        """Return the parametric ranges of the patches.
+
+        Returns:
+            np_array: (n_patches, 4) umin, umax, vmin, vmax
+        """
+        bu, bv = self.breaks_u, self.breaks_v
+        iu, iv = np.divmod(np.arange(len(self.patches)), len(bv) - 1)
+
+        return np.stack((bu[iu], bu[iu + 1], bv[iv], bv[iv + 1]), axis=-1)
+
+    def points(self):
+        """Return the projected poles, (n_patches, p + 1, q + 1, 3)."""
+        return self.patches[..., :3] / self.patches[..., 3:]
+
+    def bounds(self):
+        """Return the bounding boxes of the patches.
+
+        The boxes of the poles hold the patches, weights are positive.
+
+        Returns:
+            np_array: (n_patches, 2, 3) min and max corners
+        """
+        pts = self.points()
+        return np.stack((pts.min(axis=(1, 2)), pts.max(axis=(1, 2))), axis=1)
+
+    def locate(self, u, v):
+        """Return the patches and local parameters of points.
+
+        Returns:
+            tuple: (patch indices, s, t) s and t in [0, 1]
+        """
+        bu, bv = self.breaks_u, self.breaks_v
+        u = np.asarray(u, dtype=float).ravel()
+        v = np.asarray(v, dtype=float).ravel()
+
+        su = np.clip(np.searchsorted(bu, u, side="right") - 1, 0, len(bu) - 2)
+        sv = np.clip(np.searchsorted(bv, v, side="right") - 1, 0, len(bv) - 2)
+
+        s = (u - bu[su]) / (bu[su + 1] - bu[su])
+        t = (v - bv[sv]) / (bv[sv + 1] - bv[sv])
+
+        return su * (len(bv) - 1) + sv, s, t
+
+    def evaluate(self, u, v):
+        """Evaluate the surface at the points (u, v).
+
+        Args:
+            u (array_like): u parameters
+            v (array_like): v parameters, same length as u
+
+        Returns:
+            np_array: (len(u), 3) points
+        """
+        k, s, t = self.locate(u, v)
+        bs = bernstein(self.degree_u, s)
+        bt = bernstein(self.degree_v, t)
+
+        hw = np.einsum("mi,mj,mijc->mc", bs, bt, self.patches[k])
+
+        return hw[:, :3] / hw[:, 3:]
+
+    @nurbs_trace.traced("PatchSet.update")
+    def update(self, data, spans):
+        """Return the set with the patches of the changed spans rebuilt.
+
+        Only the poles acting on the box of the changed spans are
+        decomposed, the other patches are copied.
+
+        Args:
+            data (SurfaceData): the changed surface, see compatible
+            spans (set): (span_u, span_v) changed knot spans, see
+                index
+
+        Returns:
+            PatchSet
+        """
+        idx = [(a - self.offset[0], b - self.offset[1]) for a, b in spans
+               if self.index(a, b) >= 0]
+
+        if not idx:
+            return self
+
+        su, sv = np.array(idx).T
+        u0, u1 = su.min(), su.max()
+        v0, v1 = sv.min(), sv.max()
+
+        p, q = self.degree_u, self.degree_v
+        ku, kv = data.knots_u, data.knots_v
+
+        # flat spans of the box corners
+        a0 = int(np.searchsorted(ku, self.breaks_u[u0], side="right")) - 1
+        a1 = int(np.searchsorted(ku, self.breaks_u[u1], side="right")) - 1
+        b0 = int(np.searchsorted(kv, self.breaks_v[v0], side="right")) - 1
+        b1 = int(np.searchsorted(kv, self.breaks_v[v1], side="right")) - 1
+
+        # the sub surface of the box, its domain is the box
+        pw = data.homogeneous[a0 - p:a1 + 1, b0 - q:b1 + 1]
+        segs, _bu = decompose(pw, ku[a0 - p:a1 + p + 2], p, axis=0)
+        segs, _bv = decompose(segs, kv[b0 - q:b1 + q + 2], q, axis=2)
+        box = segs.transpose(0, 2, 1, 3, 4)
+
+        patches = self.patches.copy()
+        nsv = self.shape[1]
+        patches[su * nsv + sv] = box[su - u0, sv - v0]
+
+        nurbs_trace.count("bezier.patches", len(idx))
+
+        return PatchSet(patches, self.knots_u, self.knots_v, p, q)
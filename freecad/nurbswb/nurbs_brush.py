@@ -0,0 +1,291 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_brush.py
+
+Brush deformation of the pole grid.
+
+    A brush changes the poles within a radius of a center, scaled by a
+    falloff profile of the normalized distance t = d / radius:
+
+        brush = Brush(30.0, strength=5.0, falloff="cosine", mode="add")
+        index = brush.neighbourhood(g)
+        for center in stroke:
+            brush.apply(g, center, index=index)
+
+    The selection is made in index space, center is a (row, col) pole
+    and radius counts poles, or in world space, center is a point and
+    radius a length. In world space the poles are hashed once on a grid
+    of cells as big as the radius, see PoleIndex, so a dab costs the
+    number of poles it touches, not the size of the net.
+
+    Modes:
+        add: move the poles by strength along the axis
+        absolute: move the poles towards the value strength
+        smooth: move the poles towards the mean of their grid
+            neighbours, strength is the blend factor
+
+    With target "weights" the same modes paint the pole weights, they
+    are kept over MIN_WEIGHT.
+
+    The module imports only numpy, Nurbs.brush applies a brush to a
+    Nurbs object in one edit batch.
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import functools
+
+import numpy as np
+
+
+FALLOFFS = {
+    "constant": lambda t: np.ones_like(t),
+    "linear": lambda t: 1.0 - t,
+    "cosine": lambda t: 0.5 * (1.0 + np.cos(np.pi * t)),
+    # sigma = 1 / 3, about 0.01 on the border
+    "gaussian": lambda t: np.exp(-4.5 * t * t),
+}
+
+MODES = ("add", "absolute", "smooth")
+
+TARGETS = ("poles", "weights")
+
+# weights of a rational surface must be positive
+MIN_WEIGHT = 1e-3
+
+
+def make_falloff(profile):
+    """Return the falloff function of a profile.
+
+    Args:
+        profile: a FALLOFFS name, a callable of the normalized distance
+            array or a sequence of values sampled evenly from the center
+            (t = 0) to the border (t = 1)
+
+    Returns:
+        callable: t array -> factor array
+    """
+    if callable(profile):
+        return profile
+
+    if isinstance(profile, str):
+        try:
+            return FALLOFFS[profile]
+        except KeyError:
+            raise ValueError(f"unknown falloff {profile!r}") from None
+
+    ys = np.asarray(profile, dtype=float)
+    xs = np.linspace(0.0, 1.0, len(ys))
+
+    return lambda t: np.interp(t, xs, ys)
+
+
+@functools.lru_cache(maxsize=32)
+def _stencil(radius):
+    """Return the (di, dj, dist) offsets of a disc of poles."""
+    r = int(np.floor(radius))
+    di, dj = np.mgrid[-r:r + 1, -r:r + 1]
+    dist = np.hypot(di, dj)
+    keep = dist <= radius
+
+    return di[keep], dj[keep], dist[keep]
+
+
+def _hash(keys):
+    """Return an int64 hash of integer cell coordinates."""
+    primes = np.array([73856093, 19349663, 83492791][:keys.shape[-1]],
+                      dtype=np.int64)
+    return np.bitwise_xor.reduce(keys * primes, axis=-1)
+
+
+class PoleIndex(object):
+    """Spatial hash of the poles for world space selections.
+
+    Poles are sorted by the hash of their cell, a query looks at the
+    cells around the center only. Hash collisions add candidates that
+    are removed by the distance check.
+    """
+
+    def __init__(self, points, cell):
+        """Build the index.
+
+        Args:
+            points (np_array): (N, d) pole coordinates, d is 2 or 3
+            cell (float): cell size, a query radius up to cell is exact
+        """
+        self.points = np.asarray(points, dtype=float)
+        self.cell = float(cell)
+
+        keys = np.floor(self.points / self.cell).astype(np.int64)
+        hashes = _hash(keys)
+
+        self.order = np.argsort(hashes, kind="stable")
+        self.hashes = hashes[self.order]
+
+        dim = self.points.shape[1]
+        self.around = np.stack(
+            np.meshgrid(*[(-1, 0, 1)] * dim, indexing="ij"), axis=-1
+        ).reshape(-1, dim)
+
+    def query(self, center, radius):
+        """Return the poles within radius of center.
+
+        Returns:
+            tuple: (flat indices, distances)
+        """
+        center = np.asarray(center, dtype=float)
+        cells = np.floor(center / self.cell).astype(np.int64) + self.around
+        hs = np.unique(_hash(cells))
+
+        lo = np.searchsorted(self.hashes, hs, side="left")
+        hi = np.searchsorted(self.hashes, hs, side="right")
+        cand = np.concatenate(
+            [self.order[a:b] for a, b in zip(lo, hi)] or [np.empty(0, int)])
+
+        dist = np.linalg.norm(self.points[cand] - center, axis=-1)
+        keep = dist <= radius
+
+        return cand[keep], dist[keep]
+
+
+class Brush(object):
+    """A deformation brush, see the module docstring."""
+
+    def __init__(self, radius, strength=1.0, falloff="cosine", mode="add",
+                 space="world", target="poles", axis=2, metric="xy"):
+        """Init the brush.
+
+        Args:
+            radius (float): radius, in poles for index space
+            strength (float): delta, value or blend factor of the mode.
+                Defaults to 1.0
+            falloff: see make_falloff. Defaults to "cosine"
+            mode (str): one of MODES. Defaults to "add"
+            space (str): "world" or "index". Defaults to "world"
+            target (str): one of TARGETS. Defaults to "poles"
+            axis (int): coordinate changed on the poles, None for all.
+                Defaults to 2
+            metric (str): world distance, "xy" or "xyz". Defaults to "xy"
+        """
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode!r}")
+
+        if target not in TARGETS:
+            raise ValueError(f"unknown target {target!r}")
+
+        if space not in ("world", "index"):
+            raise ValueError(f"unknown space {space!r}")
+
+        self.radius = float(radius)
+        self.strength = strength
+        self.falloff = falloff
+        self.profile = make_falloff(falloff)
+        self.mode = mode
+        self.space = space
+        self.target = target
+        self.axis = axis
+        self.dims = 2 if metric == "xy" else 3
+
+    def neighbourhood(self, g):
+        """Return the precomputed selection data for the grid g.
+
+        In world space the index is built on the current positions, it
+        should be rebuilt if the poles move along the metric axes.
+        """
+        if self.space == "index":
+            return None
+
+        cell = max(self.radius, 1e-9)
+
+        return PoleIndex(g.reshape(-1, 3)[:, :self.dims], cell)
+
+    def select(self, g, center, index=None):
+        """Return the poles under the brush.
+
+        Args:
+            g (np_array): (rows, cols, 3) pole grid
+            center: (row, col) in index space, a point in world space
+            index (PoleIndex): see neighbourhood, built if None
+
+        Returns:
+            tuple: (flat indices, falloff factors)
+        """
+        rows, cols = g.shape[:2]
+
+        if self.space == "index":
+            di, dj, dist = _stencil(self.radius)
+            ri = int(center[0]) + di
+            ci = int(center[1]) + dj
+            inside = (ri >= 0) & (ri < rows) & (ci >= 0) & (ci < cols)
+            flat = ri[inside] * cols + ci[inside]
+            dist = dist[inside]
+        else:
+            if index is None:
+                index = self.neighbourhood(g)
+            flat, dist = index.query(np.asarray(center)[:self.dims], self.radius)
+
+        t = dist / self.radius if self.radius > 0 else np.zeros(len(dist))
+
+        return flat, self.profile(t)
+
+    @staticmethod
+    def _neighbour_mean(field, r, c, sub):
+        """Return the mean of the 4 grid neighbours of the poles (r, c)."""
+        rows, cols = field.shape[:2]
+
+        return 0.25 * (field[(np.maximum(r - 1, 0), c) + sub]
+                       + field[(np.minimum(r + 1, rows - 1), c) + sub]
+                       + field[(r, np.maximum(c - 1, 0)) + sub]
+                       + field[(r, np.minimum(c + 1, cols - 1)) + sub])
+
+    def apply(self, g, center, weights=None, index=None):
+        """Apply one dab of the brush in place.
+
+        Args:
+            g (np_array): (rows, cols, 3) pole grid
+            center: see select
+            weights (np_array): (rows, cols) weights, needed for the
+                weights target. Defaults to None
+            index (PoleIndex): see neighbourhood. Defaults to None
+
+        Returns:
+            np_array: flat indices of the changed poles
+        """
+        flat, fac = self.select(g, center, index)
+
+        if len(flat) == 0:
+            return flat
+
+        r, c = np.divmod(flat, g.shape[1])
+
+        if self.target == "weights":
+            field, sub = weights, ()
+        elif self.axis is None:
+            field, sub = g, (slice(None),)
+            fac = fac[:, None]
+        else:
+            field, sub = g, (self.axis,)
+
+        key = (r, c) + sub
+        current = field[key]
+
+        if self.mode == "add":
+            delta = self.strength * fac
+        elif self.mode == "absolute":
+            delta = fac * (self.strength - current)
+        else:
+            mean = self._neighbour_mean(field, r, c, sub)
+            delta = self.strength * fac * (mean - current)
+
+        if self.target == "weights":
+            field[key] = np.maximum(current + delta, MIN_WEIGHT)
+        else:
+            field[key] = current + delta
+
+        return flat
@@ -0,0 +1,292 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_cache.py
+
+Cache of the built surfaces.
+
+    Surfaces are stored under a hash of the data passed to
+    buildFromPolesMultsKnots, so going back to a known state (undo,
+    redo, toggling solid or grid) takes the surface, its face, the
+    other derived shapes and the array data, e.g. the Bezier patches,
+    from the cache.
+
+        key = surface_key(poles, umults, vmults, uknots, vknots,
+                          False, False, 3, 3)
+        entry = cache.get(key)
+        if entry is None:
+            ... build bs ...
+            entry = cache.put(key, bs)
+        bs = entry.surface()
+
+    Entries are dropped in least recently used order when the memory
+    budget is exceeded, sizes are estimated from the number of poles,
+    shape elements and array bytes.
+
+    Parameters in "User parameter:Plugins/nurbs":
+        CacheBudget (int): memory budget in MB, 0 disables the cache,
+            default 64
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import hashlib
+
+from collections import OrderedDict
+
+import numpy as np
+
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_log import get_logger
+
+
+log = get_logger(__name__)
+
+DEFAULT_BUDGET = 64
+
+# rough size of an OCC object, bytes
+_OCC_OBJECT = 256
+
+
+def surface_key(poles, umults, vmults, uknots, vknots,
+                uperiodic, vperiodic, udegree, vdegree, weights=None):
+    """Return the cache key of a surface.
+
+    Args are the ones of Part.BSplineSurface.buildFromPolesMultsKnots,
+    poles and weights may be nested lists or arrays.
+
+    Returns:
+        str: hex digest
+    """
+    h = hashlib.blake2b(digest_size=20)
+
+    h.update(np.ascontiguousarray(poles, dtype=float).tobytes())
+    h.update(repr(np.shape(poles)).encode())
+
+    for seq in (umults, vmults):
+        h.update(np.asarray(seq, dtype=np.int64).tobytes())
+        h.update(b"|")
+
+    for seq in (uknots, vknots):
+        h.update(np.asarray(seq, dtype=float).tobytes())
+        h.update(b"|")
+
+    h.update(repr((bool(uperiodic), bool(vperiodic),
+                   int(udegree), int(vdegree))).encode())
+
+    if weights is not None:
+        w = np.asarray(weights, dtype=float)
+        # unit weights build the same surface as no weights
+        if not np.all(w == 1.0):
+            h.update(w.tobytes())
+
+    return h.hexdigest()
+
+
+def _surface_bytes(bs):
+    """Return the estimated size of a BSplineSurface."""
+    poles = bs.NbUPoles * bs.NbVPoles
+    knots = bs.NbUKnots + bs.NbVKnots
+
+    # poles and weights, knots and multiplicities
+    return _OCC_OBJECT + poles * 32 + knots * 12
+
+
+def _shape_bytes(shape):
+    """Return the estimated size of a shape or of a list of shapes."""
+    if isinstance(shape, (list, tuple)):
+        return sum(_shape_bytes(s) for s in shape)
+
+    elems = len(shape.Vertexes) + len(shape.Edges) + len(shape.Faces)
+    size = _OCC_OBJECT * elems
+
+    for face in shape.Faces:
+        sf = face.Surface
+        if hasattr(sf, "NbUPoles"):
+            size += _surface_bytes(sf)
+
+    return size
+
+
+class Entry(object):
+    """A cached surface with its derived data."""
+
+    __slots__ = ("key", "_cache", "_surface", "_face", "_derived", "_data",
+                 "size")
+
+    def __init__(self, cache, key, bs):
+        self.key = key
+        self._cache = cache
+        self._surface = bs
+        self._face = None
+        self._derived = {}
+        self._data = {}
+        self.size = _surface_bytes(bs)
+
+    def surface(self):
+        """Return a copy of the surface, the caller may modify it."""
+        return self._surface.copy()
+
+    def face(self):
+        """Return the face of the surface."""
+        if self._face is None:
+            self._face = self._surface.toShape()
+            self._cache._grow(self, _shape_bytes(self._face))
+
+        return self._face
+
+    def derived(self, name, build):
+        """Return a shape built from the surface, build it on first call.
+
+        Args:
+            name (hashable): e.g. ("grid", 20)
+            build (callable): return the shape or a list of shapes
+        """
+        if name not in self._derived:
+            res = build()
+            self._derived[name] = res
+            self._cache._grow(self, _shape_bytes(res))
+
+        return self._derived[name]
+
+    def data(self, name, build):
+        """Return array data computed from the surface, see derived.
+
+        Args:
+            name (hashable): e.g. "bezier"
+            build (callable): return the data, its size is taken from
+                the nbytes attribute
+        """
+        if name not in self._data:
+            res = build()
+            self._data[name] = res
+            self._cache._grow(self, getattr(res, "nbytes", 0))
+
+        return self._data[name]
+
+
+class SurfaceCache(object):
+    """LRU cache of the built surfaces."""
+
+    def __init__(self, budget=None):
+        """Init the cache.
+
+        Args:
+            budget (int): memory budget in MB, None to read the
+                "CacheBudget" parameter. Defaults to None
+        """
+        self._entries = OrderedDict()
+        self._budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def budget(self):
+        """Return the memory budget in bytes."""
+        if self._budget is None:
+            try:
+                import FreeCAD
+            except ImportError:
+                self._budget = DEFAULT_BUDGET
+            else:
+                self._budget = FreeCAD.ParamGet(
+                    "User parameter:Plugins/nurbs").GetInt(
+                        "CacheBudget", DEFAULT_BUDGET)
+
+        return self._budget * 1024 * 1024
+
+    def set_budget(self, budget):
+        """Set the memory budget in MB and evict the exceeding entries."""
+        self._budget = budget
+        self._evict()
+
+    def get(self, key):
+        """Return the entry of key, None if not cached."""
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            nurbs_trace.count("cache.miss")
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        nurbs_trace.count("cache.hit")
+
+        return entry
+
+    def put(self, key, bs):
+        """Store a copy of a built surface.
+
+        Returns:
+            Entry: the new entry, it is not kept if the cache is disabled
+        """
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+
+        entry = Entry(self, key, bs.copy())
+
+        if self.budget > 0:
+            self._entries[key] = entry
+            self.size += entry.size
+            self._evict()
+
+        return entry
+
+    def _grow(self, entry, nbytes):
+        """Account the derived data added to an entry."""
+        entry.size += nbytes
+
+        if self._entries.get(entry.key) is entry:
+            self.size += nbytes
+            self._evict()
+
+    def _evict(self):
+        """Drop the least recently used entries over the budget."""
+        budget = self.budget
+
+        # the last entry is kept, it is the one in use
+        while self.size > budget and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+            self.evictions += 1
+            log.debug("evicted %s, %s bytes", key[:8], entry.size)
+
+        if budget <= 0:
+            self.clear()
+
+    def clear(self):
+        """Drop all the entries, the statistics are kept."""
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        """Return the cache statistics.
+
+        Returns:
+            dict: entries, size and budget in bytes, hits, misses,
+                evictions and hit ratio
+        """
+        calls = self.hits + self.misses
+
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "ratio": self.hits / calls if calls else 0.0,
+        }
+
+
+# the cache shared by all the Nurbs objects
+cache = SurfaceCache()
@@ -0,0 +1,216 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_curvature.py
+
+Analytic surface curvature.
+
+    First and second fundamental forms are computed from the exact
+    derivatives given by nurbs_eval, all the quantities are returned as
+    numpy arrays over the whole parameter set in one call.
+
+    Sign convention: the normal is Su x Sv, normal curvatures are
+    II / I, so they are negative where the surface bends away from
+    the normal.
+
+References:
+    do Carmo - Differential Geometry of Curves and Surfaces, 3-3
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_eval import surface_data
+
+
+Curvature = namedtuple(
+    "Curvature",
+    ["points", "normals", "k1", "k2", "dir1", "dir2", "gauss", "mean",
+     "ku", "kv"])
+
+Curvature.__doc__ = """Curvature data, every field is an array.
+
+    points, normals, dir1, dir2 have a trailing dimension of 3.
+    k1 >= k2 are the principal curvatures along dir1 and dir2,
+    gauss = k1 * k2, mean = (k1 + k2) / 2,
+    ku and kv are the normal curvatures along the u and v iso lines.
+"""
+
+
+def fundamental_forms(ders):
+    """Compute the fundamental forms from the surface derivatives.
+
+    Args:
+        ders (np_array): (..., 3, 3, 3) derivatives as returned by
+            SurfaceData.derivatives with order 2
+
+    Returns:
+        tuple: (E, F, G, L, M, N, normals)
+    """
+    su = ders[..., 1, 0, :]
+    sv = ders[..., 0, 1, :]
+
+    n = np.cross(su, sv)
+    ln = np.linalg.norm(n, axis=-1, keepdims=True)
+    n = np.divide(n, ln, out=np.zeros(n.shape), where=ln > 0)
+
+    e = np.einsum("...i,...i", su, su)
+    f = np.einsum("...i,...i", su, sv)
+    g = np.einsum("...i,...i", sv, sv)
+
+    l = np.einsum("...i,...i", ders[..., 2, 0, :], n)
+    m = np.einsum("...i,...i", ders[..., 1, 1, :], n)
+    nn = np.einsum("...i,...i", ders[..., 0, 2, :], n)
+
+    return e, f, g, l, m, nn, n
+
+
+def _direction(k, e, f, g, l, m, nn, su, sv):
+    """Return the unit tangent direction of the principal curvature k."""
+    # (L - kE) du + (M - kF) dv = 0 and (M - kF) du + (N - kG) dv = 0
+    a1, b1 = (m - k * f), -(l - k * e)
+    a2, b2 = (nn - k * g), -(m - k * f)
+
+    use1 = (a1 * a1 + b1 * b1) >= (a2 * a2 + b2 * b2)
+    du = np.where(use1, a1, a2)
+    dv = np.where(use1, b1, b2)
+
+    d = du[..., None] * su + dv[..., None] * sv
+    ld = np.linalg.norm(d, axis=-1, keepdims=True)
+
+    # umbilic points, any direction is principal, take su
+    lu = np.linalg.norm(su, axis=-1, keepdims=True)
+    dsu = np.divide(su, lu, out=np.zeros(su.shape), where=lu > 0)
+
+    return np.where(ld > 1e-12 * (1 + lu * lu), d / np.where(ld > 0, ld, 1), dsu)
+
+
+def curvature_from_derivatives(ders):
+    """Compute all curvature data from order 2 derivatives.
+
+    Args:
+        ders (np_array): (..., 3, 3, 3) derivatives
+
+    Returns:
+        Curvature: curvature data
+    """
+    e, f, g, l, m, nn, n = fundamental_forms(ders)
+    su = ders[..., 1, 0, :]
+    sv = ders[..., 0, 1, :]
+
+    den = e * g - f * f
+    ok = den > 0
+    den = np.where(ok, den, 1.0)
+
+    gauss = np.where(ok, (l * nn - m * m) / den, 0.0)
+    mean = np.where(ok, (e * nn - 2.0 * f * m + g * l) / (2.0 * den), 0.0)
+
+    disc = np.sqrt(np.maximum(mean * mean - gauss, 0.0))
+    k1 = mean + disc
+    k2 = mean - disc
+
+    ku = np.divide(l, e, out=np.zeros(l.shape), where=e > 0)
+    kv = np.divide(nn, g, out=np.zeros(nn.shape), where=g > 0)
+
+    dir1 = _direction(k1, e, f, g, l, m, nn, su, sv)
+    dir2 = np.cross(n, dir1)
+
+    return Curvature(ders[..., 0, 0, :], n, k1, k2, dir1, dir2, gauss, mean,
+                     ku, kv)
+
+
+def _occ_curvature(sf, u, v):
+    """Compute curvature data point by point with OCC, used as fallback."""
+    cnt = len(u)
+    nurbs_trace.count("sf.curvature", cnt)
+    pts = np.zeros((cnt, 3))
+    nrm = np.zeros((cnt, 3))
+    d1 = np.zeros((cnt, 3))
+    k1 = np.zeros(cnt)
+    k2 = np.zeros(cnt)
+    ku = np.zeros(cnt)
+    kv = np.zeros(cnt)
+
+    for i, (a, b) in enumerate(zip(u, v)):
+        pts[i] = tuple(sf.value(a, b))
+        try:
+            nrm[i] = tuple(sf.normal(a, b))
+            k1[i] = sf.curvature(a, b, "Max")
+            k2[i] = sf.curvature(a, b, "Min")
+            dmax, dmin = sf.curvatureDirections(a, b)
+            d1[i] = tuple(dmax)
+            tu, tv = sf.tangent(a, b)
+        except Exception:
+            # singular point, leave zeros
+            continue
+
+        # Euler formula for the normal curvature of the iso lines
+        cu = np.dot(tuple(tu), d1[i])
+        cv = np.dot(tuple(tv), d1[i])
+        ku[i] = k1[i] * cu * cu + k2[i] * (1.0 - cu * cu)
+        kv[i] = k1[i] * cv * cv + k2[i] * (1.0 - cv * cv)
+
+    d2 = np.cross(nrm, d1)
+
+    return Curvature(pts, nrm, k1, k2, d1, d2, k1 * k2, 0.5 * (k1 + k2),
+                     ku, kv)
+
+
+def curvature_points(sf, u, v, data=None):
+    """Compute the curvature on the paired parameters u, v.
+
+    Args:
+        sf (Part.Surface): surface, used when data is None
+        u (array_like): u parameters
+        v (array_like): v parameters
+        data (SurfaceData): if given sf is not inspected. Defaults to None
+
+    Returns:
+        Curvature: fields have a leading dimension of len(u)
+    """
+    u = np.asarray(u, dtype=float).ravel()
+    v = np.asarray(v, dtype=float).ravel()
+
+    if data is None:
+        data = surface_data(sf)
+
+    if data is None:
+        return _occ_curvature(sf, u, v)
+
+    return curvature_from_derivatives(data.derivatives(u, v, 2))
+
+
+def curvature_grid(sf, us, vs, data=None):
+    """Compute the curvature on the tensor grid us x vs.
+
+    Args:
+        sf (Part.Surface): surface, used when data is None
+        us (array_like): u parameters
+        vs (array_like): v parameters
+        data (SurfaceData): if given sf is not inspected. Defaults to None
+
+    Returns:
+        Curvature: fields have leading dimensions (len(us), len(vs))
+    """
+    us = np.asarray(us, dtype=float).ravel()
+    vs = np.asarray(vs, dtype=float).ravel()
+
+    if data is None:
+        data = surface_data(sf)
+
+    if data is None:
+        uu, vv = np.meshgrid(us, vs, indexing="ij")
+        c = _occ_curvature(sf, uu.ravel(), vv.ravel())
+        shp = (len(us), len(vs))
+        return Curvature(*[a.reshape(shp + a.shape[1:]) for a in c])
+
+    return curvature_from_derivatives(data.derivatives(us, vs, 2, grid=True))
@@ -0,0 +1,292 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_degree.py
+
+Degree elevation and degree reduction.
+
+    The space of the splines of degree p + t, with every distinct knot
+    repeated t more times, holds all the splines of degree p on the
+    same knots. The elevated poles are found by interpolating the
+    spline at the Greville abscissae of the new knot vector, the
+    system is square and the result is exact up to round off.
+
+    Degree reduction is a least squares fit in the space of degree
+    p - 1 on the same knots, it is exact only for splines that were
+    elevated, the maximum deviation on a dense sampling is returned
+    with the result:
+
+        pw, ku, deg, err = reduce_degree(pw, ku, 4, axis=0)
+
+    Both work on all the pole columns of the other direction at once,
+    rational splines are changed in homogeneous coordinates. Unclamped
+    knot vectors are clamped to the domain first, see clamp.
+
+    Built on nurbs_refine and the basis functions of nurbs_eval, the
+    module does not import FreeCAD.
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import numpy as np
+
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_eval import (
+    SurfaceData, basis_funs_ders, basis_matrix, find_spans, split_knots)
+from freecad.nurbswb.nurbs_refine import greville, refine_knots, multiplicity
+
+# samples for every knot span used to measure the reduction error
+ERROR_SAMPLES = 4
+
+
+def uniform_knots(count, degree):
+    """Return the clamped uniform knot vector on [0, 1].
+
+    Args:
+        count (int): number of poles, more than degree
+        degree (int): degree
+
+    Returns:
+        list: flat knot vector
+    """
+    inner = [i / (count - degree) for i in range(1, count - degree)]
+    return [0.0] * (degree + 1) + inner + [1.0] * (degree + 1)
+
+
+def clamp(pw, knots, degree, axis=0):
+    """Return the clamped representation of the spline on its domain.
+
+    The ends of the domain are inserted up to multiplicity degree and
+    the poles outside the domain are dropped, the spline is unchanged
+    on the domain. Each end is handled on its own, one of them may be
+    clamped already.
+
+    Args:
+        pw (np_array): poles, homogeneous for rational splines
+        knots (array_like): flat knot vector
+        degree (int): degree
+        axis (int): axis of pw along the knot vector. Defaults to 0
+
+    Returns:
+        tuple: (pw, knots)
+    """
+    knots = np.asarray(knots, dtype=float)
+    count = pw.shape[axis]
+    a, b = knots[degree], knots[count]
+
+    if np.all(knots[:degree + 1] == a) and np.all(knots[count:] == b):
+        return pw, knots
+
+    ins = ([a] * (degree - multiplicity(knots, a))
+           + [b] * (degree - multiplicity(knots, b)))
+    pw, knots = refine_knots(pw, knots, degree, ins, axis)
+
+    # keep degree + 1 copies of each end, the poles before the first
+    # kept a and after the last kept b are outside the domain
+    ma = multiplicity(knots, a)
+    mb = multiplicity(knots, b)
+    first = int(np.searchsorted(knots, a, side="left")) + ma - degree - 1
+    last = int(np.searchsorted(knots, b, side="right")) - mb
+
+    knots = np.concatenate(([a], knots[first + 1:last + degree], [b]))
+    pw = np.take(pw, np.arange(first, last), axis=axis)
+
+    return pw, knots
+
+
+def _values(pw, knots, degree, params):
+    """Evaluate the spline of the poles pw (along axis 0) at params.
+
+    Only the degree + 1 non zero basis functions of every parameter
+    are used.
+
+    Returns:
+        np_array: (len(params),) + pw.shape[1:] values
+    """
+    spans = find_spans(len(pw), degree, knots, params)
+    funs = basis_funs_ders(spans, params, degree, knots)[:, 0, :]
+
+    res = np.zeros((len(params),) + pw.shape[1:])
+    shape = (-1,) + (1,) * (pw.ndim - 1)
+
+    for r in range(degree + 1):
+        res += funs[:, r].reshape(shape) * pw[spans - degree + r]
+
+    return res
+
+
+def _fit(pw, knots, degree, new_knots, new_degree, params):
+    """Return the poles of the spline in a new space, least squares.
+
+    The spline is sampled at params, the system is square and exact
+    when params are the Greville abscissae of a space holding it.
+    Poles are along axis 0.
+    """
+    count = len(new_knots) - new_degree - 1
+
+    mat = basis_matrix(count, new_degree, new_knots, params)[0]
+    rhs = _values(pw, knots, degree, params).reshape(len(params), -1)
+
+    if len(params) == count:
+        res = np.linalg.solve(mat, rhs)
+    else:
+        # normal equations, the B-spline basis is well conditioned
+        res = np.linalg.solve(mat.T @ mat, mat.T @ rhs)
+
+    return res.reshape((count,) + pw.shape[1:])
+
+
+@nurbs_trace.traced("nurbs_degree.elevate_degree")
+def elevate_degree(pw, knots, degree, times=1, axis=0):
+    """Raise the degree by times, the spline is unchanged.
+
+    Args:
+        pw (np_array): poles, homogeneous for rational splines
+        knots (array_like): flat knot vector
+        degree (int): degree
+        times (int): degree increment. Defaults to 1
+        axis (int): axis of pw along the knot vector. Defaults to 0
+
+    Returns:
+        tuple: (pw, knots, degree) new arrays and degree
+    """
+    pw = np.asarray(pw, dtype=float)
+
+    if times < 1:
+        return pw.copy(), np.asarray(knots, dtype=float), degree
+
+    pw, knots = clamp(pw, knots, degree, axis)
+
+    values, mults = split_knots(knots)
+    new_degree = degree + times
+    new_knots = np.repeat(values, np.asarray(mults) + times)
+
+    params = greville(new_knots, new_degree)
+    pw = _fit(np.moveaxis(pw, axis, 0), knots, degree,
+              new_knots, new_degree, params)
+
+    return np.moveaxis(pw, 0, axis), new_knots, new_degree
+
+
+def _error(a, b, rational, dims):
+    """Return the max distance of two sample arrays, coordinates last."""
+    if rational:
+        a = a[..., :-1] / a[..., -1:]
+        b = b[..., :-1] / b[..., -1:]
+
+    if dims is not None:
+        a = a[..., :dims]
+        b = b[..., :dims]
+
+    return float(np.max(np.linalg.norm(a - b, axis=-1), initial=0.0))
+
+
+@nurbs_trace.traced("nurbs_degree.reduce_degree")
+def reduce_degree(pw, knots, degree, times=1, axis=0, rational=False,
+                  dims=None):
+    """Lower the degree by times with a least squares fit.
+
+    Args:
+        pw (np_array): poles, homogeneous for rational splines
+        knots (array_like): flat knot vector
+        degree (int): degree, more than times
+        times (int): degree decrement. Defaults to 1
+        axis (int): axis of pw along the knot vector. Defaults to 0
+        rational (bool): the last coordinate is the weight, the error
+            is measured on the projected points. Defaults to False
+        dims (int): number of coordinates used for the error, None for
+            all. Defaults to None
+
+    Returns:
+        tuple: (pw, knots, degree, error) error is the maximum distance
+            between the two splines on ERROR_SAMPLES points per span
+    """
+    pw = np.asarray(pw, dtype=float)
+
+    if times < 1:
+        return pw.copy(), np.asarray(knots, dtype=float), degree, 0.0
+
+    if degree - times < 1:
+        raise ValueError(f"degree {degree} can not be reduced by {times}")
+
+    pw, knots = clamp(pw, knots, degree, axis)
+
+    values, mults = split_knots(knots)
+    new_degree = degree - times
+    # same continuity at the inner knots
+    mults = np.maximum(np.asarray(mults) - times, 1)
+    mults[0] = mults[-1] = new_degree + 1
+    new_knots = np.repeat(values, mults)
+
+    # fit on the Greville points and on the span middles, the error
+    # is measured on ERROR_SAMPLES points of every span
+    ks = np.asarray(values)
+    middles = 0.5 * (ks[:-1] + ks[1:])
+    params = np.unique(np.concatenate((greville(new_knots, new_degree),
+                                       middles)))
+
+    pw = np.moveaxis(pw, axis, 0)
+    new = _fit(pw, knots, degree, new_knots, new_degree, params)
+
+    steps = (np.arange(ERROR_SAMPLES) + 0.5) / ERROR_SAMPLES
+    dense = (ks[:-1, None] + np.diff(ks)[:, None] * steps[None, :]).ravel()
+    dense = np.concatenate((dense, ks))
+    old_pts = _values(pw, knots, degree, dense)
+    new_pts = _values(new, new_knots, new_degree, dense)
+    new = np.moveaxis(new, 0, axis)
+
+    err = _error(old_pts, new_pts, rational, dims)
+    nurbs_trace.count("degree.reduce")
+
+    return new, new_knots, new_degree, err
+
+
+def elevate_surface(data, times_u=0, times_v=0):
+    """Return the surface with the degrees raised, it has the same shape.
+
+    Args:
+        data (SurfaceData): the surface
+        times_u (int): increment in u. Defaults to 0
+        times_v (int): increment in v. Defaults to 0
+
+    Returns:
+        SurfaceData
+    """
+    pw = data.homogeneous
+
+    pw, ku, pu = elevate_degree(pw, data.knots_u, data.degree_u, times_u, 0)
+    pw, kv, pv = elevate_degree(pw, data.knots_v, data.degree_v, times_v, 1)
+
+    w = pw[..., -1]
+
+    return SurfaceData(pw[..., :-1] / w[..., None], w, ku, kv, pu, pv)
+
+
+def reduce_surface(data, times_u=0, times_v=0):
+    """Return the surface with the degrees lowered and the deviation.
+
+    Args:
+        data (SurfaceData): the surface
+        times_u (int): decrement in u. Defaults to 0
+        times_v (int): decrement in v. Defaults to 0
+
+    Returns:
+        tuple: (SurfaceData, error) error is the sum of the bounds of
+            the two directions
+    """
+    pw = data.homogeneous
+    rational = data.rational
+
+    pw, ku, pu, eu = reduce_degree(
+        pw, data.knots_u, data.degree_u, times_u, 0, rational)
+    pw, kv, pv, ev = reduce_degree(
+        pw, data.knots_v, data.degree_v, times_v, 1, rational)
+
+    w = pw[..., -1]
+
+    return SurfaceData(pw[..., :-1] / w[..., None], w, ku, kv, pu, pv), eu + ev
@@ -13,14 +13,82 @@ Licence:
 
 """
 
-import importlib
-
 import FreeCAD
 import FreeCADGui
 
-import freecad.nurbswb.ui_dialog
-# activate in test phase
-importlib.reload(freecad.nurbswb.ui_dialog)
+from PySide2 import QtCore
+
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_log import get_logger
+
+from freecad.nurbswb import ui_dialog
+
+log = get_logger(__name__)
+
+
+class RecomputeScheduler(object):
+    """Coalesce a burst of edits into a single rebuild.
+
+    Every schedule call restarts a single shot timer, the callback runs
+    once when no edit has arrived for the idle interval. The edits of a
+    burst are collected in one undo transaction.
+
+    Args:
+        callback (callable): the rebuild, called without arguments
+        delay (int): idle interval in ms, if None it is read from the
+            "RecomputeDelay" parameter. Defaults to None
+    """
+
+    def __init__(self, callback, delay=None):
+        """Init the scheduler."""
+        if delay is None:
+            delay = FreeCAD.ParamGet(
+                "User parameter:Plugins/nurbs").GetInt("RecomputeDelay", 150)
+
+        self.callback = callback
+        self.pending = False
+        self.doc = None
+
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.flush)
+
+    def begin(self, doc):
+        """Open the transaction of the burst, if not open yet.
+
+        Call it before changing the object, so the first edit of the
+        burst is in the undo step.
+
+        Args:
+            doc (Document): document holding the edited object
+        """
+        if self.doc is None and doc is not None:
+            self.doc = doc
+            self.doc.openTransaction("Nurbs edit")
+
+    def schedule(self, doc=None):
+        """Request a rebuild, the transaction is opened on first request.
+
+        Args:
+            doc (Document): document holding the edited object
+        """
+        self.begin(doc)
+
+        self.pending = True
+        self.timer.start()
+
+    def flush(self):
+        """Run the pending rebuild now and close the transaction."""
+        self.timer.stop()
+
+        if self.pending:
+            self.pending = False
+            self.callback()
+
+        if self.doc is not None:
+            self.doc.commitTransaction()
+            self.doc = None
 
 
 class MyApp(object):
@@ -31,14 +99,26 @@ class MyApp(object):
         self.pole1 = [1, 5]
         self.pole2 = [3, 1]
         self.lock = False
+        self.scheduler = RecomputeScheduler(self.rebuild)
+
+    @nurbs_trace.traced("dialog.rebuild")
+    def rebuild(self):
+        """Rebuild the surface from the edited poles."""
+        self.obj.Object.Proxy.updatePoles()
+        self.obj.Object.Proxy.showGriduv()
+
+    def flush(self):
+        """Apply the pending rebuild, e.g. when the dial is released."""
+        self.scheduler.flush()
 
     def resetEdit(self):
         """Docstring missing."""
+        self.flush()
         FreeCAD.ActiveDocument.resetEdit()
         # self.root.ids['main'].hide()
-        mw = nurbswb.ui_dialog.getMainWindow()
-        nurbswb.ui_dialog.getComboView(mw).removeTab(2)
-        nurbswb.ui_dialog.getComboView(mw).setCurrentIndex(0)
+        mw = ui_dialog.getMainWindow()
+        ui_dialog.getComboView(mw).removeTab(2)
+        ui_dialog.getComboView(mw).setCurrentIndex(0)
 
     def updateDialog(self):
         """Docstring missing."""
@@ -48,7 +128,7 @@ class MyApp(object):
     def setFocusMode(self):
         """Docstring missing."""
         rc = self.root.ids["focusmode"].currentText()
-        print(("set Focus Mode is ", rc))
+        log.debug("set Focus Mode is %s", rc)
 
     def setPole1(self):
         """Docstring missing."""
@@ -74,9 +154,9 @@ class MyApp(object):
 
     def setActionMode(self):
         """Docstring missing."""
-        print("set Action Mode")
+        log.debug("set Action Mode")
         rc = self.root.ids["actionmode"].currentText()
-        print(rc)
+        log.debug("%s", rc)
         if rc == "change Height relative":
             if not self.root.ids["relativemode"].isChecked():
                 self.root.ids["relativemode"].click()
@@ -95,16 +175,25 @@ class MyApp(object):
         """Docstring missing."""
         self.updateDialog()
         self.setDataToNurbs()
+        self.flush()
 
+    @nurbs_trace.traced("dialog.run")
     def run(self):
+        """Execute the selected action, the result is rebuilt at once."""
+        self.flush()
+        self.run_action()
+        self.flush()
+
+    def run_action(self):
+        """Docstring missing."""
         rc = self.root.ids["actionmode"].currentText()
-        print(rc)
+        log.debug("%s", rc)
         if rc == "Add ULine":
             v = self.root.ids["vd"].value()
             self.obj.Object.Proxy.addUline(v, 0.5)
             self.updateDialog()
             self.setDataToNurbs()
-            print("done")
+            log.debug("done")
             return
         if rc == "Add VLine":
             u = self.root.ids["ud"].value()
@@ -112,7 +201,7 @@ class MyApp(object):
             # self.root.ids['ud'].setValue(self.root.ids['ud'].value()-1)
             self.updateDialog()
             self.setDataToNurbs()
-            print("done")
+            log.debug("done")
             return
         if rc == "change Height relative":
             if not self.root.ids["relativemode"].isChecked():
@@ -162,19 +251,19 @@ class MyApp(object):
 
             return
 
-        print("not implemented")
+        log.warning("%s not implemented", rc)
 
     def getselectionPoint(self):
         """Get pole from gui pole number selection."""
         s = Gui.Selection.getSelection()
-        print((s[0].Label))
+        log.debug("%s", s[0].Label)
         se = Gui.Selection.getSelectionEx()
         ss = se[0]
 
         sn = ss.SubElementNames
         # ('Vertex32',)
         polnr = int(sn[0][6:])
-        print(("pole number ", polnr))
+        log.debug("pole number %s", polnr)
 
         uc = self.obj.Object.nNodes_v
         vc = self.obj.Object.nNodes_u
@@ -188,14 +277,14 @@ class MyApp(object):
     def getselection(self):
         """Get pole from gui pole grid selection."""
         s = Gui.Selection.getSelection()
-        print((s[0].Label))
+        log.debug("%s", s[0].Label)
         se = Gui.Selection.getSelectionEx()
         ss = se[0]
 
         sn = ss.SubElementNames
         # ('Edge32',)
         polnr = int(sn[0][4:])
-        print(("edge number ", polnr))
+        log.debug("edge number %s", polnr)
 
         uc = self.obj.Object.nNodes_u
         vc = self.obj.Object.nNodes_v
@@ -206,14 +295,14 @@ class MyApp(object):
             u = polnr - 1
 
         polnr = int(sn[1][4:])
-        print(("edge number ", polnr))
+        log.debug("edge number %s", polnr)
 
         if polnr > uc:
             v = polnr - uc - 1
         else:
             u = polnr - 1
 
-        print(("u,v", u, v))
+        log.debug("u,v %s %s", u, v)
 
         self.root.ids["vd"].setValue(v)
         self.root.ids["ud"].setValue(u)
@@ -227,11 +316,11 @@ class MyApp(object):
         else:
             self.setPole2()
 
-        print("okay")
+        log.debug("okay")
 
         try:
             polnr = int(sn[2][4:])
-            print(("edge number 3 ", polnr))
+            log.debug("edge number 3 %s", polnr)
 
             if polnr > uc:
                 v = polnr - uc - 1
@@ -240,14 +329,14 @@ class MyApp(object):
 
             polnr = int(sn[3][4:])
 
-            print(("edge number 4 ", polnr))
+            log.debug("edge number 4 %s", polnr)
 
             if polnr > uc:
                 v = polnr - uc - 1
             else:
                 u = polnr - 1
 
-            print(("u,v", u, v))
+            log.debug("u,v %s %s", u, v)
 
             self.root.ids["vd"].setValue(v)
             self.root.ids["ud"].setValue(u)
@@ -263,8 +352,8 @@ class MyApp(object):
 
     def relativeMode(self):
         """Docstring missing."""
-        print("RELATVE MODE")
-        print((self.root.ids["relativemode"].isChecked()))
+        log.debug("RELATVE MODE")
+        log.debug("%s", self.root.ids['relativemode'].isChecked())
 
         if self.root.ids["relativemode"].isChecked():
             self.obj.Object.Proxy.gBase = self.obj.Object.Proxy.g.copy()
@@ -273,8 +362,8 @@ class MyApp(object):
         # else:
         #    self.root.ids['updateRelative'].hide()
 
-        print((self.obj.Object.Proxy.gBase.shape))
-        print("set  relative")
+        log.debug("%s", self.obj.Object.Proxy.gBase.shape)
+        log.debug("set  relative")
 
     def calculatePoleGrid(self):
         """Docstring missing."""
@@ -341,10 +430,10 @@ class MyApp(object):
             except:
                 pass
 
-        print("setDataToNurbs2")
+        log.debug("setDataToNurbs2")
 
         if not self.root.ids["setmode"].isChecked():
-            print("setze setmode")
+            log.debug("setze setmode")
 
             self.root.ids["setmode"].click()
             self.setDataToNurbs()
@@ -359,10 +448,10 @@ class MyApp(object):
         except:
             pass
 
-        print("setDataToNurbs2")
+        log.debug("setDataToNurbs2")
 
         if not self.root.ids["setmode"].isChecked():
-            print("sets setmode")
+            log.debug("sets setmode")
 
             self.root.ids["setmode"].click()
             self.setDataToNurbs(True)
@@ -372,11 +461,16 @@ class MyApp(object):
             # id: 'updateRelative'
             # clicked.connect: app.updateRelative
 
+    @nurbs_trace.traced("dialog.setDataToNurbs")
     def setDataToNurbs(self, updateRelative=False):
         """Set setDataToNurbs a change in the dialog for the nurbs."""
         #
         g = self.obj.Object.Proxy.g
 
+        # the edits below must be in the undo step of the burst
+        if self.root.ids["setmode"].isChecked():
+            self.scheduler.begin(self.obj.Object.Document)
+
         # data from the input fields
         # u=int(self.root.ids['u'].text())
         # v=int(self.root.ids['v'].text())
@@ -413,9 +507,9 @@ class MyApp(object):
         for u in range(u1, u2 + 1):
             for v in range(v1, v2 + 1):
                 if self.root.ids["setmode"].isChecked():
-                    print(("AKTUALISIERE", u, v))
+                    log.debug("AKTUALISIERE %s %s", u, v)
                     if self.root.ids["relativemode"].isChecked():
-                        print("!! set relative values ...")
+                        log.debug("!! set relative values ...")
                         self.obj.Object.Proxy.setpointRelativeZ(u, v, h, w)
                         if updateRelative:
                             self.obj.Object.Proxy.setpointRelativeZ(
@@ -428,13 +522,13 @@ class MyApp(object):
                         #   self.obj.Object.Proxy.setpointRelativeZ(u,v,h,w)
 
                     else:
-                        print("set absolute ")
+                        log.debug("set absolute ")
                         self.obj.Object.Proxy.setpointZ(u, v, h, w)
                 else:
                     self.getInfo()
                     h = g[v][u][2]
 
-                    print(("u,v,h", u, v, h))
+                    log.debug("u,v,h %s %s %s", u, v, h)
 
                     uc = self.obj.Object.nNodes_u
                     vc = self.obj.Object.nNodes_v
@@ -442,22 +536,27 @@ class MyApp(object):
                     self.root.ids["hd"].setValue(h)
 
                     self.root.ids["h"].setText(str(h))
-                    print(("hole weight von ", ((v) * uc + u, "uc,vc", uc, vc)))
+                    log.debug("hole weight von %s", (v * uc + u, 'uc,vc', uc, vc))
                     # print(self.obj.Object.weights)
 
                     w = self.obj.Object.weights[(v) * uc + u]
                     self.root.ids["wd"].setValue(w)
                     # self.root.ids['w'].setText(str(h))
-                    print(("hole  werte u,v ", u, v, "h,w", h, w))
+                    log.debug("hole  werte u,v %s %s h,w %s %s", u, v, h, w)
 
-        self.obj.Object.Proxy.updatePoles()
-        self.obj.Object.Proxy.showGriduv()
+        # the poles are already set, a coarse surface is shown at once,
+        # the full rebuild waits for the burst end, in read mode nothing
+        # has changed
+        if self.root.ids["setmode"].isChecked():
+            self.obj.Object.Proxy.preview()
+            self.scheduler.schedule(self.obj.Object.Document)
 
         self.root.ids["setmode"].setChecked(False)
 
+    @nurbs_trace.traced("dialog.getDataFromNurbs")
     def getDataFromNurbs(self):
         """Docstring missing."""
-        print("start getDataFromNurbs")
+        log.debug("start getDataFromNurbs")
 
         self.lock = True
 
@@ -503,7 +602,7 @@ class MyApp(object):
         self.root.ids["wd"].setValue(w)
         self.root.ids["w"].setText(str(w))
 
-        print(("hole  werte u,v ", u, v, "h,w", h, w))
+        log.debug("hole  werte u,v %s %s h,w %s %s", u, v, h, w)
 
         try:
             ss = App.ActiveDocument.Shape
@@ -513,8 +612,9 @@ class MyApp(object):
 
         self.root.ids["setmode"].setChecked(False)
         self.lock = False
-        print("getDataFromNurbs fertig")
+        log.debug("getDataFromNurbs fertig")
 
+    @nurbs_trace.traced("dialog.modHeight")
     def modHeight(self):
         """Modify Object if  dialog has changed."""
         u = int(self.root.ids["ud"].value())
@@ -523,6 +623,7 @@ class MyApp(object):
         self.root.ids["hcombo"].setCurrentIndex(100 + int(h))
         self.update()
 
+    @nurbs_trace.traced("dialog.modWeight")
     def modWeight(self):
         """Modify Object if  dialog has changed."""
         u = int(self.root.ids["ud"].value())
@@ -535,18 +636,18 @@ class MyApp(object):
         """Docstring missing."""
         return
 
-        print("get obj")
-        print((self.root))
-        print((self.obj))
-        print((self.obj.Object.Label))
+        log.debug("get obj")
+        log.debug("%s", self.root)
+        log.debug("%s", self.obj)
+        log.debug("%s", self.obj.Object.Label)
 
-        print("shape ..")
-        print((self.obj.Object.Proxy.g.shape))
+        log.debug("shape ..")
+        log.debug("%s", self.obj.Object.Proxy.g.shape)
 
     def vFinished(self):
         """Docstring missing."""
         self.lock = False
-        print("vFinished")
+        log.debug("vFinished")
 
     def processVcombo(self):
         """Docstring missing."""
@@ -555,7 +656,7 @@ class MyApp(object):
         self.lock = True
         vc = self.root.ids["vcombo"]
         rc = self.root.ids["vcombo"].currentText()
-        print(("set vcombo Mode is ", rc))
+        log.debug("set vcombo Mode is %s", rc)
         vc.clear()
         start = 2
         ende = self.obj.Object.nNodes_v
@@ -573,7 +674,7 @@ class MyApp(object):
         self.lock = True
         uc = self.root.ids["ucombo"]
         rc = self.root.ids["ucombo"].currentText()
-        print(("set ucombo Mode is ", rc))
+        log.debug("set ucombo Mode is %s", rc)
         uc.clear()
         start = 2
         ende = self.obj.Object.nNodes_u
@@ -593,7 +694,7 @@ class MyApp(object):
         rc = self.root.ids["hcombo"].currentText()
         if rc == "":
             rc = "0"
-        print(("set hcombo Mode is ", rc))
+        log.debug("set hcombo Mode is %s", rc)
         uc.clear()
         start = 2
         ende = self.obj.Object.nNodes_u
@@ -604,10 +705,10 @@ class MyApp(object):
         uc.setCurrentIndex(int(rc) - start)
         self.root.ids["h"].setText(rc)
         self.root.ids["hd"].setValue(int(rc))
-        print("rufe modHeight")
+        log.debug("rufe modHeight")
         self.modHeight()
         self.update(True)
-        print("done")
+        log.debug("done")
         self.lock = False
 
     def processWcombo(self):
@@ -617,7 +718,7 @@ class MyApp(object):
         self.lock = True
         uc = self.root.ids["wcombo"]
         rc = self.root.ids["wcombo"].currentText()
-        print(("set wcombo Mode is ", rc))
+        log.debug("set wcombo Mode is %s", rc)
         uc.clear()
         start = 1
         ende = 20 + 1
@@ -928,7 +1029,7 @@ def mydialog(obj=None):
     # m_dia.parse2(layout)
     # m_dia.run(layout)
 
-    m_dia = nurbswb.ui_dialog.nurbs_dialog(mw, layout_new)
+    m_dia = ui_dialog.nurbs_dialog(mw, layout_new)
     m_dia.app = app
     m_dia.populateUI()
 
@@ -959,7 +1060,7 @@ def mydialog(obj=None):
     '''
 
     #TODO: debug info to be commented out
-    print(m_dia.ids.keys())
+    log.debug("%s", m_dia.ids.keys())
 
     m_dia.ids["polegrid"].hide()
     m_dia.ids["polegrid"].stateChanged.connect(app.calculatePoleGrid)
@@ -970,6 +1071,11 @@ def mydialog(obj=None):
     #m_dia.ids["relativemode"].hide()
     m_dia.ids["relativemode"].stateChanged.connect(app.relativeMode)
 
+    # rebuild at once when the dial is released
+    for k in ("hd", "wd"):
+        if k in m_dia.ids:
+            m_dia.ids[k].sliderReleased.connect(app.flush)
+
 
     '''
     m_dia.ids["w"].hide()
@@ -0,0 +1,511 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_eval.py
+
+Vectorized B-spline / NURBS surface evaluator.
+
+    Poles, weights, knots and degrees are taken as numpy arrays and the
+    surface is evaluated on whole parameter arrays at once, no call to
+    OCC is made for each point.
+
+    The evaluator needs only numpy, so it could be used in worker
+    processes without FreeCAD. SurfaceData.to_bspline imports FreeCAD
+    and Part, surface_data, sample_grid and sample_points take a Part
+    surface and call its methods.
+
+References:
+    Piegl, Tiller - The NURBS Book, 2nd ed.
+        A2.1 FindSpan, A2.3 DersBasisFuns, A4.4 RatSurfaceDerivs
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+from math import factorial
+
+import numpy as np
+
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_log import get_logger
+
+log = get_logger(__name__)
+
+
+def comb(n, k):
+    """Return the binomial coefficient n over k."""
+    return factorial(n) // (factorial(k) * factorial(n - k))
+
+
+def full_knots(knots, mults):
+    """Return the flat knot vector from distinct knots and multiplicities.
+
+    Args:
+        knots (array_like): distinct knot values
+        mults (array_like): multiplicity of each knot
+
+    Returns:
+        np_array: flat knot vector
+    """
+    return np.repeat(np.asarray(knots, dtype=float), np.asarray(mults, dtype=int))
+
+
+def split_knots(flat, tol=1e-12):
+    """Return distinct knots and multiplicities from a flat knot vector.
+
+    Args:
+        flat (array_like): flat knot vector
+        tol (float): tolerance for two knots to be the same
+
+    Returns:
+        tuple: (knots list, multiplicities list)
+    """
+    flat = np.asarray(flat, dtype=float)
+    new = np.empty(len(flat), dtype=bool)
+    new[0] = True
+    new[1:] = np.diff(flat) > tol
+    idx = np.flatnonzero(new)
+    mults = np.diff(np.append(idx, len(flat)))
+
+    return flat[idx].tolist(), mults.tolist()
+
+
+def find_spans(npoles, degree, knots, t):
+    """Find the knot spans of the parameters t (vectorized A2.1).
+
+    Args:
+        npoles (int): number of poles
+        degree (int): degree
+        knots (np_array): flat knot vector
+        t (np_array): parameters
+
+    Returns:
+        np_array: span index for every parameter
+    """
+    t = np.asarray(t, dtype=float)
+    spans = np.searchsorted(knots, t, side="right") - 1
+
+    return np.clip(spans, degree, npoles - 1)
+
+
+def basis_funs_ders(spans, t, degree, knots, nder=0):
+    """Compute the non zero basis functions and derivatives (vectorized A2.3).
+
+    Args:
+        spans (np_array): knot spans of the parameters, see find_spans
+        t (np_array): parameters, same shape as spans
+        degree (int): degree
+        knots (np_array): flat knot vector
+        nder (int): number of derivatives. Defaults to 0
+
+    Returns:
+        np_array: (len(t), nder + 1, degree + 1) array, [:, k, r] is the
+            k-th derivative of the basis function spans - degree + r
+    """
+    t = np.asarray(t, dtype=float).ravel()
+    spans = np.asarray(spans).ravel()
+    m = len(t)
+    p = degree
+
+    ndu = np.zeros((m, p + 1, p + 1))
+    left = np.zeros((m, p + 1))
+    right = np.zeros((m, p + 1))
+    ndu[:, 0, 0] = 1.0
+
+    for j in range(1, p + 1):
+        left[:, j] = t - knots[spans + 1 - j]
+        right[:, j] = knots[spans + j] - t
+        saved = np.zeros(m)
+
+        for r in range(j):
+            # lower triangle
+            ndu[:, j, r] = right[:, r + 1] + left[:, j - r]
+            den = ndu[:, j, r]
+            temp = np.divide(ndu[:, r, j - 1], den,
+                             out=np.zeros(m), where=den != 0)
+            # upper triangle
+            ndu[:, r, j] = saved + right[:, r + 1] * temp
+            saved = left[:, j - r] * temp
+
+        ndu[:, j, j] = saved
+
+    ders = np.zeros((m, nder + 1, p + 1))
+    ders[:, 0, :] = ndu[:, :, p]
+
+    if nder == 0 or p == 0:
+        return ders
+
+    a = np.zeros((m, 2, p + 1))
+
+    for r in range(p + 1):
+        s1, s2 = 0, 1
+        a[:, 0, 0] = 1.0
+
+        for k in range(1, nder + 1):
+            d = np.zeros(m)
+            rk = r - k
+            pk = p - k
+
+            if r >= k:
+                den = ndu[:, pk + 1, rk]
+                a[:, s2, 0] = np.divide(a[:, s1, 0], den,
+                                        out=np.zeros(m), where=den != 0)
+                d = a[:, s2, 0] * ndu[:, rk, pk]
+
+            j1 = 1 if rk >= -1 else -rk
+            j2 = k - 1 if r - 1 <= pk else p - r
+
+            for j in range(j1, j2 + 1):
+                den = ndu[:, pk + 1, rk + j]
+                a[:, s2, j] = np.divide(a[:, s1, j] - a[:, s1, j - 1], den,
+                                        out=np.zeros(m), where=den != 0)
+                d += a[:, s2, j] * ndu[:, rk + j, pk]
+
+            if r <= pk:
+                den = ndu[:, pk + 1, r]
+                a[:, s2, k] = np.divide(-a[:, s1, k - 1], den,
+                                        out=np.zeros(m), where=den != 0)
+                d += a[:, s2, k] * ndu[:, r, pk]
+
+            ders[:, k, r] = d
+            s1, s2 = s2, s1
+
+    fac = p
+    for k in range(1, nder + 1):
+        ders[:, k, :] *= fac
+        fac *= p - k
+
+    return ders
+
+
+def basis_matrix(npoles, degree, knots, t, nder=0):
+    """Return the dense collocation matrices of the parameters t.
+
+    Args:
+        npoles (int): number of poles
+        degree (int): degree
+        knots (np_array): flat knot vector
+        t (np_array): parameters
+        nder (int): number of derivatives. Defaults to 0
+
+    Returns:
+        np_array: (nder + 1, len(t), npoles) array
+    """
+    t = np.asarray(t, dtype=float).ravel()
+    spans = find_spans(npoles, degree, knots, t)
+    ders = basis_funs_ders(spans, t, degree, knots, nder)
+
+    mat = np.zeros((nder + 1, len(t), npoles))
+    rows = np.arange(len(t))[:, None]
+    cols = spans[:, None] - degree + np.arange(degree + 1)[None, :]
+
+    for k in range(nder + 1):
+        mat[k, rows, cols] = ders[:, k, :]
+
+    return mat
+
+
+def rational_derivatives(aders, order):
+    """Compute the derivatives of a rational surface (vectorized A4.4).
+
+    Args:
+        aders (np_array): (..., order + 1, order + 1, 4) homogeneous
+            derivatives, the last component is the weight
+        order (int): derivative order
+
+    Returns:
+        np_array: (..., order + 1, order + 1, 3) cartesian derivatives
+    """
+    a = aders[..., :3]
+    w = aders[..., 3]
+    skl = np.zeros(a.shape)
+
+    for k in range(order + 1):
+        for l in range(order - k + 1):
+            v = a[..., k, l, :].copy()
+
+            for j in range(1, l + 1):
+                v -= comb(l, j) * w[..., 0, j, None] * skl[..., k, l - j, :]
+
+            for i in range(1, k + 1):
+                v -= comb(k, i) * w[..., i, 0, None] * skl[..., k - i, l, :]
+                v2 = np.zeros(v.shape)
+
+                for j in range(1, l + 1):
+                    v2 += comb(l, j) * w[..., i, j, None] * skl[..., k - i, l - j, :]
+
+                v -= comb(k, i) * v2
+
+            skl[..., k, l, :] = v / w[..., 0, 0, None]
+
+    return skl
+
+
+class SurfaceData:
+    """NURBS surface described by numpy arrays.
+
+    Attributes:
+        poles (np_array): (nu, nv, 3) poles
+        weights (np_array): (nu, nv) weights
+        knots_u (np_array): flat knot vector in u
+        knots_v (np_array): flat knot vector in v
+        degree_u (int): degree in u
+        degree_v (int): degree in v
+    """
+
+    def __init__(self, poles, weights, knots_u, knots_v, degree_u, degree_v):
+        """Initialize class."""
+        self.poles = np.asarray(poles, dtype=float)
+        nu, nv = self.poles.shape[:2]
+
+        if weights is None:
+            self.weights = np.ones((nu, nv))
+        else:
+            self.weights = np.asarray(weights, dtype=float).reshape(nu, nv)
+
+        self.knots_u = np.asarray(knots_u, dtype=float)
+        self.knots_v = np.asarray(knots_v, dtype=float)
+        self.degree_u = int(degree_u)
+        self.degree_v = int(degree_v)
+
+        if len(self.knots_u) != nu + self.degree_u + 1:
+            raise ValueError("knots_u length does not match poles and degree")
+
+        if len(self.knots_v) != nv + self.degree_v + 1:
+            raise ValueError("knots_v length does not match poles and degree")
+
+    @classmethod
+    def from_bspline(cls, bs):
+        """Create the data from a Part.BSplineSurface.
+
+        Periodic surfaces are converted to their non periodic equivalent
+        on a copy, bs is not modified.
+        """
+        if bs.isUPeriodic() or bs.isVPeriodic():
+            bs = bs.copy()
+            if bs.isUPeriodic():
+                bs.setUNotPeriodic()
+            if bs.isVPeriodic():
+                bs.setVNotPeriodic()
+
+        poles = np.array(bs.getPoles(), dtype=float)
+        weights = np.array(bs.getWeights(), dtype=float)
+        ku = full_knots(bs.getUKnots(), bs.getUMultiplicities())
+        kv = full_knots(bs.getVKnots(), bs.getVMultiplicities())
+
+        return cls(poles, weights, ku, kv, bs.UDegree, bs.VDegree)
+
+    def to_bspline(self):
+        """Return a Part.BSplineSurface built from the data."""
+        import FreeCAD
+        import Part
+
+        uk, um = split_knots(self.knots_u)
+        vk, vm = split_knots(self.knots_v)
+
+        poles = [[FreeCAD.Vector(*p) for p in row] for row in self.poles.tolist()]
+
+        bs = Part.BSplineSurface()
+        bs.buildFromPolesMultsKnots(
+            poles, um, vm, uk, vk, False, False,
+            self.degree_u, self.degree_v, self.weights.tolist())
+
+        return bs
+
+    def copy(self):
+        """Return a deep copy."""
+        return SurfaceData(self.poles.copy(), self.weights.copy(),
+                           self.knots_u.copy(), self.knots_v.copy(),
+                           self.degree_u, self.degree_v)
+
+    @property
+    def shape(self):
+        """Return the pole grid shape (nu, nv)."""
+        return self.poles.shape[:2]
+
+    @property
+    def rational(self):
+        """Return True if weights are not all equal."""
+        return bool(np.ptp(self.weights) > 1e-14)
+
+    @property
+    def homogeneous(self):
+        """Return the (nu, nv, 4) homogeneous poles (w * P, w)."""
+        w = self.weights[..., None]
+        return np.concatenate((self.poles * w, w), axis=-1)
+
+    def domain(self):
+        """Return the parametric bounds (umin, umax, vmin, vmax)."""
+        nu, nv = self.shape
+        return (self.knots_u[self.degree_u], self.knots_u[nu],
+                self.knots_v[self.degree_v], self.knots_v[nv])
+
+    def derivatives(self, u, v, order=0, grid=False):
+        """Evaluate points and partial derivatives.
+
+        Args:
+            u (array_like): u parameters
+            v (array_like): v parameters
+            order (int): maximum derivative order. Defaults to 0
+            grid (bool): if True evaluate on the tensor grid u x v,
+                otherwise u and v are paired. Defaults to False
+
+        Returns:
+            np_array: (..., order + 1, order + 1, 3) array, [..., k, l, :]
+                is the derivative k times in u and l times in v, entries
+                with k + l > order are zero. Leading shape is
+                (len(u), len(v)) for grid, u.shape otherwise.
+        """
+        u = np.asarray(u, dtype=float)
+        v = np.asarray(v, dtype=float)
+        nu, nv = self.shape
+        pu, pv = self.degree_u, self.degree_v
+        pw = self.homogeneous
+
+        if grid:
+            bu = basis_matrix(nu, pu, self.knots_u, u, order)
+            bv = basis_matrix(nv, pv, self.knots_v, v, order)
+            out = np.zeros((u.size, v.size, order + 1, order + 1, 4))
+
+            for k in range(order + 1):
+                # contract u first, it is reused for every l
+                tmp = (bu[k] @ pw.reshape(nu, -1)).reshape(u.size, nv, 4)
+                for l in range(order - k + 1):
+                    out[:, :, k, l] = np.matmul(bv[l], tmp)
+        else:
+            shp = np.broadcast(u, v).shape
+            u = np.broadcast_to(u, shp).ravel()
+            v = np.broadcast_to(v, shp).ravel()
+
+            su = find_spans(nu, pu, self.knots_u, u)
+            sv = find_spans(nv, pv, self.knots_v, v)
+            du = basis_funs_ders(su, u, pu, self.knots_u, order)
+            dv = basis_funs_ders(sv, v, pv, self.knots_v, order)
+
+            iu = su[:, None] - pu + np.arange(pu + 1)[None, :]
+            iv = sv[:, None] - pv + np.arange(pv + 1)[None, :]
+            # (m, pu + 1, pv + 1, 4) local poles
+            loc = pw[iu[:, :, None], iv[:, None, :]]
+
+            out = np.zeros((u.size, order + 1, order + 1, 4))
+            for k in range(order + 1):
+                tmp = np.einsum("mi,mijc->mjc", du[:, k], loc)
+                for l in range(order - k + 1):
+                    out[:, k, l] = np.einsum("mj,mjc->mc", dv[:, l], tmp)
+
+            out = out.reshape(shp + out.shape[1:])
+
+        return rational_derivatives(out, order)
+
+    def evaluate(self, u, v, grid=False):
+        """Evaluate surface points, see derivatives for the arguments."""
+        return self.derivatives(u, v, 0, grid)[..., 0, 0, :]
+
+    def normals(self, u, v, grid=False):
+        """Evaluate unit normals Su x Sv, see derivatives for the arguments."""
+        d = self.derivatives(u, v, 1, grid)
+        n = np.cross(d[..., 1, 0, :], d[..., 0, 1, :])
+        ln = np.linalg.norm(n, axis=-1, keepdims=True)
+
+        return np.divide(n, ln, out=np.zeros(n.shape), where=ln > 0)
+
+
+# --- OCC interface with fallback
+
+
+def _occ_values(sf, u, v):
+    """Evaluate sf point by point, used as fallback."""
+    nurbs_trace.count("sf.value", len(u))
+    return np.array([tuple(sf.value(a, b)) for a, b in zip(u, v)],
+                    dtype=float).reshape(-1, 3)
+
+
+def surface_data(sf, verify=True, tol=1e-7):
+    """Return the SurfaceData of sf or None if it could not be used.
+
+    Only BSplineSurfaces are converted, if verify is True the kernel is
+    checked against sf.value on some points.
+
+    Args:
+        sf (Part.Surface): surface
+        verify (bool): check the values against OCC. Defaults to True
+        tol (float): relative tolerance for the check. Defaults to 1e-7
+
+    Returns:
+        SurfaceData: or None
+    """
+    if sf.__class__.__name__ != "BSplineSurface":
+        return None
+
+    try:
+        data = SurfaceData.from_bspline(sf)
+    except Exception as e:
+        log.warning("surface_data: conversion failed %s", e)
+        return None
+
+    if verify:
+        u0, u1, v0, v1 = sf.bounds()
+        us = np.array([u0, u1, u0, u1, 0.5 * (u0 + u1), u0 + 0.3 * (u1 - u0)])
+        vs = np.array([v0, v0, v1, v1, 0.5 * (v0 + v1), v0 + 0.7 * (v1 - v0)])
+        ref = _occ_values(sf, us, vs)
+        size = max(np.ptp(data.poles.reshape(-1, 3), axis=0).max(), 1.0)
+
+        if np.abs(data.evaluate(us, vs) - ref).max() > tol * size:
+            log.info("surface_data: kernel check failed, OCC is used")
+            return None
+
+    return data
+
+
+def sample_grid(sf, us, vs, data=None):
+    """Evaluate sf on the tensor grid us x vs.
+
+    Args:
+        sf (Part.Surface): surface, used when data is None
+        us (array_like): u parameters
+        vs (array_like): v parameters
+        data (SurfaceData): if given sf is not inspected. Defaults to None
+
+    Returns:
+        np_array: (len(us), len(vs), 3) points
+    """
+    us = np.asarray(us, dtype=float).ravel()
+    vs = np.asarray(vs, dtype=float).ravel()
+
+    if data is None:
+        data = surface_data(sf)
+
+    if data is not None:
+        return data.evaluate(us, vs, grid=True)
+
+    uu, vv = np.meshgrid(us, vs, indexing="ij")
+
+    return _occ_values(sf, uu.ravel(), vv.ravel()).reshape(len(us), len(vs), 3)
+
+
+def sample_points(sf, u, v, data=None):
+    """Evaluate sf on the paired parameters u, v.
+
+    Args:
+        sf (Part.Surface): surface, used when data is None
+        u (array_like): u parameters
+        v (array_like): v parameters
+        data (SurfaceData): if given sf is not inspected. Defaults to None
+
+    Returns:
+        np_array: (N, 3) points
+    """
+    u = np.asarray(u, dtype=float).ravel()
+    v = np.asarray(v, dtype=float).ravel()
+
+    if data is None:
+        data = surface_data(sf)
+
+    if data is not None:
+        return data.evaluate(u, v)
+
+    return _occ_values(sf, u, v)
@@ -0,0 +1,390 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_fit.py
+
+Least squares fitting of a surface to a point cloud.
+
+    The points are read in chunks, every chunk is projected on a base
+    surface to get its parameters and added to the normal equations of
+    the least squares problem, then dropped:
+
+        fitter = SurfaceFitter(20, 20, domain=base.domain())
+        proj = Projector(base)
+        for pts in read_chunks("scan.xyz"):
+            uv, _dist, ok = proj.project(pts)
+            fitter.add(uv[ok], pts[ok])
+        data, rms = fitter.solve(fairing=1e-3)
+
+    fit_surface runs the same loop, the points the projection did not
+    converge on are dropped or, if the base surface is given as a Part
+    surface too, projected by OCC, see project_points. A pole acts only on the poles less
+    than degree + 1 lines apart, so the normal matrix is stored as a
+    stencil of (2 p + 1) x (2 q + 1) values for every pole. Memory
+    depends on the pole count and on the chunk size, not on the size
+    of the cloud.
+
+    The optional regularization adds to the fit the energy of the pole
+    net, smoothing on the first differences (membrane), fairing on the
+    second differences (thin plate). Both are relative to the mean
+    diagonal of the normal matrix, poles not reached by any point need
+    one of them.
+
+    The normal matrix is solved with scipy.sparse if scipy is installed,
+    else as a dense matrix, fine up to a few thousand poles. FreeCAD is
+    imported only for the OCC projection.
+
+References:
+    Piegl, Tiller - The NURBS Book, 2nd ed.
+        9.4.3 Least squares surface approximation
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import itertools
+
+import numpy as np
+
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_degree import uniform_knots
+from freecad.nurbswb.nurbs_eval import SurfaceData, basis_funs_ders, find_spans
+from freecad.nurbswb.nurbs_log import get_logger
+from freecad.nurbswb.nurbs_project import Projector, project_points
+
+
+log = get_logger(__name__)
+
+# points read or projected at once
+CHUNK = 100000
+
+# points added to the normal equations at once
+_BLOCK = 8192
+
+
+def _sparse():
+    """Return the scipy.sparse modules, None if scipy is missing."""
+    try:
+        import scipy.sparse
+        import scipy.sparse.linalg
+    except ImportError:
+        return None
+
+    return scipy.sparse
+
+
+def iter_chunks(points, size=CHUNK):
+    """Yield (n, 3) arrays of at most size points.
+
+    Args:
+        points: an array or a sequence of points, e.g. the Points of a
+            Points.Points kernel object
+        size (int): points in a chunk. Defaults to CHUNK
+    """
+    for a in range(0, len(points), size):
+        blk = points[a:a + size]
+
+        if not isinstance(blk, np.ndarray):
+            blk = [tuple(p) for p in blk]
+
+        yield np.asarray(blk, dtype=float).reshape(-1, 3)
+
+
+def read_chunks(path, size=CHUNK, comments="#"):
+    """Yield the points of a text file in (n, 3) arrays.
+
+    Every line holds x y z, separated by spaces or commas, more columns
+    are ignored. Only size lines are in memory at once.
+
+    Args:
+        path (str): file name, e.g. an .xyz or .asc file
+        size (int): points in a chunk. Defaults to CHUNK
+        comments (str): comment prefix. Defaults to "#"
+    """
+    with open(path) as f:
+        while True:
+            lines = [ln.replace(",", " ") for ln in itertools.islice(f, size)]
+
+            if not lines:
+                break
+
+            pts = np.loadtxt(lines, comments=comments, usecols=(0, 1, 2),
+                             ndmin=2)
+
+            if len(pts):
+                yield pts
+
+
+def _difference(count, order):
+    """Return the (count - order, count) matrix of the differences."""
+    return np.diff(np.eye(count), n=order, axis=0)
+
+
+class SurfaceFitter(object):
+    """Normal equations of a least squares fit, see the module docstring.
+
+    Attributes:
+        count (int): points added
+        knots_u (np_array): flat knot vector in u
+        knots_v (np_array): flat knot vector in v
+        degree_u (int): degree in u
+        degree_v (int): degree in v
+    """
+
+    def __init__(self, count_u, count_v, degree_u=3, degree_v=3,
+                 domain=(0.0, 1.0, 0.0, 1.0)):
+        """Init empty equations for a surface with uniform clamped knots.
+
+        Args:
+            count_u (int): poles in u, more than degree_u
+            count_v (int): poles in v, more than degree_v
+            degree_u (int): degree in u. Defaults to 3
+            degree_v (int): degree in v. Defaults to 3
+            domain (tuple): (umin, umax, vmin, vmax) of the parameters.
+                Defaults to the unit square
+        """
+        if count_u <= degree_u or count_v <= degree_v:
+            raise ValueError(
+                f"{count_u} x {count_v} poles are too few for degrees "
+                f"{degree_u}, {degree_v}")
+
+        umin, umax, vmin, vmax = domain
+        self.knots_u = umin + (umax - umin) * np.array(
+            uniform_knots(count_u, degree_u))
+        self.knots_v = vmin + (vmax - vmin) * np.array(
+            uniform_knots(count_v, degree_v))
+        self.degree_u = degree_u
+        self.degree_v = degree_v
+        self.shape = (count_u, count_v)
+
+        p, q = degree_u, degree_v
+        self._width = (2 * p + 1, 2 * q + 1)
+        size = count_u * count_v
+
+        self.ata = np.zeros((size, self._width[0] * self._width[1]))
+        self.atb = np.zeros((size, 3))
+        self.btb = 0.0
+        self.count = 0
+
+        # stencil offset of the pair of local basis functions (a1, b1),
+        # (a2, b2)
+        a1, b1, a2, b2 = np.meshgrid(np.arange(p + 1), np.arange(q + 1),
+                                     np.arange(p + 1), np.arange(q + 1),
+                                     indexing="ij")
+        self._offsets = ((a2 - a1 + p) * self._width[1]
+                         + (b2 - b1 + q)).reshape((p + 1) * (q + 1), -1)
+
+    @property
+    def nbytes(self):
+        """Return the size of the equations."""
+        return self.ata.nbytes + self.atb.nbytes
+
+    def _basis(self, uv):
+        """Return the pole indices and basis products of parameters."""
+        nu, nv = self.shape
+        p, q = self.degree_u, self.degree_v
+        u, v = uv[:, 0], uv[:, 1]
+
+        su = find_spans(nu, p, self.knots_u, u)
+        sv = find_spans(nv, q, self.knots_v, v)
+        fu = basis_funs_ders(su, u, p, self.knots_u)[:, 0, :]
+        fv = basis_funs_ders(sv, v, q, self.knots_v)[:, 0, :]
+
+        rows = ((su[:, None] - p + np.arange(p + 1))[:, :, None] * nv
+                + (sv[:, None] - q + np.arange(q + 1))[:, None, :])
+        funs = fu[:, :, None] * fv[:, None, :]
+
+        return rows.reshape(len(u), -1), funs.reshape(len(u), -1)
+
+    @nurbs_trace.traced("SurfaceFitter.add")
+    def add(self, uv, points):
+        """Add points to the equations.
+
+        Args:
+            uv (array_like): (N, 2) parameters of the points, inside the
+                domain
+            points (array_like): (N, 3) points
+        """
+        uv = np.asarray(uv, dtype=float).reshape(-1, 2)
+        pts = np.asarray(points, dtype=float).reshape(-1, 3)
+        size, width = self.ata.shape
+
+        for a in range(0, len(pts), _BLOCK):
+            rows, funs = self._basis(uv[a:a + _BLOCK])
+            blk = pts[a:a + _BLOCK]
+
+            keys = rows[:, :, None] * width + self._offsets[None]
+            vals = funs[:, :, None] * funs[:, None, :]
+            self.ata += np.bincount(
+                keys.ravel(), vals.ravel(), minlength=size * width
+            ).reshape(size, width)
+
+            for c in range(3):
+                self.atb[:, c] += np.bincount(
+                    rows.ravel(), (funs * blk[:, c, None]).ravel(),
+                    minlength=size)
+
+            self.btb += float(np.einsum("ij,ij->", blk, blk))
+
+        self.count += len(pts)
+        nurbs_trace.count("fit.points", len(pts))
+
+    def _entries(self):
+        """Return the (rows, cols, values) of the normal matrix."""
+        nu, nv = self.shape
+        p, q = self.degree_u, self.degree_v
+
+        di, dj = np.divmod(np.arange(self.ata.shape[1]), self._width[1])
+        di, dj = di - p, dj - q
+        iu, iv = np.divmod(np.arange(nu * nv), nv)
+
+        ru = iu[:, None] + di[None, :]
+        rv = iv[:, None] + dj[None, :]
+        keep = (self.ata != 0.0) & (ru >= 0) & (ru < nu) & (rv >= 0) & (rv < nv)
+
+        rows = np.broadcast_to(np.arange(nu * nv)[:, None], keep.shape)
+
+        return rows[keep], (ru * nv + rv)[keep], self.ata[keep]
+
+    def _regularization(self, kron, eye, smoothing, fairing):
+        """Return the energy matrix of the pole net."""
+        nu, nv = self.shape
+        res = 0.0
+
+        if smoothing > 0.0:
+            du = _difference(nu, 1)
+            dv = _difference(nv, 1)
+            res = res + smoothing * (kron(du.T @ du, eye(nv))
+                                     + kron(eye(nu), dv.T @ dv))
+
+        if fairing > 0.0:
+            d1u = _difference(nu, 1)
+            d1v = _difference(nv, 1)
+            parts = [kron(d1u.T @ d1u, d1v.T @ d1v) * 2.0]
+
+            if nu > 2:
+                d2u = _difference(nu, 2)
+                parts.append(kron(d2u.T @ d2u, eye(nv)))
+
+            if nv > 2:
+                d2v = _difference(nv, 2)
+                parts.append(kron(eye(nu), d2v.T @ d2v))
+
+            res = res + fairing * sum(parts[1:], parts[0])
+
+        return res
+
+    @nurbs_trace.traced("SurfaceFitter.solve")
+    def solve(self, smoothing=0.0, fairing=0.0):
+        """Solve the equations.
+
+        Args:
+            smoothing (float): weight of the first differences of the
+                poles. Defaults to 0.0
+            fairing (float): weight of the second differences of the
+                poles. Defaults to 0.0
+
+        Returns:
+            tuple: (SurfaceData, rms) rms is the root mean square
+                distance of the points from the surface at their
+                parameters
+        """
+        nu, nv = self.shape
+        size = nu * nv
+        rows, cols, vals = self._entries()
+
+        diag = self.ata[:, self.ata.shape[1] // 2]
+        scale = float(diag.mean()) if np.any(diag > 0.0) else 1.0
+
+        if smoothing <= 0.0 and fairing <= 0.0 and np.any(diag <= 0.0):
+            raise ValueError(
+                f"{np.count_nonzero(diag <= 0.0)} poles have no points, "
+                "use smoothing or fairing")
+
+        sparse = _sparse()
+
+        if sparse is not None:
+            mat = sparse.csr_matrix((vals, (rows, cols)), shape=(size, size))
+            reg = self._regularization(
+                lambda a, b: sparse.kron(a, b, format="csr"),
+                lambda n: sparse.identity(n, format="csr"),
+                smoothing * scale, fairing * scale)
+            poles = sparse.linalg.spsolve((mat + reg).tocsc(), self.atb)
+        else:
+            mat = np.zeros((size, size))
+            mat[rows, cols] = vals
+            reg = self._regularization(
+                np.kron, np.eye, smoothing * scale, fairing * scale)
+
+            try:
+                poles = np.linalg.solve(mat + reg, self.atb)
+            except np.linalg.LinAlgError:
+                poles = np.full((size, 3), np.nan)
+
+        poles = np.asarray(poles).reshape(size, 3)
+
+        if not np.all(np.isfinite(poles)):
+            raise ValueError("singular fit, use smoothing or fairing")
+
+        # |A P - B|^2 from the accumulated products
+        res = (np.einsum("ij,ij->", poles, np.asarray(mat @ poles))
+               - 2.0 * np.einsum("ij,ij->", poles, self.atb) + self.btb)
+        rms = float(np.sqrt(max(res, 0.0) / max(self.count, 1)))
+
+        log.debug("fit of %s points on %s x %s poles, rms %.4g",
+                  self.count, nu, nv, rms)
+
+        data = SurfaceData(poles.reshape(nu, nv, 3), None,
+                           self.knots_u, self.knots_v,
+                           self.degree_u, self.degree_v)
+
+        return data, rms
+
+
+@nurbs_trace.traced("nurbs_fit.fit_surface")
+def fit_surface(chunks, base, count_u, count_v, degree_u=3, degree_v=3,
+                smoothing=0.0, fairing=0.0, sf=None):
+    """Fit a surface to a stream of points.
+
+    Args:
+        chunks (iterable): (n, 3) point arrays, see iter_chunks and
+            read_chunks
+        base (SurfaceData): surface giving the parameters of the points
+            by projection, the fit has its domain
+        count_u (int): poles in u
+        count_v (int): poles in v
+        degree_u (int): degree in u. Defaults to 3
+        degree_v (int): degree in v. Defaults to 3
+        smoothing (float): see SurfaceFitter.solve. Defaults to 0.0
+        fairing (float): see SurfaceFitter.solve. Defaults to 0.0
+        sf (Part.BSplineSurface): base as a Part surface, the points
+            not converged are projected with sf.parameter, None to drop
+            them. Defaults to None
+
+    Returns:
+        tuple: (SurfaceData, rms)
+    """
+    proj = Projector(base)
+    fitter = SurfaceFitter(count_u, count_v, degree_u, degree_v,
+                           base.domain())
+    dropped = 0
+
+    for pts in chunks:
+        pts = np.asarray(pts, dtype=float).reshape(-1, 3)
+
+        if sf is not None:
+            fitter.add(project_points(sf, pts, proj=proj), pts)
+            continue
+
+        uv, _dist, ok = proj.project(pts)
+        dropped += len(ok) - np.count_nonzero(ok)
+        fitter.add(uv[ok], pts[ok])
+
+    if dropped:
+        log.warning("fit_surface: %s points not projected, dropped", dropped)
+
+    return fitter.solve(smoothing, fairing)
@@ -0,0 +1,240 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_interpolate.py
+
+Global interpolation of point grids.
+
+    A (n, m) grid of points is interpolated by a B-spline surface with
+    n x m poles, the surface passes through every point:
+
+        data = interpolate_surface(points, 3, 3, method="centripetal")
+
+    The parameters of the rows are the chord length (or centripetal)
+    parameters averaged over the columns, the knots are the averages
+    of degree consecutive parameters (A9.3, eq. 9.8). With these knots
+    the collocation matrix has at most degree non zero entries on each
+    side of the diagonal and is totally positive, it is factored once
+    without pivoting and solved for all the columns together, then the
+    same is done on the other direction (A9.4). The cost grows as
+    n * m * degree, no curve is interpolated one at a time.
+
+    The banded solver is written with numpy, scipy is not needed and
+    FreeCAD is not imported, Nurbs.interpolate stores the result on a
+    Nurbs object.
+
+References:
+    Piegl, Tiller - The NURBS Book, 2nd ed.
+        9.2.1 Global curve interpolation, A9.4 GlobalSurfInterp
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import numpy as np
+
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_eval import SurfaceData, basis_funs_ders, find_spans
+
+
+METHODS = ("uniform", "chord", "centripetal")
+
+
+def parameters(points, method="chord", axis=0):
+    """Return the parameters of the points along axis, on [0, 1].
+
+    The parameters of every line of points along axis are averaged,
+    lines of coincident points are skipped.
+
+    Args:
+        points (np_array): (..., 3) points
+        method (str): one of METHODS. Defaults to "chord"
+        axis (int): axis of the parameters. Defaults to 0
+
+    Returns:
+        np_array: points.shape[axis] parameters
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown parameterization {method!r}")
+
+    pts = np.moveaxis(np.asarray(points, dtype=float), axis, 0)
+    count = len(pts)
+    uniform = np.linspace(0.0, 1.0, count)
+
+    if method == "uniform" or count < 2:
+        return uniform
+
+    dist = np.linalg.norm(np.diff(pts, axis=0), axis=-1).reshape(count - 1, -1)
+
+    if method == "centripetal":
+        dist = np.sqrt(dist)
+
+    total = dist.sum(axis=0)
+    keep = total > 0.0
+
+    if not np.any(keep):
+        return uniform
+
+    csum = np.cumsum(dist[:, keep], axis=0) / total[keep]
+    res = np.concatenate(([0.0], csum.mean(axis=1)))
+    res[-1] = 1.0
+
+    return res
+
+
+def average_knots(params, degree):
+    """Return the clamped knot vector averaging the parameters (eq. 9.8).
+
+    Args:
+        params (np_array): increasing parameters, one for every pole
+        degree (int): degree, less than len(params)
+
+    Returns:
+        np_array: flat knot vector
+    """
+    params = np.asarray(params, dtype=float)
+    count = len(params)
+    csum = np.concatenate(([0.0], np.cumsum(params)))
+
+    # mean of params[j:j + degree] for j = 1 .. count - degree - 1
+    inner = (csum[degree + 1:count] - csum[1:count - degree]) / degree
+
+    return np.concatenate(
+        ([params[0]] * (degree + 1), inner, [params[-1]] * (degree + 1)))
+
+
+def collocation_band(params, knots, degree):
+    """Return the collocation matrix in band storage.
+
+    Args:
+        params (np_array): parameters, one for every pole
+        knots (np_array): flat knot vector
+        degree (int): degree
+
+    Returns:
+        np_array: (n, 2 * degree + 1) band, [k, degree + j - k] is the
+            entry of row k and column j
+    """
+    count = len(params)
+    spans = find_spans(count, degree, knots, params)
+    funs = basis_funs_ders(spans, params, degree, knots)[:, 0, :]
+
+    band = np.zeros((count, 2 * degree + 1))
+    rows = np.arange(count)[:, None]
+    offs = spans[:, None] - degree + np.arange(degree + 1) - rows + degree
+
+    band[rows, offs] = funs
+
+    return band
+
+
+@nurbs_trace.traced("nurbs_interpolate.solve_band")
+def solve_band(band, rhs, lower, upper):
+    """Solve a banded system without pivoting, for all the rhs columns.
+
+    Gaussian elimination without pivoting is stable for B-spline
+    collocation matrices, they are totally positive.
+
+    Args:
+        band (np_array): (n, lower + upper + 1) band, see
+            collocation_band
+        rhs (np_array): (n, ...) right hand sides
+        lower (int): number of sub diagonals
+        upper (int): number of super diagonals
+
+    Returns:
+        np_array: solution, the shape of rhs
+    """
+    ab = np.array(band, dtype=float)
+    x = np.array(rhs, dtype=float)
+    count = len(ab)
+
+    for k in range(count):
+        piv = ab[k, lower]
+
+        if piv == 0.0:
+            raise ValueError(f"singular collocation matrix at row {k}")
+
+        for i in range(k + 1, min(k + lower + 1, count)):
+            col = lower + k - i
+            fac = ab[i, col] / piv
+
+            if fac != 0.0:
+                ab[i, col:col + upper + 1] -= fac * ab[k, lower:]
+                x[i] -= fac * x[k]
+
+    for k in range(count - 1, -1, -1):
+        last = min(upper, count - 1 - k)
+
+        for j in range(1, last + 1):
+            x[k] -= ab[k, lower + j] * x[k + j]
+
+        x[k] /= ab[k, lower]
+
+    return x
+
+
+def interpolate_curves(points, params, degree, axis=0):
+    """Interpolate all the lines of points along axis with one matrix.
+
+    Args:
+        points (np_array): points, the lines are along axis
+        params (np_array): parameters of the points along axis
+        degree (int): degree, less than points.shape[axis]
+
+    Returns:
+        tuple: (poles, knots) poles have the shape of points
+    """
+    pts = np.moveaxis(np.asarray(points, dtype=float), axis, 0)
+    knots = average_knots(params, degree)
+    band = collocation_band(params, knots, degree)
+
+    poles = solve_band(band, pts.reshape(len(pts), -1), degree, degree)
+
+    return np.moveaxis(poles.reshape(pts.shape), 0, axis), knots
+
+
+@nurbs_trace.traced("nurbs_interpolate.interpolate_surface")
+def interpolate_surface(points, degree_u=3, degree_v=3, method="chord"):
+    """Return the surface through a grid of points.
+
+    Args:
+        points (array_like): (n, m, 3) points, u along the rows
+        degree_u (int): degree in u, lowered to n - 1 if needed.
+            Defaults to 3
+        degree_v (int): degree in v, lowered to m - 1 if needed.
+            Defaults to 3
+        method (str): parameterization, one of METHODS. Defaults to
+            "chord"
+
+    Returns:
+        SurfaceData: n x m poles, the point (k, l) is at the parameters
+            (params_u[k], params_v[l])
+    """
+    pts = np.asarray(points, dtype=float)
+
+    if pts.ndim != 3 or pts.shape[-1] != 3:
+        raise ValueError(f"a (n, m, 3) grid is needed, not {pts.shape}")
+
+    nu, nv = pts.shape[:2]
+
+    if nu < 2 or nv < 2:
+        raise ValueError(f"at least 2 x 2 points are needed, not {nu} x {nv}")
+
+    pu = max(1, min(int(degree_u), nu - 1))
+    pv = max(1, min(int(degree_v), nv - 1))
+
+    us = parameters(pts, method, axis=0)
+    vs = parameters(pts, method, axis=1)
+
+    # rows first, then the columns of the intermediate poles
+    poles, ku = interpolate_curves(pts, us, pu, axis=0)
+    poles, kv = interpolate_curves(poles, vs, pv, axis=1)
+
+    nurbs_trace.count("interpolate.points", nu * nv)
+
+    return SurfaceData(poles, None, ku, kv, pu, pv)
@@ -0,0 +1,152 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_log.py
+
+Leveled logging for the workbench modules.
+
+    Every module gets its logger with get_logger(__name__), messages
+    use the logging %-style arguments so they are formatted only when
+    the level is enabled:
+
+        log = get_logger(__name__)
+        log.debug("poles: %s", poles)
+
+    Levels are read from "User parameter:Plugins/nurbs/Logging":
+        Level (str): level of all the modules, default "WARNING"
+        <module> (str): level of a module, e.g. nurbs = "DEBUG"
+
+    Messages go to the FreeCAD report view, or to stderr without
+    FreeCAD.
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import logging
+
+
+ROOT = "nurbswb"
+
+PARAM_PATH = "User parameter:Plugins/nurbs/Logging"
+
+DEFAULT_LEVEL = "WARNING"
+
+
+class ConsoleHandler(logging.Handler):
+    """Send the records to the FreeCAD console."""
+
+    def emit(self, record):
+        """Print the record."""
+        import FreeCAD
+
+        try:
+            msg = self.format(record) + "\n"
+        except Exception:
+            self.handleError(record)
+            return
+
+        if record.levelno >= logging.ERROR:
+            FreeCAD.Console.PrintError(msg)
+        elif record.levelno >= logging.WARNING:
+            FreeCAD.Console.PrintWarning(msg)
+        else:
+            FreeCAD.Console.PrintMessage(msg)
+
+
+class Lazy(object):
+    """Call func only when the message is formatted.
+
+    log.debug("bounds %s", Lazy(lambda: shape.BoundBox))
+    """
+
+    __slots__ = ("func",)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __str__(self):
+        return str(self.func())
+
+
+def _short(name):
+    """Return the module name without the package."""
+    return name.rsplit(".", 1)[-1]
+
+
+def _params():
+    """Return the parameter group, None without FreeCAD."""
+    try:
+        import FreeCAD
+    except ImportError:
+        return None
+
+    return FreeCAD.ParamGet(PARAM_PATH)
+
+
+def _root():
+    """Return the workbench root logger, set it up on first call."""
+    root = logging.getLogger(ROOT)
+
+    if not root.handlers:
+        try:
+            import FreeCAD  # noqa
+
+            handler = ConsoleHandler()
+        except ImportError:
+            handler = logging.StreamHandler()
+
+        handler.setFormatter(logging.Formatter("%(name)s: %(message)s"))
+        root.addHandler(handler)
+        root.propagate = False
+
+        par = _params()
+        level = par.GetString("Level", DEFAULT_LEVEL) if par else DEFAULT_LEVEL
+        root.setLevel(level.upper())
+
+    return root
+
+
+def get_logger(name):
+    """Return the logger of a module.
+
+    Args:
+        name (str): module name, usually __name__
+    """
+    _root()
+
+    short = _short(name)
+    log = logging.getLogger(f"{ROOT}.{short}")
+
+    par = _params()
+    level = par.GetString(short, "") if par else ""
+
+    if level:
+        log.setLevel(level.upper())
+
+    return log
+
+
+def set_level(level, module=None):
+    """Set and store a level.
+
+    Args:
+        level (str): e.g. "DEBUG", "INFO", "WARNING"
+        module (str): module name, None for all modules. Defaults to None
+    """
+    level = level.upper()
+    par = _params()
+
+    if module is None:
+        _root().setLevel(level)
+        if par:
+            par.SetString("Level", level)
+    else:
+        short = _short(module)
+        logging.getLogger(f"{ROOT}.{short}").setLevel(level)
+        if par:
+            par.SetString(short, level)
@@ -0,0 +1,315 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_parallel.py
+
+Parallel computation of the face curvature maps and uv grids.
+
+    Every face is sent as a BRep string to a pool of headless worker
+    processes, the workers compute the uv map and the curvature mesh
+    arrays or the uv grid curves, the results are added to the document
+    as they arrive. Faces without a result, e.g. after a pool failure,
+    are reported to the caller, which computes them one at a time.
+
+    Parameters in "User parameter:Plugins/nurbs":
+        Parallel (bool): enable the parallel mode, default False
+        ParallelMinFaces (int): fewer faces are done in the GUI process,
+            the worker start up costs more than they save, default 8
+        ParallelWorkers (int): worker processes, 0 uses all the cores
+        ParallelChunk (int): faces sent to a worker in one job, default 1
+        ParallelPython (str): python executable able to import FreeCAD,
+            default the python next to the FreeCAD binary
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from freecad.nurbswb.nurbs_log import get_logger
+
+
+log = get_logger(__name__)
+
+
+def _params():
+    """Return the parameter group of the workbench."""
+    import FreeCAD
+
+    return FreeCAD.ParamGet("User parameter:Plugins/nurbs")
+
+
+def worker_python():
+    """Return the python executable for the workers, None if not found.
+
+    Inside the GUI sys.executable is the FreeCAD binary, spawning it
+    would open a new GUI, so a python interpreter is searched.
+    """
+    import FreeCAD
+
+    exe = _params().GetString("ParallelPython", "")
+
+    if exe:
+        return exe if os.path.isfile(exe) else None
+
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+
+    name = "python.exe" if sys.platform == "win32" else "python"
+    home = FreeCAD.getHomePath()
+
+    for sub in ("bin", ""):
+        exe = os.path.join(home, sub, name)
+        if os.path.isfile(exe):
+            return exe
+
+    return None
+
+
+def parallel_enabled(count):
+    """Return True if the parallel mode can be used for count faces."""
+    par = _params()
+
+    if not par.GetBool("Parallel", False):
+        return False
+
+    if count < max(2, par.GetInt("ParallelMinFaces", 8)):
+        return False
+
+    return worker_python() is not None
+
+
+def _face_job(jobs):
+    """Compute the curvature map of some faces, run in the worker.
+
+    Args:
+        jobs (list): (index, brep, mode, gridz)
+
+    Returns:
+        list: (index, result) result is a dict with the arrays or
+            with "error"
+    """
+    import Part
+
+    from freecad.nurbswb import uvgrid_generator as uvg
+
+    out = []
+
+    for index, brep, mode, gridz in jobs:
+        try:
+            shape = Part.Shape()
+            shape.importBrepFromString(brep)
+
+            pts, tris, colors = uvg.face_curvature(shape.Faces[0], mode, gridz)
+
+            out.append((index, {"points": pts, "triangles": tris,
+                                "colors": colors}))
+        except Exception as err:
+            out.append((index, {"error": f"{type(err).__name__}: {err}"}))
+
+    return out
+
+
+def _grid_job(jobs):
+    """Compute the uv grid of some faces, run in the worker.
+
+    Args:
+        jobs (list): (index, brep, fac)
+
+    Returns:
+        list: (index, result) result is a dict with the curves as a
+            BRep string and the curvature point arrays, or with "error"
+    """
+    import Part
+
+    from freecad.nurbswb import uvgrid_generator as uvg
+
+    out = []
+
+    for index, brep, fac in jobs:
+        try:
+            shape = Part.Shape()
+            shape.importBrepFromString(brep)
+
+            curves, kupts, kvpts, lena = uvg.face_grid(shape.Faces[0], fac)
+
+            out.append((index, {
+                "curves": Part.makeCompound(curves).exportBrepToString(),
+                "kupts": kupts, "kvpts": kvpts, "lena": lena}))
+        except Exception as err:
+            out.append((index, {"error": f"{type(err).__name__}: {err}"}))
+
+    return out
+
+
+def map_jobs(func, jobs, workers=None, chunk=None):
+    """Run jobs in worker processes.
+
+    Results are yielded as soon as a job is done, not in job order.
+
+    Args:
+        func (callable): module level function of a list of jobs,
+            returning a list of (index, result)
+        jobs (list): jobs, the first item is the index
+        workers (int): number of processes. Defaults to the
+            "ParallelWorkers" parameter
+        chunk (int): jobs sent to a worker at once. Defaults to the
+            "ParallelChunk" parameter
+
+    Yields:
+        tuple: (index, result)
+    """
+    par = _params()
+
+    if workers is None:
+        workers = par.GetInt("ParallelWorkers", 0)
+
+    if chunk is None:
+        chunk = par.GetInt("ParallelChunk", 1)
+
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    workers = min(workers, len(jobs))
+    chunk = max(chunk, 1)
+
+    chunks = [jobs[i:i + chunk] for i in range(0, len(jobs), chunk)]
+
+    ctx = multiprocessing.get_context("spawn")
+    ctx.set_executable(worker_python())
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = [pool.submit(func, c) for c in chunks]
+        for fut in as_completed(futures):
+            for res in fut.result():
+                yield res
+
+
+def map_faces(faces, mode, gridz=None, workers=None, chunk=None):
+    """Compute the curvature maps of faces in worker processes.
+
+    Args:
+        faces (list): Part.Face
+        mode (str): curvature mode, see uvgrid_generator.kvalues
+        gridz (int): cells per direction. Defaults to the
+            "CurvatureGrid" parameter
+        workers (int): see map_jobs
+        chunk (int): see map_jobs
+
+    Yields:
+        tuple: (face index, result dict)
+    """
+    if gridz is None:
+        gridz = _params().GetInt("CurvatureGrid", 100)
+
+    jobs = [(i, f.exportBrepToString(), mode, gridz) for i, f in enumerate(faces)]
+
+    return map_jobs(_face_job, jobs, workers, chunk)
+
+
+def map_grids(faces, fac=5, workers=None, chunk=None):
+    """Compute the uv grids of faces in worker processes.
+
+    Args:
+        faces (list): Part.Face
+        fac (int): grid factor, see uvgrid_generator.genVgrid
+        workers (int): see map_jobs
+        chunk (int): see map_jobs
+
+    Yields:
+        tuple: (face index, result dict)
+    """
+    jobs = [(i, f.exportBrepToString(), fac) for i, f in enumerate(faces)]
+
+    return map_jobs(_grid_job, jobs, workers, chunk)
+
+
+def _collect(results, count, show):
+    """Show the results as they arrive.
+
+    Args:
+        results (iterator): (index, result) see map_jobs
+        count (int): number of faces
+        show (callable): show(index, result), returns the created object
+
+    Returns:
+        list: show results in face order, None for the faces without a
+            result, the ones of a failed job or of a pool failure
+    """
+    import FreeCAD
+
+    ts = time.time()
+    objs = [None] * count
+
+    try:
+        for index, res in results:
+            if "error" in res:
+                log.warning("face %s: %s", index + 1, res["error"])
+                continue
+
+            objs[index] = show(index, res)
+
+            if FreeCAD.GuiUp:
+                import FreeCADGui
+
+                FreeCADGui.updateGui()
+
+    except Exception as err:
+        # e.g. no worker could be started
+        log.warning("parallel run failed: %s", err)
+
+    missing = sum(o is None for o in objs)
+
+    if missing:
+        log.warning("%s of %s faces left to the serial run", missing, count)
+
+    te = time.time()
+    log.debug("parallel time %.2f", te - ts)
+
+    return objs
+
+
+def run_faces(faces, mode):
+    """Create the curvature maps of faces using the worker pool.
+
+    Returns:
+        list: the created mesh objects in face order, None for the faces
+            to be done serially
+    """
+    from freecad.nurbswb import uvgrid_generator as uvg
+
+    def show(index, res):
+        return uvg.show_face_curvature(
+            faces[index], mode, index,
+            (res["points"], res["triangles"], res["colors"]))
+
+    return _collect(map_faces(faces, mode), len(faces), show)
+
+
+def run_grids(faces, labels, fac=5):
+    """Create the uv grids of faces using the worker pool.
+
+    Returns:
+        list: True for the faces done, False for the ones to be done
+            serially
+    """
+    import Part
+
+    from freecad.nurbswb import uvgrid_generator as uvg
+
+    def show(index, res):
+        shape = Part.Shape()
+        shape.importBrepFromString(res["curves"])
+        grid = (shape.Edges, res["kupts"], res["kvpts"], res["lena"])
+        uvg.show_grid(faces[index], grid, labels[index])
+        return True
+
+    return [bool(d) for d in _collect(
+        map_grids(faces, fac), len(faces), show)]
@@ -0,0 +1,250 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_primitives.py
+
+Exact rational NURBS primitives.
+
+    Cylinder, sphere, torus and any surface of revolution are built as
+    the tensor product of a profile curve in the (r, z) half plane and
+    a rational quadratic circle, poles and weights are computed with
+    numpy on whole arrays:
+
+        P[i, j] = (r[i] * cx[j], r[i] * cy[j], z[i])
+        w[i, j] = wp[i] * wc[j]
+
+    The circles are made of arcs with weight cos(da / 2) on the middle
+    poles, so the surfaces are exact, not approximated. Any number of
+    poles is accepted above the minimum of the shape, the missing poles
+    are added by knot insertion, which leaves the surface unchanged.
+
+    The u direction is the profile, v goes around the z axis. Results
+    are nurbs_eval.SurfaceData, see SurfaceData.to_bspline.
+
+    The data are numpy arrays in a SurfaceData, FreeCAD is not
+    imported, Nurbs.createSurface builds the surface.
+
+References:
+    Piegl, Tiller - The NURBS Book, 2nd ed.
+        A7.1 MakeNurbsCircle, A8.1 MakeRevolvedSurf
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import numpy as np
+
+from freecad.nurbswb.nurbs_eval import SurfaceData
+from freecad.nurbswb.nurbs_refine import insert_knot
+
+
+def refine(poles, weights, knots, degree, count):
+    """Insert knots in the longest spans until there are count poles.
+
+    Args:
+        poles (np_array): (n, d) poles
+        weights (np_array): (n,) weights
+        knots (np_array): flat knot vector
+        degree (int): degree
+        count (int): number of poles wanted, >= n
+
+    Returns:
+        tuple: (poles, weights, knots)
+    """
+    pw = np.hstack((poles * weights[:, None], weights[:, None]))
+
+    while len(pw) < count:
+        ks = np.unique(knots)
+        a = np.argmax(np.diff(ks))
+        pw, knots = insert_knot(pw, knots, degree, 0.5 * (ks[a] + ks[a + 1]))
+
+    return pw[:, :-1] / pw[:, -1:], pw[:, -1].copy(), knots
+
+
+def arc(radius, sweep, count, start=0.0, center=(0.0, 0.0)):
+    """Return an exact rational quadratic arc with count poles.
+
+    Args:
+        radius (float): radius
+        sweep (float): arc angle in radians, up to 2 pi
+        count (int): number of poles, at least 2 * min_arcs + 1 where
+            min_arcs is the number of arcs of at most 120 degrees
+        start (float): start angle. Defaults to 0.0
+        center (tuple): (x, y) center. Defaults to (0.0, 0.0)
+
+    Returns:
+        tuple: (poles (count, 2), weights, knots, degree)
+    """
+    min_arcs = max(1, int(np.ceil(abs(sweep) / (2.0 * np.pi / 3.0) - 1e-9)))
+    n_arcs = (count - 1) // 2
+
+    if n_arcs < min_arcs:
+        raise ValueError(f"an arc of {np.degrees(sweep):.1f} degrees needs "
+                         f"at least {2 * min_arcs + 1} poles")
+
+    da = sweep / n_arcs
+    ang = start + 0.5 * da * np.arange(2 * n_arcs + 1)
+
+    weights = np.ones(2 * n_arcs + 1)
+    weights[1::2] = np.cos(0.5 * da)
+
+    # middle poles are on the tangent lines crossing
+    rad = np.full(2 * n_arcs + 1, float(radius))
+    rad[1::2] /= np.cos(0.5 * da)
+
+    poles = np.stack((rad * np.cos(ang), rad * np.sin(ang)), axis=-1)
+    poles += np.asarray(center, dtype=float)
+
+    knots = np.concatenate((
+        [0.0, 0.0, 0.0],
+        np.repeat(np.arange(1, n_arcs) / n_arcs, 2),
+        [1.0, 1.0, 1.0]))
+
+    poles, weights, knots = refine(poles, weights, knots, 2, count)
+
+    return poles, weights, knots, 2
+
+
+def line(p0, p1, count, degree=3):
+    """Return a uniform clamped B-spline segment with count poles.
+
+    Poles are on the Greville abscissae, so the parametrization is
+    linear, as for a single segment.
+
+    Args:
+        p0 (tuple): start point
+        p1 (tuple): end point
+        count (int): number of poles, at least 2
+        degree (int): wanted degree, lowered to count - 1 if needed.
+            Defaults to 3
+
+    Returns:
+        tuple: (poles (count, d), weights, knots, degree)
+    """
+    if count < 2:
+        raise ValueError("a line needs at least 2 poles")
+
+    degree = min(degree, count - 1)
+    inner = np.arange(1, count - degree) / (count - degree)
+    knots = np.concatenate((np.zeros(degree + 1), inner, np.ones(degree + 1)))
+
+    # mean of degree consecutive knots
+    csum = np.concatenate(([0.0], np.cumsum(knots)))
+    greville = (csum[degree + 1:degree + 1 + count] - csum[1:1 + count]) / degree
+
+    p0 = np.asarray(p0, dtype=float)
+    p1 = np.asarray(p1, dtype=float)
+    poles = p0 + greville[:, None] * (p1 - p0)
+
+    return poles, np.ones(count), knots, degree
+
+
+def _profile_normals(poles):
+    """Return the outward unit normals of a (r, z) control polygon.
+
+    The normal of a pole is the tangent of the polygon rotated by -90
+    degrees, outward for a profile going upwards or counterclockwise.
+    """
+    tang = np.gradient(poles, axis=0)
+    nrm = np.stack((tang[:, 1], -tang[:, 0]), axis=-1)
+    ln = np.linalg.norm(nrm, axis=-1, keepdims=True)
+
+    return np.divide(nrm, ln, out=np.zeros(nrm.shape), where=ln > 0)
+
+
+def revolve(profile, count, sweep=2.0 * np.pi, offsets=None):
+    """Revolve a (r, z) profile around the z axis (A8.1).
+
+    Args:
+        profile (tuple): (poles (n, 2), weights, knots, degree), r >= 0
+        count (int): poles around the axis
+        sweep (float): revolution angle. Defaults to 2 pi
+        offsets (np_array): (n, count) displacements of the poles along
+            the profile normal, used to add relief to the exact shape.
+            Defaults to None
+
+    Returns:
+        SurfaceData: u along the profile, v around the axis
+    """
+    ppoles, pweights, pknots, pdeg = profile
+    cpoles, cweights, cknots, cdeg = arc(1.0, sweep, count)
+
+    r = ppoles[:, 0][:, None]
+    z = np.broadcast_to(ppoles[:, 1][:, None], (len(ppoles), count))
+
+    poles = np.stack((r * cpoles[:, 0], r * cpoles[:, 1], z), axis=-1)
+    weights = pweights[:, None] * cweights[None, :]
+
+    if offsets is not None:
+        nrm = _profile_normals(ppoles)
+        ang = np.arctan2(cpoles[:, 1], cpoles[:, 0])
+        direc = np.stack((
+            nrm[:, 0][:, None] * np.cos(ang)[None, :],
+            nrm[:, 0][:, None] * np.sin(ang)[None, :],
+            np.broadcast_to(nrm[:, 1][:, None], poles.shape[:2])), axis=-1)
+        poles = poles + np.asarray(offsets, dtype=float)[..., None] * direc
+
+    return SurfaceData(poles, weights, pknots, cknots, pdeg, cdeg)
+
+
+def cylinder(radius, height, count_u, count_v, offsets=None):
+    """Return an exact cylinder, see revolve for count_v and offsets.
+
+    Args:
+        count_u (int): poles along the axis, at least 2
+    """
+    profile = line((radius, 0.0), (radius, height), count_u)
+    return revolve(profile, count_v, offsets=offsets)
+
+
+def sphere(radius, count_u, count_v, offsets=None):
+    """Return an exact sphere, see revolve for count_v and offsets.
+
+    Args:
+        count_u (int): poles from south to north pole, at least 5
+    """
+    profile = arc(radius, np.pi, count_u, start=-0.5 * np.pi)
+    return revolve(profile, count_v, offsets=offsets)
+
+
+def torus(radius, radius2, count_u, count_v, offsets=None):
+    """Return an exact torus, see revolve for count_v and offsets.
+
+    Args:
+        radius (float): distance of the tube center from the axis
+        radius2 (float): tube radius
+        count_u (int): poles around the tube, at least 7
+    """
+    profile = arc(radius2, 2.0 * np.pi, count_u, center=(radius, 0.0))
+    return revolve(profile, count_v, offsets=offsets)
+
+
+# Nurbs.model: primitive(radius, radius2, height, count_u, count_v, offsets)
+MODELS = {
+    "NurbsCylinder": lambda r, r2, h, cu, cv, off: cylinder(r, h, cu, cv, off),
+    "NurbsSphere": lambda r, r2, h, cu, cv, off: sphere(r, cu, cv, off),
+    "NurbsTorus": lambda r, r2, h, cu, cv, off: torus(r, r2, cu, cv, off),
+}
+
+
+def from_model(model, count_u, count_v, radius, radius2=0.0, height=0.0,
+               offsets=None):
+    """Return the primitive of a Nurbs model.
+
+    Args:
+        model (str): a key of MODELS
+        count_u (int): poles along the profile
+        count_v (int): poles around the axis
+        radius (float): Nurbs.Radius
+        radius2 (float): Nurbs.Radius2, torus only. Defaults to 0.0
+        height (float): Nurbs.Height, cylinder only. Defaults to 0.0
+        offsets (np_array): see revolve. Defaults to None
+
+    Returns:
+        SurfaceData
+    """
+    return MODELS[model](radius, radius2, height, count_u, count_v, offsets)
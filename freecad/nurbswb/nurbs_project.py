@@ -0,0 +1,297 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_project.py
+
+Batched point inversion on B-spline surfaces.
+
+    The closest surface points of many points are found at once:
+
+        proj = Projector(data)
+        uv, dist, ok = proj.project(points)
+
+    The surface is sampled once on a parameter grid, a few samples per
+    knot span, the nearest sample of every point is the start of a
+    Newton iteration on the squared distance, run on all the points
+    together with the vectorized evaluator of nurbs_eval. Points stop
+    iterating when they are on the surface, when the distance vector is
+    normal to the surface or when the step does not move them (A6.4).
+
+    The nearest samples are found with scipy.spatial.cKDTree if scipy
+    is installed, else with a blocked brute force search on a coarser
+    grid.
+
+    Projector needs only numpy, scipy is optional as said above, so it
+    could be used in worker processes without FreeCAD. project_points
+    imports FreeCAD to project the points Projector did not converge
+    on with sf.parameter.
+
+References:
+    Piegl, Tiller - The NURBS Book, 2nd ed.
+        6.1 Point inversion and projection for curves and surfaces
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import numpy as np
+
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_eval import surface_data
+from freecad.nurbswb.nurbs_log import get_logger
+
+
+log = get_logger(__name__)
+
+# samples along a direction, with and without scipy
+MAX_SAMPLES = 256
+MAX_SAMPLES_BRUTE = 64
+
+# points compared at once in the brute force search
+_BLOCK = 2048
+
+
+def _kdtree_class():
+    """Return scipy.spatial.cKDTree, None if scipy is missing."""
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        return None
+
+    return cKDTree
+
+
+def _samples(knots, degree, count, per_span, limit):
+    """Return sample parameters, per_span for every span of the domain."""
+    knots = np.asarray(knots, dtype=float)
+    breaks = np.unique(knots[degree:count + 1])
+
+    steps = np.arange(per_span) / per_span
+    ts = (breaks[:-1, None] + np.diff(breaks)[:, None] * steps).ravel()
+    ts = np.append(ts, breaks[-1])
+
+    if len(ts) > limit:
+        ts = np.linspace(breaks[0], breaks[-1], limit)
+
+    return ts
+
+
+class Projector(object):
+    """Closest point projection on a surface, see the module docstring."""
+
+    def __init__(self, data, per_span=4):
+        """Sample the surface and build the search structure.
+
+        Args:
+            data (SurfaceData): the surface
+            per_span (int): samples for every knot span and direction.
+                Defaults to 4
+        """
+        self.data = data
+        nu, nv = data.shape
+
+        tree = _kdtree_class()
+        limit = MAX_SAMPLES if tree is not None else MAX_SAMPLES_BRUTE
+
+        self.us = _samples(data.knots_u, data.degree_u, nu, per_span, limit)
+        self.vs = _samples(data.knots_v, data.degree_v, nv, per_span, limit)
+        self.samples = data.evaluate(self.us, self.vs, grid=True).reshape(-1, 3)
+        self.tree = tree(self.samples) if tree is not None else None
+
+        self.domain = data.domain()
+        size = np.ptp(data.poles.reshape(-1, 3), axis=0).max()
+        self.size = max(float(size), 1.0)
+
+        # closed directions wrap around instead of stopping at the seam
+        grid = self.samples.reshape(len(self.us), len(self.vs), 3)
+        seam = 1e-9 * self.size
+        self.closed = (
+            bool(np.abs(grid[0] - grid[-1]).max() <= seam),
+            bool(np.abs(grid[:, 0] - grid[:, -1]).max() <= seam))
+
+    @property
+    def nbytes(self):
+        """Return the size of the sample arrays."""
+        # the tree holds a copy of the samples and the indices
+        return 2 * self.samples.nbytes + self.us.nbytes + self.vs.nbytes
+
+    def nearest(self, points):
+        """Return the index of the nearest sample of every point."""
+        if self.tree is not None:
+            return self.tree.query(points)[1]
+
+        # |p - s|^2 = |p|^2 - 2 p.s + |s|^2, |p|^2 is the same for a row
+        ss = np.einsum("ij,ij->i", self.samples, self.samples)
+        res = np.empty(len(points), dtype=np.int64)
+
+        for a in range(0, len(points), _BLOCK):
+            blk = points[a:a + _BLOCK]
+            res[a:a + _BLOCK] = np.argmin(ss - 2.0 * blk @ self.samples.T, axis=1)
+
+        return res
+
+    def seeds(self, points):
+        """Return the (N, 2) parameters of the nearest samples.
+
+        Seeds are moved a little inside the domain, the derivatives may
+        vanish on its border, e.g. at the poles of a sphere.
+        """
+        iu, iv = np.divmod(self.nearest(points), len(self.vs))
+
+        umin, umax, vmin, vmax = self.domain
+        du = 1e-3 * (umax - umin)
+        dv = 1e-3 * (vmax - vmin)
+
+        return np.stack((np.clip(self.us[iu], umin + du, umax - du),
+                         np.clip(self.vs[iv], vmin + dv, vmax - dv)), axis=-1)
+
+    @staticmethod
+    def _limit(t, lo, hi, closed):
+        """Return the parameters wrapped or clamped to [lo, hi]."""
+        if closed:
+            return lo + np.mod(t - lo, hi - lo)
+
+        return np.clip(t, lo, hi)
+
+    @nurbs_trace.traced("Projector.project")
+    def project(self, points, tol=1e-9, cos_tol=1e-9, max_iter=20):
+        """Project points on the surface.
+
+        Args:
+            points (array_like): (N, 3) points
+            tol (float): distance tolerance, relative to the surface
+                size. Defaults to 1e-9
+            cos_tol (float): zero cosine tolerance. Defaults to 1e-9
+            max_iter (int): Newton iterations. Defaults to 20
+
+        Returns:
+            tuple: (uv (N, 2), distance (N,), converged (N,) bool)
+        """
+        pts = np.asarray(points, dtype=float).reshape(-1, 3)
+        umin, umax, vmin, vmax = self.domain
+        eps = tol * self.size
+
+        uv = self.seeds(pts)
+        ok = np.zeros(len(pts), dtype=bool)
+        active = np.arange(len(pts))
+        failed = 0
+
+        for _it in range(max_iter):
+            if len(active) == 0:
+                break
+
+            u, v = uv[active, 0], uv[active, 1]
+            d = self.data.derivatives(u, v, order=2)
+
+            r = d[:, 0, 0] - pts[active]
+            su, sv = d[:, 1, 0], d[:, 0, 1]
+            suu, suv, svv = d[:, 2, 0], d[:, 1, 1], d[:, 0, 2]
+
+            dist = np.linalg.norm(r, axis=-1)
+            lu = np.linalg.norm(su, axis=-1)
+            lv = np.linalg.norm(sv, axis=-1)
+
+            f = np.einsum("ij,ij->i", su, r)
+            g = np.einsum("ij,ij->i", sv, r)
+
+            # on a degenerate border, e.g. the pole of a sphere, the
+            # tests pass without a solution, such points are left to OCC
+            regular = (lu > eps) & (lv > eps)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                normal = ((np.abs(f) <= cos_tol * lu * dist)
+                          & (np.abs(g) <= cos_tol * lv * dist) & regular)
+
+            done = (dist <= eps) | normal
+
+            # Newton, Gauss-Newton where the Hessian is not positive
+            j00 = lu * lu + np.einsum("ij,ij->i", r, suu)
+            j01 = np.einsum("ij,ij->i", su, sv) + np.einsum("ij,ij->i", r, suv)
+            j11 = lv * lv + np.einsum("ij,ij->i", r, svv)
+            det = j00 * j11 - j01 * j01
+
+            gn = (j00 <= 0.0) | (det <= 1e-14 * (lu * lv) ** 2)
+            j00 = np.where(gn, lu * lu, j00)
+            j11 = np.where(gn, lv * lv, j11)
+            j01 = np.where(gn, np.einsum("ij,ij->i", su, sv), j01)
+            det = j00 * j11 - j01 * j01
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                du = np.where(det > 0.0, (j01 * g - j11 * f) / det, 0.0)
+                dv = np.where(det > 0.0, (j01 * f - j00 * g) / det, 0.0)
+
+            nu = self._limit(u + du, umin, umax, self.closed[0])
+            nv = self._limit(v + dv, vmin, vmax, self.closed[1])
+
+            # the step does not move the point, a singular system is
+            # a failure, not a solution
+            move = np.linalg.norm(
+                (nu - u)[:, None] * su + (nv - v)[:, None] * sv, axis=-1)
+            stuck = ((det <= 0.0) | ((move <= eps) & ~regular)) & ~done
+            still = (move <= eps) & ~done & ~stuck
+
+            upd = ~done
+            uv[active[upd], 0] = nu[upd]
+            uv[active[upd], 1] = nv[upd]
+
+            ok[active[done | still]] = True
+            active = active[~(done | still | stuck)]
+            failed += int(np.count_nonzero(stuck))
+
+        nurbs_trace.count("project.points", len(pts))
+        nurbs_trace.count("project.failed", len(active) + failed)
+
+        dist = np.linalg.norm(
+            self.data.evaluate(uv[:, 0], uv[:, 1]) - pts, axis=-1)
+
+        return uv, dist, ok
+
+
+def project_points(sf, points, data=None, proj=None):
+    """Return the parameters of the closest points on a surface.
+
+    The batched projector is used for BSplineSurfaces, the points it
+    could not project and the points of other surfaces are projected
+    by OCC one at a time.
+
+    Args:
+        sf (Part.Surface): surface, used when data is None
+        points (array_like): (N, 3) points
+        data (SurfaceData): if given sf is not inspected for it.
+            Defaults to None
+        proj (Projector): projector of sf, e.g. a cached one. Defaults
+            to None
+
+    Returns:
+        np_array: (N, 2) parameters
+    """
+    pts = np.asarray(points, dtype=float).reshape(-1, 3)
+
+    if proj is None:
+        if data is None:
+            data = surface_data(sf)
+
+        if data is not None:
+            proj = Projector(data)
+
+    if proj is None:
+        todo = np.arange(len(pts))
+        uv = np.zeros((len(pts), 2))
+    else:
+        uv, _dist, ok = proj.project(pts)
+        todo = np.flatnonzero(~ok)
+
+    if len(todo):
+        import FreeCAD
+
+        log.debug("%s points projected by OCC", len(todo))
+        nurbs_trace.count("sf.parameter", len(todo))
+
+        for i in todo.tolist():
+            uv[i] = sf.parameter(FreeCAD.Vector(*pts[i]))
+
+    return uv
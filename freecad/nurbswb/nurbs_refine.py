@@ -0,0 +1,226 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_refine.py
+
+Knot insertion and knot refinement.
+
+    Knots are added to a B-spline without changing its shape, the new
+    poles are affine combinations of the old ones (Boehm's algorithm,
+    refined in one pass for a whole knot list as in the Oslo
+    algorithm). The poles may have any number of trailing dimensions,
+    so a surface is refined in u for all its pole columns at once:
+
+        pw = data.homogeneous
+        pw, ku = refine_knots(pw, data.knots_u, data.degree_u, [0.25, 0.5])
+
+    Rational curves and surfaces must be refined in homogeneous
+    coordinates (w * P, w), see refine_surface.
+
+    The module needs numpy and nurbs_eval, no FreeCAD import, so it
+    could be used in worker processes.
+
+References:
+    Piegl, Tiller - The NURBS Book, 2nd ed.
+        A5.1 CurveKnotIns, A5.4 RefineKnotVectCurve
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import numpy as np
+
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_eval import SurfaceData
+
+
+def valid_knots(knots, count, degree):
+    """Return True if knots is a knot vector for count poles of degree.
+
+    Args:
+        knots (array_like): flat knot vector
+        count (int): number of poles
+        degree (int): degree
+
+    Returns:
+        bool
+    """
+    knots = np.asarray(knots, dtype=float)
+
+    if degree < 1 or len(knots) != count + degree + 1:
+        return False
+
+    if np.any(np.diff(knots) < 0):
+        return False
+
+    # inner knots at most degree times, the domain must not be empty
+    _values, mults = np.unique(knots[1:-1], return_counts=True)
+
+    return bool(np.all(mults <= degree) and knots[count] > knots[degree])
+
+
+def multiplicity(knots, t, tol=1e-12):
+    """Return the multiplicity of the value t in knots."""
+    knots = np.asarray(knots, dtype=float)
+    return int(np.count_nonzero(np.abs(knots - t) <= tol))
+
+
+def greville(knots, degree):
+    """Return the Greville abscissae, the parameter of each pole.
+
+    Args:
+        knots (array_like): flat knot vector
+        degree (int): degree
+
+    Returns:
+        np_array: mean of degree consecutive knots for every pole
+    """
+    knots = np.asarray(knots, dtype=float)
+    count = len(knots) - degree - 1
+    csum = np.concatenate(([0.0], np.cumsum(knots)))
+
+    return (csum[degree + 1:degree + 1 + count] - csum[1:1 + count]) / degree
+
+
+def knot_between(knots, degree, index, pos=0.5):
+    """Return the knot adding a pole between the poles index - 1 and index.
+
+    The parameter is taken between the Greville abscissae of the two
+    poles and kept inside the domain.
+
+    Args:
+        knots (array_like): flat knot vector
+        degree (int): degree
+        index (int): index of the second pole, 1 <= index < count
+        pos (float): relative position from pole index - 1 to pole
+            index. Defaults to 0.5
+
+    Returns:
+        float: knot value
+    """
+    knots = np.asarray(knots, dtype=float)
+    count = len(knots) - degree - 1
+
+    if not 1 <= index < count:
+        raise ValueError(f"no pole line before {index}, {count} poles")
+
+    pos = min(max(pos, 0.0), 1.0)
+    gre = greville(knots, degree)
+    t = gre[index - 1] + pos * (gre[index] - gre[index - 1])
+
+    # the new knot must be strictly inside the domain
+    lo, hi = knots[degree], knots[count]
+    eps = 1e-6 * (hi - lo)
+
+    return float(min(max(t, lo + eps), hi - eps))
+
+
+@nurbs_trace.traced("nurbs_refine.refine_knots")
+def refine_knots(pw, knots, degree, new_knots, axis=0):
+    """Insert a list of knots in one pass (A5.4).
+
+    Args:
+        pw (np_array): poles, homogeneous for rational splines, the
+            poles are along axis, other axes are refined together
+        knots (array_like): flat knot vector
+        degree (int): degree
+        new_knots (array_like): knots to insert, in any order, a value
+            may be repeated to insert it more than once
+        axis (int): axis of pw along the knot vector. Defaults to 0
+
+    Returns:
+        tuple: (pw, knots) new arrays, pw has len(new_knots) more poles
+            along axis
+    """
+    knots = np.asarray(knots, dtype=float)
+    xs = np.sort(np.asarray(new_knots, dtype=float).ravel())
+    pw = np.moveaxis(np.asarray(pw, dtype=float), axis, 0)
+
+    if len(xs) == 0:
+        return np.moveaxis(pw.copy(), 0, axis), knots.copy()
+
+    p = degree
+    n = len(pw) - 1
+    m = n + p + 1
+    r = len(xs) - 1
+
+    if len(knots) != m + 1:
+        raise ValueError("knots length does not match poles and degree")
+
+    if xs[0] < knots[p] or xs[-1] > knots[n + 1]:
+        raise ValueError("knots to insert are outside the domain")
+
+    for t in np.unique(xs):
+        if multiplicity(knots, t) + multiplicity(xs, t) > p:
+            raise ValueError(f"knot {t} would exceed multiplicity {p}")
+
+    a = min(max(int(np.searchsorted(knots, xs[0], side="right")) - 1, p), n)
+    b = min(max(int(np.searchsorted(knots, xs[-1], side="right")) - 1, p), n) + 1
+
+    qw = np.empty((n + r + 2,) + pw.shape[1:])
+    ubar = np.empty(m + r + 2)
+
+    qw[:a - p + 1] = pw[:a - p + 1]
+    qw[b + r:] = pw[b - 1:]
+    ubar[:a + 1] = knots[:a + 1]
+    ubar[b + p + r + 1:] = knots[b + p:]
+
+    i = b + p - 1
+    k = b + p + r
+
+    for j in range(r, -1, -1):
+        while xs[j] <= knots[i] and i > a:
+            qw[k - p - 1] = pw[i - p - 1]
+            ubar[k] = knots[i]
+            k -= 1
+            i -= 1
+
+        qw[k - p - 1] = qw[k - p]
+
+        for ll in range(1, p + 1):
+            ind = k - p + ll
+            alfa = ubar[k + ll] - xs[j]
+
+            if abs(alfa) == 0.0:
+                qw[ind - 1] = qw[ind]
+            else:
+                alfa /= ubar[k + ll] - knots[i - p + ll]
+                qw[ind - 1] = alfa * qw[ind - 1] + (1.0 - alfa) * qw[ind]
+
+        ubar[k] = xs[j]
+        k -= 1
+
+    nurbs_trace.count("refine.knots", len(xs))
+
+    return np.moveaxis(qw, 0, axis), ubar
+
+
+def insert_knot(pw, knots, degree, t, times=1, axis=0):
+    """Insert the knot t, times times, see refine_knots."""
+    return refine_knots(pw, knots, degree, [t] * times, axis)
+
+
+def refine_surface(data, knots_u=(), knots_v=()):
+    """Return a surface with the knots added, it has the same shape.
+
+    Args:
+        data (SurfaceData): the surface
+        knots_u (array_like): knots to insert in u. Defaults to ()
+        knots_v (array_like): knots to insert in v. Defaults to ()
+
+    Returns:
+        SurfaceData
+    """
+    pw = data.homogeneous
+
+    pw, ku = refine_knots(pw, data.knots_u, data.degree_u, knots_u, axis=0)
+    pw, kv = refine_knots(pw, data.knots_v, data.degree_v, knots_v, axis=1)
+
+    w = pw[..., -1]
+
+    return SurfaceData(pw[..., :-1] / w[..., None], w, ku, kv,
+                       data.degree_u, data.degree_v)
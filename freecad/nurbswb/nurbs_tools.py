@@ -28,6 +28,12 @@ import Part
 
 from pivy import coin
 
+from freecad.nurbswb.nurbs_curvature import curvature_points
+from freecad.nurbswb.nurbs_log import get_logger
+
+
+log = get_logger(__name__)
+
 V2d = FreeCAD.Base.Vector2d
 V3d = FreeCAD.Vector
 
@@ -177,61 +183,22 @@ def showIsoparametricVCurve(bsplinesurface, v=0.5):
 
 
 def surf_curvature(sf, u, v):
-    """Calculate Surface Curvature at point."""
-    d = 0.01
-    d = 0.0001
-    
-    t1, t2 = sf.tangent(u, v)
-    
-    if t1 is None or t2 is None:
-        print("No tangent for {u},{v}")
-        return -1, -1
-
-    t1 = t1.multiply(d)
-    t2 = t2.multiply(d)
-
-    vf = sf.value(u, v)
-
-    vfw = vf + t1
-    uu, vv = sf.parameter(vfw)
-    vfw = sf.value(uu, vv)
-
-    vfe = vf - t1
-    uu, vv = sf.parameter(vfe)
-    vfe = sf.value(uu, vv)
+    """Calculate Surface Curvature at point.
 
-    ku = vfw + vfe - vf - vf
-    ddu = (vfw - vf).Length
-    ku = ku.multiply(1.0 / ddu / ddu)
+    Curvatures are computed from the exact derivatives, see
+    nurbs_curvature, use curvature_grid for many points at once.
 
-    vfn = vf + t2
-    uu, vv = sf.parameter(vfn)
-    vfn = sf.value(uu, vv)
-
-    vfs = vf - t2
-    uu, vv = sf.parameter(vfs)
-    vfs = sf.value(uu, vv)
-
-    kv = vfn + vfs - vf - vf
-    ddv = (vfn - vf).Length
-    kv = kv.multiply(1.0 / ddv / ddv)
-
-    # ku=round(ku.Length,3)
-    # kv=round(kv.Length,3)
-    # print ku
-    ku = -ku.z
-    kv = -kv.z
-
-    ru = None
-    rv = None
-    if ku != 0:
-        ru = round(1 / ku, 3)
-    if kv != 0:
-        rv = round(1 / kv, 3)
+    Returns:
+        tuple: normal curvatures along the u and v iso lines, positive
+            where the surface bends away from the normal.
+    """
+    curv = curvature_points(sf, [u], [v])
 
-    # print("Krmmungen:",ku,kv,"Krmmungsradien:", ru,rv)
+    if not curv.normals[0].any():
+        log.warning("No tangent for %s,%s", u, v)
+        return -1, -1
 
-    return ku, kv
+    return -curv.ku[0], -curv.kv[0]
 
 
 # -------------------------------
@@ -0,0 +1,264 @@
+"""Nurbs WB - Next Generation
+
+Filename:
+    nurbs_trace.py
+
+Tracing of the workbench operations.
+
+    Spans time nested operations, counters count the calls to OCC and
+    the document object creations and removals.
+
+        from freecad.nurbswb import nurbs_trace
+
+        nurbs_trace.enable()
+        ... edit the surface ...
+        nurbs_trace.print_summary()
+        nurbs_trace.export_chrome("/tmp/nurbs.json")
+
+    The json is loaded in chrome://tracing or https://ui.perfetto.dev
+
+    Tracing is off by default, when off span returns a shared no-op
+    context manager and count returns at once. FreeCAD is imported only
+    when needed, so the numeric modules may use it outside FreeCAD.
+    The "Trace" parameter in "User parameter:Plugins/nurbs" enables it
+    at startup.
+
+Versions:
+    v 0.1 - 2023 onekk
+
+Licence:
+    GNU Lesser General Public License (LGPL)
+
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+
+from collections import defaultdict
+
+
+_enabled = False
+
+# (name, start, duration, thread id, depth, args), times in seconds
+_events = []
+_counters = defaultdict(int)
+# (time, name, value) counter samples for the chrome trace
+_samples = []
+_local = threading.local()
+_t0 = time.perf_counter()
+_observer = None
+
+
+class _NullSpan(object):
+    """Span used when tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    """A timed operation, nested spans have a bigger depth."""
+
+    __slots__ = ("name", "args", "start", "depth")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.depth = getattr(_local, "depth", 0)
+        _local.depth = self.depth + 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _local.depth = self.depth
+        _events.append((self.name, self.start - _t0, end - self.start,
+                        threading.get_ident(), self.depth, self.args))
+        return False
+
+
+class _DocumentObserver(object):
+    """Count document object creations and removals."""
+
+    def slotCreatedObject(self, obj):
+        count("doc.addObject")
+
+    def slotDeletedObject(self, obj):
+        count("doc.removeObject")
+
+
+def is_enabled():
+    """Return True if tracing is on."""
+    return _enabled
+
+
+def enable():
+    """Turn tracing on."""
+    global _enabled, _observer
+
+    _enabled = True
+
+    if _observer is None:
+        import FreeCAD
+
+        _observer = _DocumentObserver()
+        FreeCAD.addDocumentObserver(_observer)
+
+
+def disable():
+    """Turn tracing off, collected data are kept."""
+    global _enabled, _observer
+
+    _enabled = False
+
+    if _observer is not None:
+        import FreeCAD
+
+        FreeCAD.removeDocumentObserver(_observer)
+        _observer = None
+
+
+def reset():
+    """Drop the collected data."""
+    global _t0
+
+    del _events[:]
+    del _samples[:]
+    _counters.clear()
+    _t0 = time.perf_counter()
+
+
+def span(name, **args):
+    """Return a context manager timing the enclosed block.
+
+    Args:
+        name (str): operation name, e.g. "Nurbs.createSurface"
+        args: values shown in the trace viewer
+    """
+    if not _enabled:
+        return _NULL_SPAN
+
+    return _Span(name, args)
+
+
+def count(name, n=1):
+    """Add n to the counter name."""
+    if not _enabled:
+        return
+
+    _counters[name] += n
+    _samples.append((time.perf_counter() - _t0, name, _counters[name]))
+
+
+def traced(name):
+    """Decorate a function to run it inside a span."""
+
+    def deco(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+def summary():
+    """Return the per operation statistics and the counters.
+
+    Returns:
+        dict: {"spans": {name: {"calls", "total", "mean", "max", "self"}},
+            "counters": {name: value}}, times in seconds, self is the
+            total minus the time of the nested spans
+    """
+    spans = {}
+
+    # events are appended on exit, a parent follows its children
+    open_children = defaultdict(float)
+    for name, start, dur, tid, depth, _args in _events:
+        inner = open_children.pop((tid, depth + 1), 0.0)
+        open_children[(tid, depth)] += dur
+
+        st = spans.setdefault(
+            name, {"calls": 0, "total": 0.0, "max": 0.0, "self": 0.0})
+        st["calls"] += 1
+        st["total"] += dur
+        st["max"] = max(st["max"], dur)
+        st["self"] += dur - inner
+
+    for st in spans.values():
+        st["mean"] = st["total"] / st["calls"]
+
+    return {"spans": spans, "counters": dict(_counters)}
+
+
+def print_summary():
+    """Print the summary sorted by total time."""
+    res = summary()
+
+    print(f"{'operation':40} {'calls':>7} {'total ms':>10} {'self ms':>10} "
+          f"{'mean ms':>10} {'max ms':>10}")
+
+    for name, st in sorted(res["spans"].items(), key=lambda x: -x[1]["total"]):
+        print(f"{name:40} {st['calls']:7} {st['total'] * 1000:10.2f} "
+              f"{st['self'] * 1000:10.2f} {st['mean'] * 1000:10.2f} "
+              f"{st['max'] * 1000:10.2f}")
+
+    for name, value in sorted(res["counters"].items()):
+        print(f"{name:40} {value:7}")
+
+
+def export_chrome(path):
+    """Write the collected data as chrome trace event json.
+
+    Args:
+        path (str): output file
+    """
+    pid = os.getpid()
+    events = []
+
+    for name, start, dur, tid, _depth, args in _events:
+        events.append({
+            "name": name, "ph": "X", "pid": pid, "tid": tid,
+            "ts": start * 1e6, "dur": dur * 1e6,
+            "args": {k: str(v) for k, v in args.items()},
+        })
+
+    for t, name, value in _samples:
+        events.append({
+            "name": name, "ph": "C", "pid": pid, "ts": t * 1e6,
+            "args": {"count": value},
+        })
+
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def _startup():
+    """Enable tracing if the "Trace" parameter is set."""
+    try:
+        import FreeCAD
+    except ImportError:
+        # the numeric modules can be used without FreeCAD
+        return
+
+    if FreeCAD.ParamGet("User parameter:Plugins/nurbs").GetBool("Trace", False):
+        enable()
+
+
+_startup()
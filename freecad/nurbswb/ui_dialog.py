@@ -47,8 +47,6 @@ dbg_ui = 1  # integer > 0 if you want some debug
 # Macros #
 MSG = FreeCAD.Console.PrintMessage
 
-mw = FreeCADGui.getMainWindow()
-
 # Interface font sizes
 sz_ch_ap = 14
 sz_ch_tx = 16
@@ -679,8 +677,12 @@ class ColorFrame(QFrame):
 class main_dialog(QtWidgets.QDialog):
     """Create Main dialog."""
 
-    def __init__(self, parent=mw, conf_dict=None):
+    def __init__(self, parent=None, conf_dict=None):
         """Init class."""
+        # main window is looked up here, not at import time
+        if parent is None:
+            parent = FreeCADGui.getMainWindow()
+
         # Using the Tool flag will keep widget on top of parent while
         # not locking operation
         super().__init__(parent, Qt.Tool)
@@ -21,174 +21,265 @@ Licence:
 
 """
 
-import importlib
+import math
 import random
 import time
 
 
 import FreeCAD
-import FreeCADGui
-
-import Points
 
 import Part
 
-# use only when testing it slows down things
-import nurbswb.nurbs_tools
-importlib.reload(nurbswb.nurbs_tools)
+import numpy as np
 
-from nurbswb.nurbs_tools import surf_curvature
+from freecad.nurbswb.nurbs_eval import surface_data, sample_points
+from freecad.nurbswb.nurbs_curvature import curvature_grid
+from freecad.nurbswb.nurbs_project import project_points
+from freecad.nurbswb import nurbs_parallel
+from freecad.nurbswb import nurbs_trace
+from freecad.nurbswb.nurbs_log import get_logger
 
-import matplotlib
+log = get_logger(__name__)
 
 
-def uvmap(edges, sf, debug):
-    """Docstring missing."""
-    try:
-        uvgrp = FreeCAD.ActiveDocument.UV
-    except:
-        uvgrp = FreeCAD.ActiveDocument.addObject("FreeCAD::DocumentObjectGroup", "UV")
-
-    ll = edges
-
-    got = [0] * len(ll)
-
-    ll2 = [ll[0]]
-    got[0] = 1
-    found = 0
-
-    for i in range(len(ll)):
-        e = ll2[found]
-        ps0 = e.valueAt(e.FirstParameter)
-        pe0 = e.valueAt(e.LastParameter)
-        for j in range(len(ll)):
-            if got[j]:
-                continue
-            e = ll[j]
-            ps1 = e.valueAt(e.FirstParameter)
-            pe1 = e.valueAt(e.LastParameter)
-            if ps1 in [ps0, pe0] or pe1 in [ps0, pe0]:
-                ll2.append(e)
-                found += 1
-                got[j] = 1
-                # print(i,j,len(ll2))
+def _vectors(arr):
+    """Return a list of FreeCAD.Vector from a (N, 3) array."""
+    return [FreeCAD.Vector(*p) for p in arr.tolist()]
+
+
+def kvalues(curv, mode):
+    """Return the curvature values of a Curvature for a display mode.
+
+    Normal curvatures keep the sign of surf_curvature, positive where
+    the surface bends away from the normal.
+
+    Args:
+        curv (Curvature): see nurbs_curvature
+        mode (str): one of 'u', 'v', 'gauss', 'sumabs', 'mean'
+
+    Returns:
+        np_array: values
+    """
+    if mode == "u":
+        return -10 * curv.ku
+
+    if mode == "v":
+        return -10 * curv.kv
+
+    if mode == "gauss":
+        # zeigt gut die lage der pole
+        # gausssche kruemmung
+        return 10 * curv.gauss
+
+    if mode == "sumabs":
+        return 10 * (np.abs(curv.k1) + np.abs(curv.k2))
+
+    if mode == "mean":
+        return -10 * curv.mean
+
+    raise ValueError(f"unknown curvature mode {mode}")
+
+
+_NEIGHBOURS = [(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)]
+
+
+def _endpoint_nodes(points, tol):
+    """Merge points closer than tol, return the node index of each point.
+
+    Points are hashed on a grid of cell size tol, a point is compared
+    only with the nodes in the 27 cells around it.
+    """
+    cells = {}
+    nodes = []
+    index = []
+
+    for p in points:
+        key = tuple(int(math.floor(c / tol)) for c in p)
+        found = None
+
+        for dk in _NEIGHBOURS:
+            cell = (key[0] + dk[0], key[1] + dk[1], key[2] + dk[2])
+            for n in cells.get(cell, ()):
+                q = nodes[n]
+                d2 = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+                if d2 <= tol * tol:
+                    found = n
+                    break
+            if found is not None:
+                break
+
+        if found is None:
+            found = len(nodes)
+            nodes.append(p)
+            cells.setdefault(key, []).append(found)
+
+        index.append(found)
+
+    return index
+
+
+def edge_loops(edges, tol=1e-6):
+    """Chain edges into loops.
+
+    Every endpoint is evaluated once and merged within tol, then the
+    loops are followed through the node adjacency in linear time.
+    A loop is closed when no unused edge leaves its last node, so closed
+    edges and seams are chained with their neighbours.
+
+    Args:
+        edges (list): Part.Edge
+        tol (float): endpoint tolerance. Defaults to 1e-6
+
+    Returns:
+        list: loops, a loop is a list of (edge index, reversed)
+    """
+    pts = []
+    for e in edges:
+        pts.append(tuple(e.valueAt(e.FirstParameter)))
+        pts.append(tuple(e.valueAt(e.LastParameter)))
+
+    node = _endpoint_nodes(pts, tol)
+
+    incident = {}
+    for i in range(len(edges)):
+        incident.setdefault(node[2 * i], []).append(i)
+        incident.setdefault(node[2 * i + 1], []).append(i)
+
+    used = [False] * len(edges)
+    loops = []
+
+    for first in range(len(edges)):
+        if used[first]:
+            continue
+
+        used[first] = True
+        loop = [(first, False)]
+        current = node[2 * first + 1]
+
+        while True:
+            nxt = None
+            for j in incident[current]:
+                if not used[j]:
+                    nxt = j
+                    break
+
+            if nxt is None:
                 break
-    assert len(ll) == len(ll2)
-    ll = ll2
 
-    psa = None
-    pea = None
+            used[nxt] = True
+            rev = node[2 * nxt] != current
+            loop.append((nxt, rev))
+            current = node[2 * nxt] if rev else node[2 * nxt + 1]
+
+        loops.append(loop)
+
+    return loops
+
+
+def _uv_area(pts):
+    """Return the absolute area of a closed uv polygon."""
+    uv = np.array([(p.x, p.y) for p in pts])
+    x, y = uv[:, 0], uv[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+_uv_cache = {}
+
+
+def _face_key(face):
+    """Return the cache key of a face."""
+    bb = face.BoundBox
+    return (face.hashCode(), len(face.Edges),
+            round(bb.XMin, 9), round(bb.YMin, 9), round(bb.ZMin, 9),
+            round(bb.XMax, 9), round(bb.YMax, 9), round(bb.ZMax, 9))
+
+
+def face_uvmap(face, debug=False):
+    """Return uvmap of a face, cached for the face.
+
+    Args:
+        face (Part.Face): the face
+
+    Returns:
+        tuple: see uvmap
+    """
+    key = _face_key(face)
+
+    if key not in _uv_cache:
+        if len(_uv_cache) > 256:
+            _uv_cache.clear()
+
+        _uv_cache[key] = uvmap(face.Edges, face.Surface, debug)
+
+    return _uv_cache[key]
+
 
+@nurbs_trace.traced("uvgrid.uvmap")
+def uvmap(edges, sf, debug, tol=1e-6):
+    """Map the boundary edges of a face to a uv face.
+
+    Args:
+        edges (list): the face edges
+        sf (Part.Surface): the face surface
+        debug (bool): show the uv face
+        tol (float): endpoint tolerance. Defaults to 1e-6
+
+    Returns:
+        tuple: (uv face, umin, umax, vmin, vmax)
+    """
     # genauigkeit
     anz = 10
 
-    pts = []
-    direct = [0] * len(ll)
-    e = ll[0]
-    ps0 = e.valueAt(e.FirstParameter)
-    pe0 = e.valueAt(e.LastParameter)
-    e = ll[1]
-    ps1 = e.valueAt(e.FirstParameter)
-    pe1 = e.valueAt(e.LastParameter)
-
-    if pe0 == pe1:
-        # umdrehen
-        direct[1] = 1
-
-    elif ps0 == pe1:
-        direct[1] = 1
-        direct[0] = 1
-
-    elif ps0 == ps1:
-        direct[0] = 1
+    wires = []
+
+    loops = edge_loops(edges, tol)
+
+    # all the boundary points are projected at once
+    disc = {i: edges[i].discretize(anz) for loop in loops for i, _rev in loop}
+    order = sorted(disc)
+    uvs = project_points(
+        sf, [tuple(p) for i in order for p in disc[i]]).tolist()
+    params = {i: uvs[k * anz:(k + 1) * anz] for k, i in enumerate(order)}
+
+    for loop in loops:
+        pts = []
+        for i, rev in loop:
+            ptst = [FreeCAD.Vector(u, v, 0) for u, v in params[i]]
+            if rev:
+                ptst.reverse()
+            pts += ptst
+
+        wires.append((_uv_area(pts), pts))
+
+    # outer loop first
+    wires.sort(key=lambda w: -w[0])
+
+    allpts = np.array([(p.x, p.y) for w in wires for p in w[1]])
+    umin, vmin = allpts.min(axis=0).tolist()
+    umax, vmax = allpts.max(axis=0).tolist()
+
+    if len(wires) == 1:
+        poly = Part.Face(Part.makePolygon(wires[0][1], True))
     else:
-        assert pe0 == ps1
-
-    for i in range(1, len(ll)):
-        e = ll[i - 1]
-        ps0 = e.valueAt(e.FirstParameter)
-        pe0 = e.valueAt(e.LastParameter)
-        e = ll[i]
-        ps1 = e.valueAt(e.FirstParameter)
-        pe1 = e.valueAt(e.LastParameter)
-        if direct[i - 1]:
-            if pe1 == ps0:
-                direct[i] = 1
-            else:
-                assert ps0 == ps1
-        else:
-            if pe1 == pe0:
-                direct[i] = 1
-            else:
-                assert pe0 == ps1
-
-    umin = 1e10
-    vmin = umin
-    umax = -1e10
-    vmax = umax
-
-    for i, e in enumerate(ll):
-        # print(i,e.Curve)
-        ps = e.valueAt(e.FirstParameter)
-        pe = e.valueAt(e.LastParameter)
-        # xprint(e.FirstParameter,e.LastParameter)
-        # xprint(ps,pe)
-        # xprint
-
-        pl = e.discretize(anz)
-        # Part.show(e)
-        (u, v) = sf.parameter(e.Vertexes[0].Point)
-        # xprint("Start",u,v)
-        vmax = max(vmax, v)
-        umax = max(umax, u)
-        vmin = min(vmin, v)
-        umin = min(umin, u)
-
-        (u, v) = sf.parameter(e.Vertexes[1].Point)
-        # xprint("Ende",u,v)
-        vmax = max(vmax, v)
-        umax = max(umax, u)
-        vmin = min(vmin, v)
-        umin = min(umin, u)
-
-        ptst = []
-        kupts = []
-        kvpts = []
-        for p in pl:
-            (u, v) = sf.parameter(p)
-            ptst.append(FreeCAD.Vector(u, v, 0))
-        # u=1*round(u,1)
-        # v=1*round(v,1)
-
-        if direct[i]:
-            ptst.reverse()
-        pts += ptst
-        # Draft.makeWire(pts)
-
-    poly = Part.Face(Part.makePolygon(pts, True))
+        poly = Part.Face(
+            [Part.makePolygon(w[1], True) for w in wires],
+            "Part::FaceMakerBullseye")
 
     if debug:
         Part.show(poly)
-        # uvgrp.addObject(FreeCAD.ActiveDocument.ActiveObject)
-
-    for i, v in enumerate(pts):
-        # xif i%5 == 0: print
-        # xprint v
-        pass
 
     return poly, umin, umax, vmin, vmax
 
 
+@nurbs_trace.traced("uvgrid.genVgrid")
 def genVgrid(face, sf, gridfac=10, debug=False):
     """Docstring missing."""
     poly = face
     if poly is None:
         return
 
-    try:
-        uvgrp = FreeCAD.ActiveDocument.UV
-    except:
-        uvgrp = FreeCAD.ActiveDocument.addObject("FreeCAD::DocumentObjectGroup", "UV")
+    # the document is used only to show the scan lines
+    uvgrp = _uv_group() if debug else None
 
     sps = []
 
@@ -219,10 +310,21 @@ def genVgrid(face, sf, gridfac=10, debug=False):
     kval = []
     kual = []
 
-    for y in yl:
+    # vectorized evaluator, None if sf is not a BSplineSurface
+    data = surface_data(sf)
+
+    # curvature of all the samples in one call
+    us = poly.BoundBox.XMin + np.arange(vst + 1) * (
+        poly.BoundBox.XMax - poly.BoundBox.XMin) / vst
+    curv = curvature_grid(sf, us, yl, data)
+    kus = -curv.ku
+    kvs = -curv.kv
+
+    for iy, y in enumerate(yl):
         vl = Part.makeLine(
             (poly.BoundBox.XMin - 1, y, 0), (poly.BoundBox.XMax + 1, y, 0)
         )
+        nurbs_trace.count("Part.makeLine")
         if debug:
             Part.show(vl)
             uvgrp.addObject(FreeCAD.ActiveDocument.ActiveObject)
@@ -234,8 +336,8 @@ def genVgrid(face, sf, gridfac=10, debug=False):
         kvl = []
         for i in range(vst + 1):
             v = y
-            u = start + (ende - start) * i / vst
-            ku, kv = surf_curvature(sf, u, v)
+            u = us[i]
+            ku, kv = kus[i, iy], kvs[i, iy]
             kupts.append(FreeCAD.Vector(u, v, 10 * ku))
             kvpts.append(FreeCAD.Vector(u, v, 10 * kv))
             kul.append(FreeCAD.Vector(u, v, 10 * ku))
@@ -255,10 +357,8 @@ def genVgrid(face, sf, gridfac=10, debug=False):
             start = a[1][0][0][0]
             ende = a[1][-1][0][0]
             # print(start,ende)
-            pts = []
-
-            for i in range(vst + 1):
-                pts.append(sf.value(start + (ende - start) * i / vst, y))
+            su = start + (ende - start) * np.arange(vst + 1) / vst
+            pts = _vectors(sample_points(sf, su, np.full(vst + 1, y), data))
 
             # print pts
             spline = Part.BSplineCurve()
@@ -295,16 +395,46 @@ def genVgrid(face, sf, gridfac=10, debug=False):
     return rc
 
 
+def _uv_group():
+    """Return the UV group of the active document, created if missing."""
+    try:
+        return FreeCAD.ActiveDocument.UV
+    except:
+        return FreeCAD.ActiveDocument.addObject(
+            "FreeCAD::DocumentObjectGroup", "UV")
+
+
+@nurbs_trace.traced("uvgrid.genUgrid")
 def genUgrid(face, sf, gridfac=10, debug=False):
-    """Create u isolines."""
+    """Create u isolines and show the curvature polygons."""
+    res = ugrid(face, sf, gridfac, debug)
+
+    if res is None:
+        return
+
+    rc, kupts, kvpts, lena = res
+
+    gengrid(kupts, lena, 1)
+    gengrid(kvpts, lena, 2)
+
+    return rc
+
+
+def ugrid(face, sf, gridfac=10, debug=False):
+    """Return the u isolines and the curvature points of the uv face.
+
+    The document is used only in debug mode, so it runs in the workers
+    of nurbs_parallel.
+
+    Returns:
+        tuple: (isolines, u curvature points, v curvature points,
+            points per line) the points are (N, 3) arrays for gengrid
+    """
     poly = face
     if poly is None:
         return
 
-    try:
-        uvgrp = FreeCAD.ActiveDocument.UV
-    except:
-        uvgrp = FreeCAD.ActiveDocument.addObject("FreeCAD::DocumentObjectGroup", "UV")
+    uvgrp = _uv_group() if debug else None
 
     sps = []
 
@@ -312,7 +442,7 @@ def genUgrid(face, sf, gridfac=10, debug=False):
     mind = 30
     if ust < mind:
         ust = mind
-    print(("ust", ust))
+    log.debug("ust %s", ust)
     start = poly.BoundBox.XMin
     ende = poly.BoundBox.XMax
     yl = []
@@ -321,13 +451,28 @@ def genUgrid(face, sf, gridfac=10, debug=False):
         yl.append(start + (ende - start) * i / ust)
 
     rc = []
-    kupts = []
-    kvpts = []
+
+    # vectorized evaluator, None if sf is not a BSplineSurface
+    data = surface_data(sf)
+
+    # curvature of all the samples in one call
+    vst = 19
+    vs = poly.BoundBox.XMin + np.arange(vst + 1) * (
+        poly.BoundBox.XMax - poly.BoundBox.XMin) / vst
+    curv = curvature_grid(sf, yl, vs, data)
+    kus = -curv.ku
+    kvs = -curv.kv
+
+    # not nearly flat surfaces, the curvature over the surface points
+    xy = curv.points[..., :2]
+    kupts = np.concatenate((xy, 10000 * kus[..., None]), axis=-1).reshape(-1, 3)
+    kvpts = np.concatenate((xy, 10000 * kvs[..., None]), axis=-1).reshape(-1, 3)
 
     for ix, x in enumerate(yl):
         vl = Part.makeLine(
             (x, poly.BoundBox.YMin - 1, 0), (x, poly.BoundBox.YMax + 1, 0)
         )
+        nurbs_trace.count("Part.makeLine")
 
         if debug:
             Part.show(vl)
@@ -336,39 +481,17 @@ def genUgrid(face, sf, gridfac=10, debug=False):
         a = vl.distToShape(poly)
         # xprint x,a
 
-        start = poly.BoundBox.XMin
-        ende = poly.BoundBox.XMax
-        vst = 19
-
-        for i in range(vst + 1):
-            u = x
-            v = start + (ende - start) * i / vst
-            ku, kv = surf_curvature(sf, u, v)
-            #                   if i >-10  :
-            #                       if ku != -1 and kv != -1:
-            #           print(u,v,ku,kv)
-            if 0:  # nicht fast ebenene Flaechen
-                kupts.append(FreeCAD.Vector(u, v, 10 * ku))
-                kvpts.append(FreeCAD.Vector(u, v, 10 * kv))
-            else:
-                p = sf.value(u, v)
-                kupts.append(FreeCAD.Vector(p.x, p.y, 10000 * ku))
-                kvpts.append(FreeCAD.Vector(p.x, p.y, 10000 * kv))
-
         if a[0] > 0.01 or len(a[1]) < 2:
             # yprint("keine/zuviel  schnittpunkte x ",ix,x,len(a[1]),a[0],a)
             if len(a[1]) > 2:
-                print()
                 for p in a[1]:
-                    print(p[0])
-                print()
+                    log.debug("%s", p[0])
         else:
             start = a[1][0][0][1]
             ende = a[1][-1][0][1]
-            pts = []
 
-            for i in range(vst + 1):
-                pts.append(sf.value(x, start + (ende - start) * i / vst))
+            sv = start + (ende - start) * np.arange(vst + 1) / vst
+            pts = _vectors(sample_points(sf, np.full(vst + 1, x), sv, data))
 
             spline = Part.BSplineCurve()
             spline.interpolate(pts, False)
@@ -380,16 +503,13 @@ def genUgrid(face, sf, gridfac=10, debug=False):
     #   Points.show(p)
     #   FreeCAD.ActiveDocument.ActiveObject.ViewObject.ShapeColor=(1.0,.0,1.0)
 
-    print((len(kupts), len(kupts) / (vst + 1)))
-
-    gengrid(kupts, vst + 1, 1)
-    gengrid(kvpts, vst + 1, 2)
+    log.debug("%s %s", len(kupts), len(kupts) / (vst + 1))
 
     #   p=Points.Points(kvpts)
     #   Points.show(p)
     #   FreeCAD.ActiveDocument.ActiveObject.ViewObject.ShapeColor=(.0,1.0,1.0)
 
-    return rc
+    return rc, kupts, kvpts, vst + 1
 
 
 def piep(mess=None):
@@ -397,255 +517,324 @@ def piep(mess=None):
     if mess is None:
         mess = time.time()
     FreeCAD.Console.PrintWarning(str(mess) + "\n")
-    FreeCADGui.updateGui()
 
+    if FreeCAD.GuiUp:
+        import FreeCADGui
 
-def genKgrid(face, umin, umax, vmin, vmax, mode, sf, gridfac=10, obj=None, debug=False):
-    """Create rectangles with curvature."""
-    #
-    ts = time.time()
+        FreeCADGui.updateGui()
 
-    poly = face
-    if poly is None:
-        return
 
-    gridz = 20
+def curvature_colors(kvals, mode, cmap):
+    """Map curvature values to colours by their rank.
 
-    sps = []
+    Values are replaced by their percentile, so a few extreme values
+    don't flatten the colour range, equal values get the same colour.
 
-    ust = gridfac * int(round(poly.BoundBox.XMax - poly.BoundBox.XMin)) + 2
+    Args:
+        kvals (np_array): values
+        mode (str): curvature mode, see kvalues
+        cmap (Colormap): matplotlib colormap
 
-    mind = gridz
-    if ust < mind:
-        ust = mind
+    Returns:
+        np_array: (N, 3) rgb colours
+    """
+    kvals = np.asarray(kvals, dtype=float).ravel()
+    cnt = len(kvals)
 
-    ust = gridz
-    vst = gridz
-    print(("ust", ust))
+    # rank of the first equal value, as list.index on the sorted list
+    rank = np.searchsorted(np.sort(kvals), kvals, side="left")
+    t = rank / float(max(cnt - 1, 1))
 
-    #   startx=poly.BoundBox.XMin
-    #   endex=poly.BoundBox.XMax
+    if mode == "sumabs":
+        t = 0.5 * (1 + t)
 
-    startx = umin
-    endex = umax
+    return cmap(t)[:, :3]
 
-    start = vmin
-    ende = vmax
 
-    yl = []
+def grid_triangles(nu, nv):
+    """Return the triangles of a nu x nv point grid in row major order.
 
-    for i in range(ust):
-        yl.append(startx + (endex - startx) * i / ust)
+    Returns:
+        np_array: (2 * (nu - 1) * (nv - 1), 3) point indices
+    """
+    idx = np.arange(nu * nv).reshape(nu, nv)
+    p1 = idx[:-1, :-1].ravel()
+    p2 = idx[:-1, 1:].ravel()
+    p3 = idx[1:, 1:].ravel()
+    p4 = idx[1:, :-1].ravel()
 
-    rc = []
-    kupts = []
-    kvpts = []
+    return np.concatenate((
+        np.column_stack((p1, p2, p3)), np.column_stack((p1, p3, p4))))
+
+
+@nurbs_trace.traced("uvgrid.curvature_map")
+def curvature_map(sf, umin, umax, vmin, vmax, mode, gridz=None):
+    """Compute the mesh of the curvature map without touching the document.
+
+    Args:
+        sf (Part.Surface): the surface
+        umin, umax, vmin, vmax (float): parameter range
+        mode (str): curvature mode, see kvalues
+        gridz (int): cells per direction, if None it is read from the
+            "CurvatureGrid" parameter. Defaults to None
+
+    Returns:
+        tuple: (points, triangles, colors) arrays
+    """
+    if gridz is None:
+        gridz = FreeCAD.ParamGet(
+            "User parameter:Plugins/nurbs").GetInt("CurvatureGrid", 100)
+
+    ust = gridz
+    vst = gridz
 
-    faces = []
-    colors = []
-    kvals = []
+    # matplotlib is slow to import, load it on first use
+    import matplotlib
 
     cmap = matplotlib.colormaps.get_cmap("jet")
 
-    for ix, x in enumerate(yl):
-        piep(("ix,x: ", ix, x))
+    # points and curvature of all the grid vertexes in one call
+    us = np.linspace(umin, umax, ust + 1)
+    vs = np.linspace(vmin, vmax, vst + 1)
+    curv = curvature_grid(sf, us, vs)
 
-        for i in range(vst + 1):
-            u = x
-            v = start + (ende - start) * i / vst
-            ku, kv = surf_curvature(sf, u, v)
+    pts = curv.points.reshape(-1, 3)
+    tris = grid_triangles(ust + 1, vst + 1)
+    colors = curvature_colors(kvalues(curv, mode), mode, cmap)
 
-            if mode == "v":
-                kvals.append(10 * kv)
+    return pts, tris, colors
 
-            if mode == "u":
-                kvals.append(10 * ku)
 
-            if mode == "gauss":
-                # zeigt gut die lage der pole
-                # gausssche kruemmung
-                kvals.append(10 * ku * kv)
+@nurbs_trace.traced("uvgrid.show_curvature_map")
+def show_curvature_map(pts, tris, colors, mode):
+    """Create the Mesh::Feature of a curvature map.
 
-            if mode == "sumabs":
-                # mittlere Krümmung oder ist das ku+kv anstatt der abs ???
-                kvals.append(10 * (abs(ku) + abs(kv)))
+    Returns:
+        DocumentObject: the mesh feature
+    """
+    import Mesh
 
-            if mode == "mean":
-                kvals.append(10 * (ku + kv))
+    mesh = Mesh.Mesh()
+    mesh.addFacets((pts.tolist(), tris.tolist()))
 
-            eu = (endex - startx) / ust / 2
-            ev = (ende - start) / vst / 2
+    if mesh.CountPoints != len(pts):
+        # coincident points have been merged, e.g. at a sphere pole,
+        # colour the facets with the mean of their vertexes
+        colors = colors[tris].mean(axis=1)
 
-            p1 = sf.value(u - eu, v - ev)
-            p2 = sf.value(u - eu, v + ev)
-            p3 = sf.value(u + eu, v + ev)
-            p4 = sf.value(u + eu, v - ev)
+    kobj = FreeCAD.ActiveDocument.addObject("Mesh::Feature", "Curvature")
+    kobj.Label = f"Curvature {mode}"
+    kobj.Mesh = mesh
 
-            pg2 = Part.makePolygon([p1, p2, p3], True)
-            fa = Part.Face(pg2)
-            pg2 = Part.makePolygon([p1, p3, p4], True)
-            fa2 = Part.Face(pg2)
-            faces += [fa, fa2]
+    # a color list matching points or facets is used by the view provider
+    kobj.addProperty("App::PropertyColorList", "VertexColors", "Curvature", "")
+    kobj.VertexColors = [tuple(c) for c in colors.tolist()]
 
-    Part.show(Part.makeSolid(Part.makeShell(faces)))
+    if kobj.ViewObject is not None:
+        kobj.ViewObject.Coloring = True
+        kobj.ViewObject.DisplayMode = "Shaded"
 
-    kval2 = [] + kvals
-    kval2.sort()
+    return kobj
 
-    for c in kvals:
-        ci = kval2.index(c)
-        t = float(ci) / (len(kval2) - 1)
 
-        if mode == "sumabs":
-            t = 0.5 * (1 + t)
+@nurbs_trace.traced("uvgrid.genKgrid")
+def genKgrid(face, umin, umax, vmin, vmax, mode, sf, gridfac=10, obj=None, debug=False):
+    """Create a mesh coloured with the curvature.
+
+    The grid size is read from the "CurvatureGrid" parameter, the mesh
+    is a single Mesh::Feature with one colour per vertex.
+    """
+    #
+    ts = time.time()
 
-        (r, g, b, a) = cmap(t)
-        cc = (r, g, b)
-        colors += [cc, cc]
+    poly = face
+    if poly is None:
+        return
 
-    FreeCAD.ActiveDocument.ActiveObject.ViewObject.DiffuseColor = colors
-    FreeCAD.ActiveDocument.ActiveObject.ViewObject.DisplayMode = "Shaded"
+    pts, tris, colors = curvature_map(sf, umin, umax, vmin, vmax, mode)
+    kobj = show_curvature_map(pts, tris, colors, mode)
 
     te = time.time()
-    print("color time ", round(te - ts, 2))
+    log.debug("color time %.2f", te - ts)
+
+    return kobj
 
 
 def gengrid(pts, lena, direct=2):
-    """Create a polygon grid for a point grid."""
+    """Create a polygon grid for a point grid.
+
+    Args:
+        pts: (N, 3) array or Vectors, lines of lena points
+        lena (int): points in a line
+        direct (int): 2 polygons along the lines, 1 across them
+    """
     #
-    lenb = len(pts) // lena
-    print(("erzeuge gitter", lena, "x", lenb, "punkte", len(pts)))
-    assert lenb * lena == len(pts)
-    pols = []
+    grid = np.array([tuple(p) for p in pts], dtype=float).reshape(-1, lena, 3)
+    log.debug("erzeuge gitter %s x %s punkte %s", lena, len(grid), lena * len(grid))
 
+    # points far away, e.g. at the border, are put on the plane
     limit = 3000
-
-    if direct == 2:
-        for u in range(lenb):
-            uline = []
-            for v in range(lena):
-                if abs(pts[u * lena + v].z) < limit:
-                    uline.append(pts[u * lena + v])
-                else:
-                    p = pts[u * lena + v]
-                    p.z = 0
-                    uline.append(p)
+    grid[np.abs(grid[..., 2]) >= limit, 2] = 0.0
 
     if direct == 1:
-        for v in range(lena):
-            uline = []
-            # Feler am Rand
-            if abs(pts[u * lena + v].z) < limit:
-                uline.append(pts[u * lena + v])
-            else:
-                p = pts[u * lena + v]
-                p.z = 0
-                uline.append(p)
+        grid = grid.swapaxes(0, 1)
 
-    pol = Part.makePolygon(uline)
-    pols.append(pol)
+    pols = [Part.makePolygon(_vectors(line)) for line in grid]
 
     com = Part.makeCompound(pols)
     Part.show(com)
 
 
-def runobj(obj, fac=5):
-    """Run for one complete object over all of its faces."""
-    #
-    ts = time.time()
+def face_curvature(face, mode, gridz=None):
+    """Return the curvature map arrays of a face, see curvature_map."""
+    _poly, umin, umax, vmin, vmax = face_uvmap(face)
+
+    return curvature_map(face.Surface, umin, umax, vmin, vmax, mode, gridz)
+
+
+def face_grid(face, fac=5):
+    """Return the uv grid of a face, see genVgrid and ugrid.
+
+    Returns:
+        tuple: (isolines, u curvature points, v curvature points,
+            points per line)
+    """
+    poly = face_uvmap(face)[0]
+
+    l1 = genVgrid(poly, face.Surface, fac)
+    l2, kupts, kvpts, lena = ugrid(poly, face.Surface, fac)
+
+    return l1 + l2, kupts, kvpts, lena
+
+
+def show_grid(face, grid, label):
+    """Show the grid of face_grid with the face edges.
+
+    Args:
+        face (Part.Face): the face
+        grid (tuple): see face_grid, None to show the edges only
+        label (str): label of the compound
+    """
     el = []
-    debug = 1
 
-    for f in obj.Shape.Faces:
-        try:
-            poly, umin, umax, vmin, vmax = uvmap(f.Edges, f.Surface, debug)
-            print("genkgrid")
-            mode = "sumabs"  # 'u','v', 'sumabs','gauss', 'mean'
-            genKgrid(poly, umin, umax, vmin, vmax, mode, f.Surface, fac, obj, debug)
-            print("DONE stop here - no grid generation")
-            return
-            l1 = genVgrid(poly, f.Surface, fac, debug)
-            l2 = genUgrid(poly, f.Surface, fac, debug)
-            el += l1
-            el += l2
-        except:
-            print()
+    if grid is not None:
+        curves, kupts, kvpts, lena = grid
+        gengrid(kupts, lena, 1)
+        gengrid(kvpts, lena, 2)
+        el += list(curves)
 
-    for e in f.Edges:
+    for e in face.Edges:
         if e.Curve.__class__.__name__ == "GeomLineSegment":
             e = e.Curve.toShape()
         el.append(e)
 
-    comp = Part.makeCompound(el)
-    te = time.time()
-    print("Creation time ", round(te - ts, 2))
-
-    ts = time.time()
-    Part.show(comp)
+    Part.show(Part.makeCompound(el))
     FreeCAD.ActiveDocument.ActiveObject.ViewObject.LineColor = (
         random.random(),
         random.random(),
         random.random(),
     )
+    FreeCAD.ActiveDocument.ActiveObject.Label = label
+
+
+@nurbs_trace.traced("uvgrid.runobj")
+def runobj(obj, fac=5):
+    """Create the curvature maps of all the faces of an object."""
+    #
+    faces = obj.Shape.Faces
+    mode = "sumabs"  # 'u','v', 'sumabs','gauss', 'mean'
+
+    if nurbs_parallel.parallel_enabled(len(faces)):
+        # faces the pool did not return are done below
+        objs = nurbs_parallel.run_faces(faces, mode)
+        todo = [i for i, o in enumerate(objs) if o is None]
+    else:
+        todo = range(len(faces))
+
+    ts = time.time()
+
+    for i in todo:
+        try:
+            show_face_curvature(faces[i], mode, i)
+        except:
+            log.debug("runobj failed", exc_info=True)
+
     te = time.time()
-    print("Part.show time ", round(te - ts, 2))
+    log.debug("Creation time %.2f", te - ts)
+
+
+def show_face_curvature(face, mode, index, res=None):
+    """Show the curvature map of a face.
+
+    Args:
+        face (Part.Face): the face
+        mode (str): curvature mode, see kvalues
+        index (int): face index, for the label
+        res (tuple): (points, triangles, colors) computed elsewhere,
+            e.g. in a worker. Defaults to None
+
+    Returns:
+        Mesh::Feature
+    """
+    if res is None:
+        res = face_curvature(face, mode)
+
+    kobj = show_curvature_map(*res, mode)
+    kobj.Label = f"Curvature {mode} Face{index + 1}"
+
+    return kobj
 
 
 def runsub(f, fac=5, label="NoLAB"):
-    """Docstring missing."""
+    """Create the uv grid of a face."""
     ts = time.time()
 
-    el = []
-    debug = 1
-
     try:
-        poly = uvmap(f.Edges, f.Surface, debug)
-        l2 = []
-        l1 = []
-        l1 = genVgrid(poly, f.Surface, fac, debug)
-        l2 = genUgrid(poly, f.Surface, fac, debug)
-        el += l1
-        el += l2
+        grid = face_grid(f, fac)
     except:
-        print()
-
-    for e in f.Edges:
-        if e.Curve.__class__.__name__ == "GeomLineSegment":
-            e = e.Curve.toShape()
-        el.append(e)
+        grid = None
+        log.debug("runsub failed", exc_info=True)
 
     FreeCAD.ActiveDocument.recompute()
 
-    comp = Part.makeCompound(el)
     te = time.time()
-    print("Creation time ", round(te - ts, 2))
+    log.debug("Creation time %.2f", te - ts)
 
     ts = time.time()
-    Part.show(comp)
-    FreeCAD.ActiveDocument.ActiveObject.ViewObject.LineColor = (
-        random.random(),
-        random.random(),
-        random.random(),
-    )
-    FreeCAD.ActiveDocument.ActiveObject.Label = label
+    show_grid(f, grid, label)
     te = time.time()
-    print("Part.show time ", round(te - ts, 2))
+    log.debug("Part.show time %.2f", te - ts)
+
+
+def runsubs(faces, labels, fac=5):
+    """Create the uv grids of faces, in the worker pool if enabled."""
+    #
+    todo = range(len(faces))
+
+    if nurbs_parallel.parallel_enabled(len(faces)):
+        # faces the pool did not return are done one at a time
+        done = nurbs_parallel.run_grids(faces, labels, fac)
+        todo = [i for i, d in enumerate(done) if not d]
+
+    for i in todo:
+        log.debug("create %s for %s", labels[i], faces[i].Surface)
+        runsub(faces[i], fac, labels[i])
 
 
 def runSel(fac=3):
     """Create the xxx for some selected faces or all faces of a selected part."""
     #
+    import FreeCADGui
+
     if len(FreeCADGui.Selection.getSelectionEx()) > 0:
         for ss in FreeCADGui.Selection.getSelectionEx():
             subn = ss.SubElementNames
             if len(subn) > 0:
-                for i, obj in enumerate(ss.SubObjects):
-                    label = ss.ObjectName + " " + subn[i] + " UVGrid "
-                    print(("create  ", label, "for ", obj.Surface))
-                    runsub(obj, fac, label)
+                labels = [ss.ObjectName + " " + n + " UVGrid " for n in subn]
+                runsubs(ss.SubObjects, labels, fac)
 
             else:
-                print(("create for all faces of the object", ss.Object.Label))
+                log.debug("create for all faces of the object %s", ss.Object.Label)
                 obj = ss.Object
                 runobj(obj, fac)
 
@@ -0,0 +1,88 @@
+"""Tests of nurbs_bezier."""
+
+import numpy as np
+import pytest
+
+from freecad.nurbswb.nurbs_bezier import PatchSet
+from freecad.nurbswb.nurbs_degree import uniform_knots
+from freecad.nurbswb.nurbs_eval import SurfaceData
+
+
+def check_update(data, tol=1e-9):
+    """Check PatchSet.update against from_surface for every span.
+
+    The patches of data are built with update from the patches of a
+    surface with other poles, one span at a time, and compared with
+    the ones of from_surface.
+    """
+    ref = PatchSet.from_surface(data)
+    other = PatchSet.from_surface(SurfaceData(
+        data.poles[::-1, ::-1], data.weights, data.knots_u, data.knots_v,
+        data.degree_u, data.degree_v))
+
+    nsu, nsv = ref.shape
+    off_u, off_v = ref.offset
+
+    for su in range(nsu):
+        for sv in range(nsv):
+            res = other.update(data, {(su + off_u, sv + off_v)})
+            k = su * nsv + sv
+            dev = np.abs(res.patches[k] - ref.patches[k]).max()
+
+            assert dev <= tol, f"patch {(su, sv)} deviates by {dev:.4g}"
+
+
+SURFACES = [
+    # nu, nv, degree_u, degree_v, knots_u, knots_v
+    (7, 6, 3, 2, None, None),
+    (8, 5, 3, 3, [0, 0, 0, 0, 0.2, 0.5, 0.5, 0.7, 1, 1, 1, 1], None),
+    # default knots of a degree 3 NurbsSurface
+    (6, 6, 3, 3, [0, 0, 0.1, 0.3, 0.5, 0.6, 0.8, 0.9, 1, 1],
+     [0, 0, 0.1, 0.3, 0.5, 0.6, 0.8, 0.9, 1, 1]),
+    (6, 6, 2, 3, np.linspace(-0.3, 1.3, 9), None),
+]
+
+
+def make_surface(nu, nv, pu, pv, ku, kv, seed=0):
+    """Return a random rational surface, uniform clamped knots if None."""
+    rng = np.random.default_rng(seed)
+    ku = uniform_knots(nu, pu) if ku is None else ku
+    kv = uniform_knots(nv, pv) if kv is None else kv
+
+    return SurfaceData(rng.normal(size=(nu, nv, 3)),
+                       rng.uniform(0.5, 2.0, (nu, nv)), ku, kv, pu, pv)
+
+
+@pytest.mark.parametrize("spec", SURFACES)
+def test_patches_evaluate_the_surface(spec):
+    data = make_surface(*spec)
+    ps = PatchSet.from_surface(data)
+
+    rng = np.random.default_rng(1)
+    umin, umax, vmin, vmax = data.domain()
+    u = rng.uniform(umin, umax, 200)
+    v = rng.uniform(vmin, vmax, 200)
+
+    assert ps.patches.shape[1:] == (data.degree_u + 1, data.degree_v + 1, 4)
+    assert np.abs(ps.evaluate(u, v) - data.evaluate(u, v)).max() < 1e-10
+
+
+@pytest.mark.parametrize("spec", SURFACES)
+def test_update_matches_from_surface(spec):
+    check_update(make_surface(*spec))
+
+
+def test_bounds_hold_the_points():
+    data = make_surface(*SURFACES[0])
+    ps = PatchSet.from_surface(data)
+
+    rng = np.random.default_rng(2)
+    umin, umax, vmin, vmax = data.domain()
+    u = rng.uniform(umin, umax, 100)
+    v = rng.uniform(vmin, vmax, 100)
+
+    boxes = ps.bounds()[ps.locate(u, v)[0]]
+    pts = data.evaluate(u, v)
+
+    assert np.all(pts >= boxes[:, 0] - 1e-12)
+    assert np.all(pts <= boxes[:, 1] + 1e-12)
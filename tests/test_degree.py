@@ -0,0 +1,92 @@
+"""Tests of nurbs_degree."""
+
+import numpy as np
+import pytest
+
+from freecad.nurbswb import nurbs_degree
+from freecad.nurbswb.nurbs_degree import _values
+from freecad.nurbswb.nurbs_eval import SurfaceData
+
+
+KNOTS = [
+    # clamped
+    [0, 0, 0, 0, 0.3, 0.6, 1, 1, 1, 1],
+    # one end clamped, the other not
+    [0, 0, 0, 0, 0.3, 0.6, 0.8, 0.9, 1, 1.1],
+    [-0.3, -0.1, 0, 0, 0.3, 0.6, 1, 1, 1, 1],
+    # not clamped
+    [-0.3, -0.2, -0.1, 0, 0.3, 0.6, 1, 1.1, 1.2, 1.3],
+    # default knots of a degree 3 NurbsSurface
+    [0, 0, 0.2, 0.4, 0.6, 0.8, 1, 1],
+]
+
+
+def curve(knots, seed=0):
+    """Return random poles for a degree 3 curve and its parameters."""
+    knots = np.array(knots, dtype=float)
+    count = len(knots) - 4
+    pw = np.random.default_rng(seed).normal(size=(count, 3))
+
+    return pw, knots, np.linspace(knots[3], knots[count], 50)
+
+
+@pytest.mark.parametrize("knots", KNOTS)
+def test_clamp_keeps_the_curve(knots):
+    pw, knots, t = curve(knots)
+
+    cp, ck = nurbs_degree.clamp(pw, knots, 3)
+
+    assert np.all(ck[:4] == ck[0]) and np.all(ck[-4:] == ck[-1])
+    assert np.abs(_values(pw, knots, 3, t) - _values(cp, ck, 3, t)).max() < 1e-12
+
+
+@pytest.mark.parametrize("knots", KNOTS)
+def test_elevate_degree_keeps_the_curve(knots):
+    pw, knots, t = curve(knots, 1)
+
+    ep, ek, ed = nurbs_degree.elevate_degree(pw, knots, 3, times=2)
+
+    assert ed == 5
+    assert len(ek) == len(ep) + ed + 1
+    assert np.abs(_values(pw, knots, 3, t) - _values(ep, ek, ed, t)).max() < 1e-10
+
+
+def rational_surface(rng, nu=7, nv=6, pu=3, pv=2):
+    """Return a rational surface on uniform clamped knots."""
+    return SurfaceData(rng.normal(size=(nu, nv, 3)),
+                       rng.uniform(0.5, 2.0, (nu, nv)),
+                       nurbs_degree.uniform_knots(nu, pu),
+                       nurbs_degree.uniform_knots(nv, pv), pu, pv)
+
+
+def samples(data, count=50, seed=0):
+    """Evaluate data on random parameters of its domain."""
+    rng = np.random.default_rng(seed)
+    umin, umax, vmin, vmax = data.domain()
+
+    return data.evaluate(rng.uniform(umin, umax, count),
+                         rng.uniform(vmin, vmax, count))
+
+
+def test_elevate_and_reduce_surface():
+    data = rational_surface(np.random.default_rng(2))
+    ref = samples(data)
+
+    up = nurbs_degree.elevate_surface(data, 1, 2)
+
+    assert (up.degree_u, up.degree_v) == (4, 4)
+    assert np.abs(samples(up) - ref).max() < 1e-10
+
+    down, err = nurbs_degree.reduce_surface(up, 1, 2)
+
+    assert (down.degree_u, down.degree_v) == (3, 2)
+    assert err < 1e-9
+    assert np.abs(samples(down) - ref).max() < 1e-9
+
+
+def test_reduce_reports_the_deviation():
+    data = rational_surface(np.random.default_rng(3))
+    down, err = nurbs_degree.reduce_surface(data, 1, 0)
+
+    assert down.degree_u == 2
+    assert err > 1e-3
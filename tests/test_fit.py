@@ -0,0 +1,119 @@
+"""Tests of nurbs_fit."""
+
+import numpy as np
+import pytest
+
+from freecad.nurbswb import nurbs_fit
+from freecad.nurbswb.nurbs_degree import uniform_knots
+from freecad.nurbswb.nurbs_eval import SurfaceData
+from freecad.nurbswb.nurbs_project import Projector
+
+
+@pytest.fixture(params=["sparse", "dense"])
+def solver(request, monkeypatch):
+    """Run the test with scipy.sparse and with the dense solver."""
+    if request.param == "dense":
+        monkeypatch.setattr(nurbs_fit, "_sparse", lambda: None)
+    elif nurbs_fit._sparse() is None:
+        pytest.skip("scipy is not installed")
+
+    return request.param
+
+
+def plane():
+    """Return the plane z = 0 on [0, 100] x [0, 80]."""
+    xy = np.stack(np.meshgrid([0.0, 100.0], [0.0, 80.0], indexing="ij"), -1)
+
+    return SurfaceData(np.concatenate((xy, np.zeros((2, 2, 1))), axis=-1),
+                       None, [0, 0, 1, 1], [0, 0, 1, 1], 1, 1)
+
+
+def target(count_u=8, count_v=6, seed=0):
+    """Return a surface the fitter can reproduce, its knots are uniform."""
+    rng = np.random.default_rng(seed)
+    xy = np.stack(np.meshgrid(np.linspace(0.0, 100.0, count_u),
+                              np.linspace(0.0, 80.0, count_v),
+                              indexing="ij"), axis=-1)
+    z = rng.normal(scale=5.0, size=(count_u, count_v, 1))
+
+    return SurfaceData(np.concatenate((xy, z), axis=-1), None,
+                       uniform_knots(count_u, 3), uniform_knots(count_v, 3),
+                       3, 3)
+
+
+def test_chunks(tmp_path):
+    pts = np.arange(30.0).reshape(10, 3)
+
+    assert [len(c) for c in nurbs_fit.iter_chunks(pts, 4)] == [4, 4, 2]
+
+    path = tmp_path / "cloud.xyz"
+    path.write_text("# x y z\n" + "\n".join(
+        f"{x}, {y}, {z}, 1" for x, y, z in pts.tolist()))
+
+    res = np.concatenate(list(nurbs_fit.read_chunks(str(path), 3)))
+    assert np.array_equal(res, pts)
+
+
+def test_fitter_reproduces_the_surface(solver):
+    data = target()
+    rng = np.random.default_rng(1)
+    u = rng.uniform(0.0, 1.0, 5000)
+    v = rng.uniform(0.0, 1.0, 5000)
+
+    fitter = nurbs_fit.SurfaceFitter(8, 6)
+    for a in range(0, 5000, 1000):
+        fitter.add(np.column_stack((u[a:a + 1000], v[a:a + 1000])),
+                   data.evaluate(u[a:a + 1000], v[a:a + 1000]))
+
+    res, rms = fitter.solve()
+
+    assert fitter.count == 5000
+    assert rms < 1e-8
+    assert np.abs(res.poles - data.poles).max() < 1e-8
+
+
+def test_fairing_fills_the_empty_poles(solver):
+    rng = np.random.default_rng(2)
+    uv = rng.uniform(0.0, 0.5, (500, 2))
+    pts = np.column_stack((uv * 100.0, np.zeros(500)))
+
+    fitter = nurbs_fit.SurfaceFitter(10, 10)
+    fitter.add(uv, pts)
+    res, _rms = fitter.solve(fairing=1e-3)
+
+    assert np.all(np.isfinite(res.poles))
+
+
+def test_fit_surface_on_a_base():
+    rng = np.random.default_rng(3)
+    xy = rng.uniform((0.0, 0.0), (100.0, 80.0), (20000, 2))
+    pts = np.column_stack((xy, np.sin(xy[:, 0] / 20.0)))
+
+    data, rms = nurbs_fit.fit_surface(
+        nurbs_fit.iter_chunks(pts, 5000), plane(), 20, 16)
+
+    assert data.shape == (20, 16)
+    assert rms < 1e-3
+
+
+def test_fit_surface_drops_points_not_projected(monkeypatch):
+    data = target()
+    rng = np.random.default_rng(4)
+    uv = rng.uniform(0.0, 1.0, (4000, 2))
+    pts = data.evaluate(uv[:, 0], uv[:, 1])
+    project = Projector.project
+
+    def stuck(self, points):
+        # half of the points stop on a wrong parameter
+        res, dist, ok = project(self, points)
+        res[::2] = 0.5
+        ok[::2] = False
+        return res, dist, ok
+
+    monkeypatch.setattr(Projector, "project", stuck)
+
+    res, rms = nurbs_fit.fit_surface(nurbs_fit.iter_chunks(pts), data, 8, 6)
+
+    # the parameters are as exact as the projection
+    assert rms < 1e-6
+    assert np.abs(res.poles - data.poles).max() < 1e-6
@@ -0,0 +1,68 @@
+"""Tests of nurbs_interpolate."""
+
+import numpy as np
+import pytest
+
+from freecad.nurbswb import nurbs_interpolate
+
+
+def point_grid(nu=9, nv=7, seed=0):
+    """Return a (nu, nv, 3) grid of points on an irregular height field."""
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.uniform(5.0, 15.0, nu))
+    y = np.cumsum(rng.uniform(5.0, 15.0, nv))
+    xy = np.stack(np.meshgrid(x, y, indexing="ij"), axis=-1)
+    z = rng.normal(scale=5.0, size=(nu, nv, 1))
+
+    return np.concatenate((xy, z), axis=-1)
+
+
+@pytest.mark.parametrize("method", nurbs_interpolate.METHODS)
+def test_parameters(method):
+    params = nurbs_interpolate.parameters(point_grid(), method, axis=0)
+
+    assert params[0] == 0.0 and params[-1] == 1.0
+    assert np.all(np.diff(params) > 0.0)
+
+
+def test_average_knots():
+    params = np.array([0.0, 0.1, 0.4, 0.5, 0.8, 1.0])
+    knots = nurbs_interpolate.average_knots(params, 3)
+
+    assert len(knots) == len(params) + 4
+    assert np.allclose(knots[4:6], [(0.1 + 0.4 + 0.5) / 3, (0.4 + 0.5 + 0.8) / 3])
+
+
+def test_solve_band():
+    params = np.linspace(0.0, 1.0, 12) ** 1.5
+    knots = nurbs_interpolate.average_knots(params, 3)
+    band = nurbs_interpolate.collocation_band(params, knots, 3)
+
+    dense = np.zeros((12, 12))
+    for k in range(12):
+        for j in range(max(0, k - 3), min(12, k + 4)):
+            dense[k, j] = band[k, 3 + j - k]
+
+    rhs = np.random.default_rng(1).normal(size=(12, 4))
+    res = nurbs_interpolate.solve_band(band, rhs, 3, 3)
+
+    assert np.allclose(res, np.linalg.solve(dense, rhs), rtol=0.0, atol=1e-10)
+
+
+@pytest.mark.parametrize("method", nurbs_interpolate.METHODS)
+@pytest.mark.parametrize("degrees", [(3, 3), (2, 3), (5, 5)])
+def test_surface_through_the_points(method, degrees):
+    pts = point_grid()
+    data = nurbs_interpolate.interpolate_surface(pts, *degrees, method=method)
+
+    us = nurbs_interpolate.parameters(pts, method, axis=0)
+    vs = nurbs_interpolate.parameters(pts, method, axis=1)
+
+    assert data.shape == pts.shape[:2]
+    assert np.abs(data.evaluate(us, vs, grid=True) - pts).max() < 1e-9
+
+
+def test_degree_lowered_to_the_points():
+    data = nurbs_interpolate.interpolate_surface(point_grid(3, 2), 3, 3)
+
+    assert (data.degree_u, data.degree_v) == (2, 1)
@@ -0,0 +1,77 @@
+"""Tests of nurbs_project."""
+
+import numpy as np
+import pytest
+
+from freecad.nurbswb import nurbs_primitives, nurbs_project
+from freecad.nurbswb.nurbs_eval import SurfaceData
+
+
+@pytest.fixture(params=["kdtree", "brute"])
+def search(request, monkeypatch):
+    """Run the test with scipy and with the brute force search."""
+    if request.param == "brute":
+        monkeypatch.setattr(nurbs_project, "_kdtree_class", lambda: None)
+    elif nurbs_project._kdtree_class() is None:
+        pytest.skip("scipy is not installed")
+
+    return request.param
+
+
+def wavy_surface(n=20):
+    """Return a wavy height field on the default knots of a NurbsSurface."""
+    knots = np.concatenate(([0.0, 0.0], np.linspace(0.0, 1.0, n), [1.0, 1.0]))
+    xy = np.stack(np.meshgrid(np.arange(n) * 10.0, np.arange(n) * 10.0,
+                              indexing="ij"), axis=-1)
+    z = 20.0 * np.sin(xy[..., 0] / 60.0) * np.cos(xy[..., 1] / 45.0)
+
+    return SurfaceData(np.concatenate((xy, z[..., None]), axis=-1), None,
+                       knots, knots.copy(), 3, 3)
+
+
+def test_points_off_the_surface(search):
+    data = wavy_surface()
+    rng = np.random.default_rng(0)
+    umin, umax, vmin, vmax = data.domain()
+
+    # points moved along the normal less than the radius of curvature
+    u = rng.uniform(umin, umax, 2000)
+    v = rng.uniform(vmin, vmax, 2000)
+    off = rng.uniform(-3.0, 3.0, 2000)
+    pts = data.evaluate(u, v) + data.normals(u, v) * off[:, None]
+
+    uv, dist, ok = nurbs_project.Projector(data).project(pts)
+
+    assert ok.mean() > 0.99
+    assert np.abs(uv[ok, 0] - u[ok]).max() < 1e-6
+    assert np.abs(uv[ok, 1] - v[ok]).max() < 1e-6
+    assert np.abs(dist[ok] - np.abs(off[ok])).max() < 1e-6
+
+
+def test_points_on_a_closed_surface(search):
+    data = nurbs_primitives.sphere(100.0, 9, 12)
+    rng = np.random.default_rng(1)
+
+    pts = rng.normal(size=(1000, 3))
+    radius = rng.uniform(50.0, 150.0, 1000)
+    pts *= (radius / np.linalg.norm(pts, axis=1))[:, None]
+
+    uv, dist, ok = nurbs_project.Projector(data).project(pts)
+    umin, umax, vmin, vmax = data.domain()
+
+    assert ok.mean() > 0.95
+    assert np.abs(dist[ok] - np.abs(radius[ok] - 100.0)).max() < 1e-6
+    assert np.all((uv[:, 0] >= umin) & (uv[:, 0] <= umax))
+    assert np.all((uv[:, 1] >= vmin) & (uv[:, 1] <= vmax))
+
+
+def test_project_points_without_fallback():
+    data = wavy_surface(8)
+    umin, umax, vmin, vmax = data.domain()
+    uv = np.array([[0.3 * (umin + umax), 0.6 * (vmin + vmax)]])
+    pts = data.evaluate(uv[:, 0], uv[:, 1])
+
+    # sf is not used when every point converges
+    res = nurbs_project.project_points(None, pts, data=data)
+
+    assert np.abs(res - uv).max() < 1e-8
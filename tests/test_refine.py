@@ -0,0 +1,62 @@
+"""Tests of nurbs_refine."""
+
+import numpy as np
+import pytest
+
+from freecad.nurbswb import nurbs_refine
+from freecad.nurbswb.nurbs_eval import SurfaceData
+
+
+def open_knots(count):
+    """Return the default knots of a degree 3 NurbsSurface, not clamped."""
+    return np.concatenate(([0.0, 0.0], np.linspace(0.0, 1.0, count), [1.0, 1.0]))
+
+
+def random_surface(rng, nu=8, nv=7):
+    """Return a rational degree 3 surface on the default knots."""
+    return SurfaceData(rng.normal(size=(nu, nv, 3)),
+                       rng.uniform(0.5, 2.0, (nu, nv)),
+                       open_knots(nu), open_knots(nv), 3, 3)
+
+
+def grid(data, count=31):
+    """Evaluate data on a count x count grid of its domain."""
+    umin, umax, vmin, vmax = data.domain()
+
+    return data.evaluate(np.linspace(umin, umax, count),
+                         np.linspace(vmin, vmax, count), grid=True)
+
+
+def test_valid_knots():
+    assert nurbs_refine.valid_knots(open_knots(8), 8, 3)
+    assert not nurbs_refine.valid_knots(open_knots(8), 9, 3)
+    assert not nurbs_refine.valid_knots(open_knots(8)[::-1], 8, 3)
+
+
+def test_refine_surface_keeps_the_surface():
+    data = random_surface(np.random.default_rng(0))
+    ref = grid(data)
+
+    knots_u = [nurbs_refine.knot_between(data.knots_u, 3, 4, 0.3), 0.5, 0.5]
+    res = nurbs_refine.refine_surface(data, knots_u, [0.33, 0.77])
+
+    assert res.shape == (data.shape[0] + 3, data.shape[1] + 2)
+    assert np.abs(grid(res) - ref).max() < 1e-9
+
+
+def test_insert_knot_matches_refine():
+    data = random_surface(np.random.default_rng(1))
+    pw = data.homogeneous
+
+    one, k1 = nurbs_refine.insert_knot(pw, data.knots_u, 3, 0.41, times=2)
+    two, k2 = nurbs_refine.refine_knots(pw, data.knots_u, 3, [0.41, 0.41])
+
+    assert np.allclose(one, two, rtol=0.0, atol=1e-12)
+    assert np.allclose(k1, k2, rtol=0.0, atol=0.0)
+
+
+def test_refine_over_the_degree_fails():
+    data = random_surface(np.random.default_rng(2))
+
+    with pytest.raises(ValueError):
+        nurbs_refine.refine_surface(data, [0.5] * 4)